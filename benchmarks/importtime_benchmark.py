@@ -0,0 +1,125 @@
+########
+# Copyright (c) 2017 GigaSpaces Technologies Ltd. All rights reserved
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#        http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+#    * WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#    * See the License for the specific language governing permissions and
+#    * limitations under the License.
+
+"""
+Cold-start guard of the plugin: the time a fresh interpreter takes to
+import iworkflow_plugin.service, on top of the dependencies every operation
+needs anyway, must stay within IWORKFLOW_IMPORT_BUDGET_MS.
+
+Imports are timed with `python -X importtime` where available (3.7+),
+otherwise with the wall clock around the import. Run as a script to print
+the slowest imports.
+"""
+
+import json
+import os
+import re
+import subprocess
+import sys
+
+MODULE = "iworkflow_plugin.service"
+# imported by every operation whatever the plugin does
+BASELINE_MODULES = ("requests", "cloudify.decorators", "cloudify.exceptions")
+# only loaded by the operations that use them
+LAZY_MODULES = ("cloudify.utils",
+                "multiprocessing.pool",
+                "iworkflow_sdk.bulk",
+                "iworkflow_sdk.sync",
+                "iworkflow_sdk.sync_coalescer",
+                "iworkflow_sdk.topology")
+
+BUDGET_MS = float(os.environ.get("IWORKFLOW_IMPORT_BUDGET_MS", 40))
+RUNS = 7
+
+IMPORTTIME_LINE = re.compile(
+    r"^import time:\s+(\d+) \|\s+(\d+) \|(\s*)(\S+)$")
+
+
+def _run(code, *options):
+    return subprocess.check_output(
+        [sys.executable] + list(options) + ["-c", code],
+        stderr=subprocess.STDOUT,
+        cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+def import_times(modules):
+    """
+    Imports modules in a fresh interpreter.
+
+    :return: list of (module, self ms, cumulative ms) of every top-level
+             import when -X importtime is available, otherwise a single
+             entry with the wall-clock time of importing all of them
+    """
+    imports = "; ".join("import {0}".format(module) for module in modules)
+    if sys.version_info >= (3, 7):
+        output = _run(imports, "-X", "importtime").decode("utf-8")
+        times = []
+        for line in output.splitlines():
+            match = IMPORTTIME_LINE.match(line)
+            if match:
+                times.append((match.group(4),
+                              int(match.group(1)) / 1000.0,
+                              int(match.group(2)) / 1000.0,
+                              len(match.group(3))))
+        return [(name, self_ms, cumulative_ms)
+                for name, self_ms, cumulative_ms, depth in times
+                if depth == 1]
+
+    output = _run("import time; started_at = time.time(); {0}; "
+                  "print((time.time() - started_at) * 1000)".format(imports))
+    return [(",".join(modules),
+             None,
+             float(output.decode("utf-8").splitlines()[-1]))]
+
+
+def cold_start_ms(modules):
+    """
+    Median, over RUNS fresh interpreters, of the time to import modules.
+    """
+    totals = sorted(sum(cumulative_ms
+                        for _, _, cumulative_ms in import_times(modules))
+                    for _ in range(RUNS))
+    return totals[len(totals) // 2]
+
+
+def test_lazy_modules_not_loaded():
+    loaded = json.loads(_run(
+        "import json, sys; import {0}; print(json.dumps("
+        "[name for name in {1!r} if name in sys.modules]))".format(
+            MODULE, LAZY_MODULES)).decode("utf-8").splitlines()[-1])
+    assert loaded == [], "{0} loaded by the import of {1}".format(
+        ", ".join(loaded), MODULE)
+
+
+def test_cold_start_budget():
+    baseline = cold_start_ms(BASELINE_MODULES)
+    plugin = cold_start_ms(BASELINE_MODULES + (MODULE,))
+    overhead = plugin - baseline
+    assert overhead <= BUDGET_MS, \
+        "Importing {0} costs {1:.1f}ms on top of its dependencies, " \
+        "over the budget of {2:.1f}ms".format(MODULE, overhead, BUDGET_MS)
+
+
+def main():
+    if sys.version_info < (3, 7):
+        print("-X importtime needs Python 3.7+, total only")
+    times = import_times(BASELINE_MODULES + (MODULE,))
+    for name, self_ms, cumulative_ms in sorted(times,
+                                               key=lambda item: -item[2]):
+        print("{0:>10.1f} ms  {1}".format(cumulative_ms, name))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,59 @@
+########
+# Copyright (c) 2017 GigaSpaces Technologies Ltd. All rights reserved
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#        http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+#    * WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#    * See the License for the specific language governing permissions and
+#    * limitations under the License.
+
+import json
+
+from requests import Response
+
+from iworkflow_sdk.iworkflow import IWorkflowService
+
+conn_params = {
+    "ip": "1.2.3.4",
+    "port": 443,
+    "user": "user1",
+    "password": "pass1",
+    "use_ssl": True
+}
+
+
+def _response(body):
+    resp = Response()
+    resp.status_code = 404
+    resp._content = body
+    return resp
+
+
+def test_get_url(benchmark):
+    service = IWorkflowService("tenant1", "service1", conn_params)
+    benchmark(service._get_url)
+
+
+def test_create_url(benchmark):
+    service = IWorkflowService("tenant1", "service1", conn_params)
+    benchmark(service._create_url)
+
+
+def test_retrive_error_message(benchmark):
+    resp = _response(json.dumps({
+        "code": 404,
+        "message": "Object not found - service1",
+        "errorStack": ["stack frame {0}".format(idx) for idx in range(50)]
+    }).encode("utf-8"))
+    benchmark(IWorkflowService._retrive_error_message, resp, "message")
+
+
+def test_retrive_error_message_no_json(benchmark):
+    resp = _response(b"<html><body>Service Unavailable</body></html>")
+    benchmark(IWorkflowService._retrive_error_message, resp, "message")
@@ -0,0 +1,47 @@
+########
+# Copyright (c) 2017 GigaSpaces Technologies Ltd. All rights reserved
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#        http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+#    * WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#    * See the License for the specific language governing permissions and
+#    * limitations under the License.
+
+import logging
+
+from iworkflow_plugin import CfyLogHandler
+
+
+class _Context(object):
+
+    def __init__(self):
+        self.logger = logging.getLogger("iworkflow.benchmark.ctx")
+        self.logger.addHandler(logging.NullHandler())
+        self.logger.propagate = False
+        self.logger.setLevel(logging.INFO)
+
+
+def test_emit(benchmark):
+    handler = CfyLogHandler(_Context())
+    record = logging.LogRecord("iworkflow.sdk", logging.INFO, __file__, 1,
+                               "Poll service started", None, None)
+    try:
+        benchmark(handler.emit, record)
+    finally:
+        handler.close()
+
+
+def test_emit_filtered(benchmark):
+    handler = CfyLogHandler(_Context())
+    record = logging.LogRecord("iworkflow.sdk", logging.DEBUG, __file__, 1,
+                               "Payload = %s", ("{}",), None)
+    try:
+        benchmark(handler.emit, record)
+    finally:
+        handler.close()
@@ -0,0 +1,53 @@
+########
+# Copyright (c) 2017 GigaSpaces Technologies Ltd. All rights reserved
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#        http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+#    * WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#    * See the License for the specific language governing permissions and
+#    * limitations under the License.
+
+from iworkflow_sdk import payload
+
+SMALL_ROWS = 10
+LARGE_ROWS = 20000
+
+
+def _tables(rows):
+    return [{
+        "name": "pool__Members",
+        "columns": ["IPAddress", "State"],
+        "rows": [["10.0.{0}.{1}".format(idx // 256, idx % 256), "enabled"]
+                 for idx in range(rows)]
+    }]
+
+
+def _create_payload(tables):
+    return payload.create_payload("tenant1",
+                                  "service1",
+                                  "template1",
+                                  [{"name": "pool__addr",
+                                    "value": "10.0.0.1"}],
+                                  tables,
+                                  [],
+                                  "https",
+                                  "localhost",
+                                  443)
+
+
+def test_create_payload_small(benchmark):
+    benchmark(_create_payload, _tables(SMALL_ROWS))
+
+
+def test_create_payload_large(benchmark):
+    benchmark(_create_payload, _tables(LARGE_ROWS))
+
+
+def test_serialize_payload_large(benchmark):
+    benchmark(payload.serialize_payload, _create_payload(_tables(LARGE_ROWS)))
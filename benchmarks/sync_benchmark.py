@@ -0,0 +1,38 @@
+########
+# Copyright (c) 2017 GigaSpaces Technologies Ltd. All rights reserved
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#        http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+#    * WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#    * See the License for the specific language governing permissions and
+#    * limitations under the License.
+
+from iworkflow_sdk import sync
+
+STATUS_JSON = {
+    "kind": "tm:cm:sync-status:sync-statusstats",
+    "selfLink": "https://localhost/mgmt/tm/cm/sync-status",
+    "entries": {
+        "https://localhost/mgmt/tm/cm/sync-status/0": {
+            "nestedStats": {
+                "entries": {
+                    "color": {"description": "green"},
+                    "mode": {"description": "high-availability"},
+                    "status": {"description": "In Sync"},
+                    "summary": {"description": "All devices in the device "
+                                               "group are in sync"}
+                }
+            }
+        }
+    }
+}
+
+
+def test_parse_sync_status(benchmark):
+    benchmark(sync.SyncStatus.parse, STATUS_JSON)
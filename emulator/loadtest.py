@@ -0,0 +1,224 @@
+########
+# Copyright (c) 2017 GigaSpaces Technologies Ltd. All rights reserved
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#        http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+#    * WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#    * See the License for the specific language governing permissions and
+#    * limitations under the License.
+
+"""
+Load-test driver running create -> poll -> sync -> delete cycles through the
+SDK, against the emulator or real appliances, and reporting the throughput
+and the p50/p99 latency of each phase.
+
+    python -m emulator.loadtest --emulate --certfile cert.pem \\
+        --keyfile key.pem --services 500 --concurrency 50
+"""
+
+import argparse
+import json
+import math
+import time
+from collections import namedtuple
+from multiprocessing.pool import ThreadPool
+
+from iworkflow_sdk import sync
+from iworkflow_sdk.backoff import BackoffPolicy
+from iworkflow_sdk.exceptions import IWorkflowNotFoundException
+from iworkflow_sdk.iworkflow import IWorkflowService
+
+from . import server
+
+PHASES = ("create", "poll", "sync", "delete", "cycle")
+
+CycleResult = namedtuple("CycleResult", ["durations", "error"])
+
+
+class LoadTest(object):
+    """
+    Runs `services` cycles, at most `concurrency` at a time.
+    """
+
+    def __init__(self,
+                 connection_params,
+                 bigip_ip,
+                 tenant_name="loadtest",
+                 template_name="f5.http",
+                 sync_group=server.DEFAULT_SYNC_GROUP,
+                 bigip_user="admin",
+                 bigip_password="admin",
+                 poll_policy=None,
+                 sync_retry=1):
+        self.connection_params = connection_params
+        self.bigip_ip = bigip_ip
+        self.tenant_name = tenant_name
+        self.template_name = template_name
+        self.sync_group = sync_group
+        self.bigip_user = bigip_user
+        self.bigip_password = bigip_password
+        self.poll_policy = poll_policy or BackoffPolicy(initial_interval=0.1,
+                                                        max_interval=2,
+                                                        timeout=300)
+        self.sync_retry = sync_retry
+
+    def run(self, services, concurrency):
+        """
+        :return: report dict, see report()
+        """
+        pool = ThreadPool(concurrency)
+        started_at = time.time()
+        try:
+            results = pool.map(self.cycle,
+                               ["loadtest-{0}".format(idx)
+                                for idx in range(services)])
+        finally:
+            pool.close()
+            pool.join()
+        return report(results, time.time() - started_at)
+
+    def cycle(self, service_name):
+        durations = {}
+        started_at = time.time()
+        try:
+            service = IWorkflowService(self.tenant_name,
+                                       service_name,
+                                       self.connection_params)
+
+            phase_started_at = time.time()
+            service.create_service(self.template_name, [], [], [],
+                                   "localhost")
+            durations["create"] = time.time() - phase_started_at
+
+            phase_started_at = time.time()
+            self._poll(service)
+            durations["poll"] = time.time() - phase_started_at
+
+            phase_started_at = time.time()
+            sync.do_sync(self.bigip_ip, self.sync_group, self.bigip_user,
+                         self.bigip_password, self.sync_retry)
+            durations["sync"] = time.time() - phase_started_at
+
+            phase_started_at = time.time()
+            service.delete_service()
+            durations["delete"] = time.time() - phase_started_at
+        except Exception as e:
+            return CycleResult(durations, str(e) or type(e).__name__)
+
+        durations["cycle"] = time.time() - started_at
+        return CycleResult(durations, None)
+
+    def _poll(self, service):
+        started_at = time.time()
+        attempt = 0
+        while True:
+            try:
+                service.poll_service()
+                return
+            except IWorkflowNotFoundException:
+                if self.poll_policy.expired(started_at):
+                    raise
+            time.sleep(min(self.poll_policy.interval(attempt),
+                           self.poll_policy.remaining(started_at)))
+            attempt += 1
+
+
+def report(results, elapsed):
+    """
+    :return: dict with the number of cycles, the failed ones with their
+             most frequent errors, the throughput in cycles per second
+             and the p50/p99 seconds of each phase
+    """
+    errors = {}
+    for result in results:
+        if result.error:
+            errors[result.error] = errors.get(result.error, 0) + 1
+
+    succeeded = len(results) - sum(errors.values())
+    phases = {}
+    for phase in PHASES:
+        durations = sorted(result.durations[phase] for result in results
+                           if phase in result.durations)
+        if durations:
+            phases[phase] = {"p50": round(percentile(durations, 50), 4),
+                             "p99": round(percentile(durations, 99), 4)}
+
+    return {
+        "cycles": len(results),
+        "failed": len(results) - succeeded,
+        "errors": dict(sorted(errors.items(),
+                              key=lambda item: -item[1])[:10]),
+        "elapsed": round(elapsed, 3),
+        "throughput": round(succeeded / elapsed, 3) if elapsed else 0,
+        "phases": phases
+    }
+
+
+def percentile(sorted_values, percent):
+    """
+    Nearest-rank percentile of an already sorted, non-empty list.
+    """
+    rank = int(math.ceil(percent / 100.0 * len(sorted_values)))
+    return sorted_values[max(rank, 1) - 1]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--services", type=int, default=100,
+                        help="number of cycles to run")
+    parser.add_argument("--concurrency", type=int, default=10,
+                        help="cycles running at the same time")
+    parser.add_argument("--pool-size", type=int, default=None,
+                        help="connections kept alive per appliance")
+    parser.add_argument("--auth-mode", default=None)
+    parser.add_argument("--emulate", action="store_true",
+                        help="run the emulator in-process")
+    parser.add_argument("--iworkflow", default="127.0.0.1:8080",
+                        help="host:port of iWorkflow (plain http) "
+                             "when not emulated")
+    parser.add_argument("--bigip", default="127.0.0.1:8443",
+                        help="host:port of a BIG-IP device "
+                             "when not emulated")
+    server.add_config_arguments(parser)
+    args = parser.parse_args()
+    if args.emulate and not (args.certfile and args.keyfile):
+        parser.error("--certfile and --keyfile are required to emulate")
+
+    emulator = None
+    if args.emulate:
+        emulator = server.Emulator(server.config_from_arguments(args),
+                                   args.certfile,
+                                   args.keyfile)
+        emulator.start()
+        iworkflow_host, iworkflow_port = emulator.iworkflow_address
+        bigip_ip = emulator.bigip_address
+    else:
+        iworkflow_host, _, iworkflow_port = args.iworkflow.partition(":")
+        bigip_ip = args.bigip
+
+    connection_params = {
+        "ip": iworkflow_host,
+        "port": iworkflow_port,
+        "user": "admin",
+        "password": "admin",
+        "use_ssl": False,
+        "pool_size": args.pool_size or args.concurrency,
+        "auth_mode": args.auth_mode
+    }
+    try:
+        result = LoadTest(connection_params, bigip_ip).run(args.services,
+                                                           args.concurrency)
+    finally:
+        if emulator:
+            emulator.stop()
+    print(json.dumps(result, indent=2, sort_keys=True))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,506 @@
+########
+# Copyright (c) 2017 GigaSpaces Technologies Ltd. All rights reserved
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#        http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+#    * WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#    * See the License for the specific language governing permissions and
+#    * limitations under the License.
+
+"""
+Emulator of the iWorkflow and BIG-IP REST endpoints used by the plugin.
+
+One plain HTTP listener serves iWorkflow: the tenant services collection and
+items, and the login endpoint. Each device of an emulated BIG-IP cluster gets
+its own HTTPS listener serving the device list, save, config-sync and
+sync-status endpoints. The management address of a device is its
+"host:port", which the SDK accepts as a BIG-IP ip.
+
+Services only show up once their provisioning delay has passed, every
+request can be delayed, failed with a 500 or throttled with a 429, and the
+active unit of the cluster can fail over periodically.
+
+    python -m emulator.server --certfile cert.pem --keyfile key.pem
+"""
+
+import argparse
+import itertools
+import json
+import logging
+import random
+import re
+import ssl
+import threading
+import time
+
+try:
+    from BaseHTTPServer import BaseHTTPRequestHandler, HTTPServer
+    from SocketServer import ThreadingMixIn
+    from urlparse import parse_qs
+except ImportError:
+    from http.server import BaseHTTPRequestHandler, HTTPServer
+    from socketserver import ThreadingMixIn
+    from urllib.parse import parse_qs
+
+from iworkflow_sdk import sync
+from iworkflow_sdk.auth import LOGIN_ENDPOINT
+from iworkflow_sdk.iworkflow import SERVICE_ENDPOINT
+
+SERVICES_PATH = re.compile(
+    "^" + SERVICE_ENDPOINT.format("(?P<tenant>[^/]+)") + "(?P<name>[^/]*)$")
+SELF_LINK = "https://localhost" + SERVICE_ENDPOINT + "{1}"
+
+STATE_ACTIVE = "active"
+STATE_STANDBY = "standby"
+SYNC_IN_SYNC = sync.BIGIP_IN_SYNC
+SYNC_SYNCING = "Syncing"
+
+DEFAULT_SYNC_GROUP = "sync-failover-group"
+
+log = logging.getLogger("iworkflow.emulator")
+
+
+def parse_distribution(spec):
+    """
+    Returns a callable sampling the distribution described by spec:
+    'const:S', 'uniform:MIN:MAX', 'exp:MEAN' or 'lognormal:MU:SIGMA',
+    in seconds.
+    """
+    kind, _, args = spec.partition(":")
+    values = [float(value) for value in args.split(":") if value]
+    samplers = {
+        "const": lambda: values[0],
+        "uniform": lambda: random.uniform(values[0], values[1]),
+        "exp": lambda: random.expovariate(1.0 / values[0]),
+        "lognormal": lambda: random.lognormvariate(values[0], values[1])
+    }
+    arity = {"const": 1, "uniform": 2, "exp": 1, "lognormal": 2}
+    if kind not in samplers or len(values) != arity[kind]:
+        raise ValueError("Invalid distribution: {0}".format(spec))
+    return samplers[kind]
+
+
+class EmulatorConfig(object):
+    """
+    Behavior of the emulator. Delays are distributions as accepted
+    by parse_distribution, rates are probabilities per request.
+    """
+
+    def __init__(self,
+                 provision_delay="const:0",
+                 sync_delay="const:0",
+                 latency="const:0",
+                 error_rate=0,
+                 throttle_rate=0,
+                 retry_after=1,
+                 failover_interval=0,
+                 devices=2):
+        self.provision_delay = parse_distribution(provision_delay)
+        self.sync_delay = parse_distribution(sync_delay)
+        self.latency = parse_distribution(latency)
+        self.error_rate = error_rate
+        self.throttle_rate = throttle_rate
+        self.retry_after = retry_after
+        self.failover_interval = failover_interval
+        self.devices = devices
+
+
+class EmulatorState(object):
+    """
+    Services of the iWorkflow and state of the BIG-IP cluster,
+    shared by all listeners.
+    """
+
+    def __init__(self, config):
+        self.config = config
+        self.lock = threading.Lock()
+        self.services = {}
+        self.device_addresses = []
+        self.active = 0
+        self.sync_status = SYNC_IN_SYNC
+        self.synced_at = 0
+        self.last_failover = time.time()
+        self._tokens = itertools.count(1)
+
+    def new_token(self):
+        return "emulated-token-{0}".format(next(self._tokens))
+
+    # iWorkflow
+
+    def create_service(self, tenant, doc):
+        name = doc.get("name")
+        with self.lock:
+            if (tenant, name) in self.services:
+                return False
+            self.services[(tenant, name)] = {
+                "doc": dict(doc,
+                            generation=1,
+                            selfLink=SELF_LINK.format(tenant, name)),
+                "ready_at": time.time() + self.config.provision_delay()
+            }
+            return True
+
+    def update_service(self, tenant, name, doc):
+        """
+        :return: the new version of the service, None if it does not exist
+        """
+        with self.lock:
+            service = self.services.get((tenant, name))
+            if service is None:
+                return None
+            service["doc"] = dict(
+                doc,
+                name=name,
+                generation=service["doc"]["generation"] + 1,
+                selfLink=service["doc"]["selfLink"])
+            return service["doc"]
+
+    def get_service(self, tenant, name):
+        with self.lock:
+            service = self.services.get((tenant, name))
+        if service and service["ready_at"] <= time.time():
+            return service["doc"]
+        return None
+
+    def list_services(self, tenant, top=None, skip=0, select=None):
+        """
+        Ready services of the tenant ordered by name,
+        paged and projected like the $top, $skip and $select options.
+        """
+        now = time.time()
+        with self.lock:
+            docs = sorted((service["doc"]
+                           for (service_tenant, _), service
+                           in self.services.items()
+                           if service_tenant == tenant and
+                           service["ready_at"] <= now),
+                          key=lambda doc: doc.get("name"))
+        docs = docs[skip:skip + top if top is not None else None]
+        if select:
+            docs = [dict((key, doc.get(key)) for key in select)
+                    for doc in docs]
+        return docs
+
+    def delete_service(self, tenant, name):
+        with self.lock:
+            return self.services.pop((tenant, name), None) is not None
+
+    # BIG-IP
+
+    def active_device(self):
+        with self.lock:
+            interval = self.config.failover_interval
+            if interval and time.time() - self.last_failover >= interval:
+                self.active = (self.active + 1) % len(self.device_addresses)
+                self.last_failover = time.time()
+                log.info("Failed over to {0}".format(
+                    self.device_addresses[self.active]))
+            return self.active
+
+    def request_sync(self):
+        with self.lock:
+            self.sync_status = SYNC_SYNCING
+            self.synced_at = time.time() + self.config.sync_delay()
+
+    def get_sync_status(self):
+        with self.lock:
+            if self.sync_status == SYNC_SYNCING and \
+                    self.synced_at <= time.time():
+                self.sync_status = SYNC_IN_SYNC
+            return self.sync_status
+
+
+class EmulatorHandler(BaseHTTPRequestHandler):
+    """
+    Serves the requests of one listener. `device` is the index
+    of the BIG-IP device the listener stands for, None for iWorkflow.
+    """
+
+    protocol_version = "HTTP/1.1"
+
+    def do_GET(self):
+        self._handle("GET")
+
+    def do_POST(self):
+        self._handle("POST")
+
+    def do_PUT(self):
+        self._handle("PUT")
+
+    def do_DELETE(self):
+        self._handle("DELETE")
+
+    def log_message(self, format, *args):
+        log.debug(format % args)
+
+    @property
+    def state(self):
+        return self.server.state
+
+    def _handle(self, method):
+        path, _, query = self.path.partition("?")
+        self.query = parse_qs(query)
+        body = self._read_body()
+        config = self.state.config
+
+        time.sleep(config.latency())
+        if random.random() < config.throttle_rate:
+            return self._send(429, {"message": "Too many requests"},
+                              {"Retry-After": str(config.retry_after)})
+        if random.random() < config.error_rate:
+            return self._send(500, {"message": "Injected error"})
+
+        if self.server.device is None:
+            self._handle_iworkflow(method, path, body)
+        else:
+            self._handle_bigip(method, path)
+
+    def _handle_iworkflow(self, method, path, body):
+        if method == "POST" and path == LOGIN_ENDPOINT:
+            return self._send(200, {"token": {
+                "token": self.state.new_token(),
+                "timeout": 1200
+            }})
+
+        match = SERVICES_PATH.match(path)
+        if not match:
+            return self._send(404, {"message": "Unknown path"})
+        tenant, name = match.group("tenant"), match.group("name")
+
+        if method == "POST" and not name:
+            if not self.state.create_service(tenant, body or {}):
+                return self._send(409, {"message": "Service exists"})
+            return self._send(200, body)
+        if method == "GET" and not name:
+            return self._send(200, {"items": self.state.list_services(
+                tenant,
+                top=self._query_int("$top"),
+                skip=self._query_int("$skip") or 0,
+                select=self._query_list("$select"))})
+        if method == "GET":
+            doc = self.state.get_service(tenant, name)
+            if doc is None:
+                return self._send(404, {"message": "Object not found - {0}"
+                                        .format(name)})
+            etag = '"{0}"'.format(doc["generation"])
+            if self.headers.get("If-None-Match") == etag:
+                return self._send(304, None, {"ETag": etag})
+            return self._send(200, doc, {"ETag": etag})
+        if method == "PUT" and name:
+            doc = self.state.update_service(tenant, name, body or {})
+            if doc is None:
+                return self._send(404, {"message": "Object not found - {0}"
+                                        .format(name)})
+            return self._send(200, doc)
+        if method == "DELETE":
+            if not self.state.delete_service(tenant, name):
+                return self._send(404, {"message": "Object not found - {0}"
+                                        .format(name)})
+            return self._send(200, {})
+        return self._send(405, {"message": "Method not allowed"})
+
+    def _handle_bigip(self, method, path):
+        active = self.state.active_device()
+        is_active = self.server.device == active
+
+        if method == "GET" and path == sync.BIGIP_DEVICE_ENDPOINT:
+            return self._send(200, {"items": [
+                {"name": "bigip{0}".format(idx),
+                 "managementIp": address,
+                 "failoverState": STATE_ACTIVE if idx == active
+                 else STATE_STANDBY,
+                 "selfDevice": str(idx == self.server.device).lower()}
+                for idx, address in enumerate(self.state.device_addresses)]})
+        if method == "POST" and path == sync.BIGIP_SAVE_ENDPOINT:
+            if not is_active:
+                return self._send(400, {"message": "Device is standby"})
+            return self._send(200, {"command": "save"})
+        if method == "POST" and path == sync.BIGIP_SYNC_ENDPOINT:
+            self.state.request_sync()
+            return self._send(200, {"command": "run"})
+        if method == "GET" and path == sync.BIGIP_STATUS_ENDPOINT:
+            status = self.state.get_sync_status()
+            link = "https://localhost/mgmt/tm/cm/sync-status/0"
+            return self._send(200, {"entries": {link: {"nestedStats": {
+                "entries": {
+                    "status": {"description": status},
+                    "summary": {"description": status},
+                    "color": {"description": "green"
+                              if status == SYNC_IN_SYNC else "blue"}
+                }}}}})
+        return self._send(404, {"message": "Unknown path"})
+
+    def _query_int(self, name):
+        try:
+            return int(self.query[name][0])
+        except (KeyError, ValueError):
+            return None
+
+    def _query_list(self, name):
+        values = self.query.get(name)
+        return values[0].split(",") if values else None
+
+    def _read_body(self):
+        length = int(self.headers.get("Content-Length") or 0)
+        if not length:
+            return None
+        try:
+            return json.loads(self.rfile.read(length).decode("utf-8"))
+        except ValueError:
+            return None
+
+    def _send(self, code, body, headers=None):
+        content = b"" if body is None else json.dumps(body).encode("utf-8")
+        self.send_response(code)
+        for key, value in (headers or {}).items():
+            self.send_header(key, value)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(content)))
+        self.end_headers()
+        self.wfile.write(content)
+
+
+class EmulatorServer(ThreadingMixIn, HTTPServer):
+
+    daemon_threads = True
+
+    def __init__(self, address, state, device=None, ssl_context=None):
+        HTTPServer.__init__(self, address, EmulatorHandler)
+        self.state = state
+        self.device = device
+        if ssl_context:
+            self.socket = ssl_context.wrap_socket(self.socket,
+                                                  server_side=True)
+
+    @property
+    def address(self):
+        return "{0}:{1}".format(*self.server_address[:2])
+
+
+class Emulator(object):
+    """
+    An iWorkflow listener plus one HTTPS listener per BIG-IP device,
+    each served by a background thread.
+    """
+
+    def __init__(self, config, certfile, keyfile,
+                 host="127.0.0.1", iworkflow_port=0, bigip_port=0):
+        """
+        :param certfile: certificate of the BIG-IP listeners
+        :param keyfile: private key of the BIG-IP listeners
+        :param bigip_port: port of the first device, the others
+                           use the following ones; 0 for any free port
+        """
+        self.state = EmulatorState(config)
+        context = ssl.SSLContext(ssl.PROTOCOL_SSLv23)
+        context.load_cert_chain(certfile, keyfile)
+
+        self.iworkflow = EmulatorServer((host, iworkflow_port), self.state)
+        self.bigips = [
+            EmulatorServer((host, bigip_port + idx if bigip_port else 0),
+                           self.state,
+                           device=idx,
+                           ssl_context=context)
+            for idx in range(config.devices)]
+        self.state.device_addresses = [bigip.address
+                                       for bigip in self.bigips]
+        self._threads = []
+
+    @property
+    def iworkflow_address(self):
+        return self.iworkflow.server_address[:2]
+
+    @property
+    def bigip_address(self):
+        """
+        Address of the first device, as an ip accepted by the SDK.
+        """
+        return self.bigips[0].address
+
+    def start(self):
+        for server in [self.iworkflow] + self.bigips:
+            thread = threading.Thread(target=server.serve_forever,
+                                      name="emulator-{0}".format(
+                                          server.address))
+            thread.daemon = True
+            thread.start()
+            self._threads.append(thread)
+
+    def stop(self):
+        for server in [self.iworkflow] + self.bigips:
+            server.shutdown()
+            server.server_close()
+        for thread in self._threads:
+            thread.join()
+
+
+def add_config_arguments(parser):
+    parser.add_argument("--certfile",
+                        help="certificate of the BIG-IP listeners")
+    parser.add_argument("--keyfile",
+                        help="private key of the BIG-IP listeners")
+    parser.add_argument("--provision-delay", default="const:0",
+                        help="time until a created service exists")
+    parser.add_argument("--sync-delay", default="const:0",
+                        help="time until a requested sync is in sync")
+    parser.add_argument("--latency", default="const:0",
+                        help="time added to every request")
+    parser.add_argument("--error-rate", type=float, default=0,
+                        help="share of requests failed with a 500")
+    parser.add_argument("--throttle-rate", type=float, default=0,
+                        help="share of requests throttled with a 429")
+    parser.add_argument("--failover-interval", type=float, default=0,
+                        help="seconds between failovers, 0 for none")
+    parser.add_argument("--devices", type=int, default=2,
+                        help="number of devices of the BIG-IP cluster")
+
+
+def config_from_arguments(args):
+    return EmulatorConfig(provision_delay=args.provision_delay,
+                          sync_delay=args.sync_delay,
+                          latency=args.latency,
+                          error_rate=args.error_rate,
+                          throttle_rate=args.throttle_rate,
+                          failover_interval=args.failover_interval,
+                          devices=args.devices)
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Emulates iWorkflow and a BIG-IP cluster. Delays are "
+                    "given as const:S, uniform:MIN:MAX, exp:MEAN or "
+                    "lognormal:MU:SIGMA, in seconds.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--iworkflow-port", type=int, default=8080)
+    parser.add_argument("--bigip-port", type=int, default=8443)
+    add_config_arguments(parser)
+    args = parser.parse_args()
+    if not (args.certfile and args.keyfile):
+        parser.error("--certfile and --keyfile are required")
+
+    logging.basicConfig(level=logging.INFO)
+    emulator = Emulator(config_from_arguments(args),
+                        args.certfile,
+                        args.keyfile,
+                        host=args.host,
+                        iworkflow_port=args.iworkflow_port,
+                        bigip_port=args.bigip_port)
+    emulator.start()
+    log.info("iWorkflow on http://{0}:{1}, BIG-IP devices on {2}".format(
+        args.host, args.iworkflow_port,
+        ", ".join(emulator.state.device_addresses)))
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        emulator.stop()
+
+
+if __name__ == "__main__":
+    main()
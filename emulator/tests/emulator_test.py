@@ -0,0 +1,150 @@
+########
+# Copyright (c) 2017 GigaSpaces Technologies Ltd. All rights reserved
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#        http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+#    * WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#    * See the License for the specific language governing permissions and
+#    * limitations under the License.
+
+
+import os
+import shutil
+import subprocess
+import tempfile
+import unittest
+
+from emulator import loadtest, server
+from iworkflow_sdk import listing, sessions, sync
+from iworkflow_sdk.exceptions import IWorkflowNotFoundException
+from iworkflow_sdk.iworkflow import IWorkflowService
+
+
+class EmulatorTest(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.cert_dir = tempfile.mkdtemp()
+        cls.certfile = os.path.join(cls.cert_dir, "cert.pem")
+        cls.keyfile = os.path.join(cls.cert_dir, "key.pem")
+        try:
+            subprocess.check_call(
+                ["openssl", "req", "-x509", "-newkey", "rsa:2048", "-nodes",
+                 "-subj", "/CN=localhost", "-days", "1",
+                 "-keyout", cls.keyfile, "-out", cls.certfile],
+                stdout=open(os.devnull, "w"),
+                stderr=subprocess.STDOUT)
+        except OSError:
+            shutil.rmtree(cls.cert_dir)
+            raise unittest.SkipTest("openssl is needed for the certificate")
+
+    @classmethod
+    def tearDownClass(cls):
+        shutil.rmtree(cls.cert_dir)
+
+    def start(self, **config):
+        emulator = server.Emulator(server.EmulatorConfig(**config),
+                                   self.certfile,
+                                   self.keyfile)
+        emulator.start()
+        self.addCleanup(emulator.stop)
+        self.addCleanup(sessions.close_sessions)
+        sync.topology_cache.invalidate(emulator.bigip_address)
+        host, port = emulator.iworkflow_address
+        return emulator, {"ip": host,
+                          "port": port,
+                          "user": "admin",
+                          "password": "admin",
+                          "use_ssl": False}
+
+    def test_provisioning_delay(self):
+        # given
+        _, conn_params = self.start(provision_delay="const:60")
+        service = IWorkflowService("tenant1", "service1", conn_params)
+
+        # when
+        service.create_service("f5.http", [], [], [], "localhost")
+
+        # then
+        self.assertRaises(IWorkflowNotFoundException, service.poll_service)
+
+    def test_update_service(self):
+        # given
+        _, conn_params = self.start()
+        service = IWorkflowService("tenant1", "service1", conn_params)
+        service.create_service("f5.http", [], [], [], "localhost")
+
+        # when
+        service.update_service("f5.http",
+                               [{"name": "var1", "value": "a"}],
+                               [], [], "localhost")
+        service.poll_service()
+
+        # then
+        self.assertEqual(2, service.generation)
+        self.assertRaises(IWorkflowNotFoundException,
+                          IWorkflowService("tenant1", "service2",
+                                           conn_params).update_service,
+                          "f5.http", [], [], [], "localhost")
+
+    def test_iter_services(self):
+        # given
+        _, conn_params = self.start()
+        names = sorted("service{0}".format(idx) for idx in range(5))
+        for name in names:
+            IWorkflowService("tenant1", name, conn_params).create_service(
+                "f5.http", [], [], [], "localhost")
+
+        # when
+        services = list(listing.iter_services("tenant1", conn_params,
+                                              fields=("name",),
+                                              page_size=2))
+
+        # then
+        self.assertEqual([{"name": name} for name in names], services)
+
+    def test_load(self):
+        # given
+        emulator, conn_params = self.start(provision_delay="uniform:0:0.2",
+                                           latency="exp:0.005")
+        load_test = loadtest.LoadTest(conn_params, emulator.bigip_address,
+                                      sync_retry=0.1)
+
+        # when
+        result = load_test.run(services=6, concurrency=3)
+
+        # then
+        self.assertEqual(6, result["cycles"])
+        self.assertEqual(0, result["failed"], result["errors"])
+        self.assertEqual(set(loadtest.PHASES), set(result["phases"]))
+        self.assertEqual({}, emulator.state.services)
+
+    def test_failover(self):
+        # given
+        emulator, _ = self.start(devices=2)
+        http_session = sync.HttpSession("admin", "admin")
+        self.assertEqual(emulator.bigip_address,
+                         sync.start_sync(http_session,
+                                         emulator.bigip_address,
+                                         "group1"))
+
+        # when
+        emulator.state.active = 1
+
+        # then
+        self.assertEqual(emulator.state.device_addresses[1],
+                         sync.start_sync(http_session,
+                                         emulator.bigip_address,
+                                         "group1"))
+
+    def test_percentile(self):
+        values = list(range(1, 101))
+        self.assertEqual(50, loadtest.percentile(values, 50))
+        self.assertEqual(99, loadtest.percentile(values, 99))
+        self.assertEqual(1, loadtest.percentile([1], 99))
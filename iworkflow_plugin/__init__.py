@@ -14,44 +14,201 @@
 #    * limitations under the License.
 
 import logging
+import threading
 from functools import wraps
 
+try:
+    import queue
+except ImportError:
+    import Queue as queue
+
 from cloudify import ctx as cfy_ctx
 from cloudify.exceptions import NonRecoverableError
+from cloudify.state import current_ctx, current_workflow_ctx, NotInContext
 
 from iworkflow_sdk import LOGGER_NAME as SDK_LOGGER_NAME
+from iworkflow_sdk import metrics
 
 CONNECTION_PARAMS = 'connection_params'
+METRICS_TEXTFILE = 'metrics_textfile'
+RUNTIME_METRICS = 'metrics'
 IWORKFLOW_NODE_TYPE = 'cloudify.iworkflow.iWorkflow'
 
+DEFAULT_MAX_BATCH_RECORDS = 100
+DEFAULT_MAX_BATCH_BYTES = 64 * 1024
+
 
 class CfyLogHandler(logging.Handler):
     """
     A logging handler for Cloudify.
     A logger attached to this handler will result in logging being passed
     through to the Cloudify logger.
+    Records are queued by emit and shipped by the log shipper thread,
+    consecutive records of the same level in a single call, so the
+    operation does not wait for the Cloudify logging backend.
     """
-    def __init__(self, ctx):
+    def __init__(self,
+                 ctx,
+                 max_batch_records=DEFAULT_MAX_BATCH_RECORDS,
+                 max_batch_bytes=DEFAULT_MAX_BATCH_BYTES,
+                 shipper=None):
         """
         Constructor.
         :param ctx: current Cloudify context, may be any type of context
-                    (operation, workflow...)
+                    (operation, workflow...). It is used from the shipping
+                    thread, so it must not be the thread-local ctx proxy.
+        :param max_batch_records: most records shipped in a single call
+        :param max_batch_bytes: most bytes of unformatted messages shipped
+                                in a single call
+        :param shipper: LogShipper shipping the records,
+                        the one of the process by default
         """
         logging.Handler.__init__(self)
         self.ctx = ctx
+        self.max_batch_records = max_batch_records
+        self.max_batch_bytes = max_batch_bytes
+        self._shipper = shipper or get_log_shipper()
+        self._pending = 0
+        self._shipped = threading.Condition()
 
     def emit(self, record):
         """
-        Callback to emit a log record.
+        Callback to emit a log record. The record is only queued,
+        it is formatted by the shipping thread.
         :param record: log record to write
         :type record: logging.LogRecord
         """
-        message = self.format(record)
-        self.ctx.logger.log(record.levelno, message)
+        if not self.ctx.logger.isEnabledFor(record.levelno):
+            return
+        with self._shipped:
+            self._pending += 1
+        self._shipper.put(self, record)
+
+    def flush(self):
+        """
+        Waits until the queued records have been shipped.
+        """
+        with self._shipped:
+            while self._pending:
+                self._shipped.wait()
+
+    def close(self):
+        """
+        Ships the queued records.
+        """
+        self.flush()
+        logging.Handler.close(self)
+
+    def ship(self, records):
+        """
+        Formats and ships records, called by the shipping thread.
+        """
+        try:
+            group = []
+            for record in records:
+                message = self._format(record)
+                if message is None:
+                    continue
+                if group and group[0][0].levelno != record.levelno:
+                    self._log(group)
+                    group = []
+                group.append((record, message))
+            if group:
+                self._log(group)
+        finally:
+            with self._shipped:
+                self._pending -= len(records)
+                self._shipped.notify_all()
+
+    def _format(self, record):
+        try:
+            return self.format(record)
+        except Exception:
+            self.handleError(record)
+            return None
+
+    def _log(self, group):
+        record = group[0][0]
+        try:
+            self.ctx.logger.log(record.levelno,
+                                "\n".join(message for _, message in group))
+        except Exception:
+            self.handleError(record)
+
+
+class LogShipper(object):
+    """
+    Thread shipping the records of all CfyLogHandlers of the process.
+    A single thread is used because the Cloudify logger keeps a connection
+    to the logging backend per thread.
+    """
+
+    def __init__(self):
+        self._queue = queue.Queue()
+        self._thread = None
+        self._lock = threading.Lock()
+
+    def put(self, handler, record):
+        if self._thread is None:
+            self._start()
+        self._queue.put((handler, record))
+
+    def _start(self):
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run,
+                                                name="iworkflow-cfy-logs")
+                self._thread.daemon = True
+                self._thread.start()
+
+    def _run(self):
+        carried = None
+        while True:
+            handler, record = carried or self._queue.get()
+            carried = None
+            # take the records of the same handler queued meanwhile,
+            # up to its limits
+            records = [record]
+            size = len(record.msg) if _is_text(record.msg) else 0
+            while len(records) < handler.max_batch_records and \
+                    size < handler.max_batch_bytes:
+                try:
+                    item = self._queue.get_nowait()
+                except queue.Empty:
+                    break
+                if item[0] is not handler:
+                    carried = item
+                    break
+                records.append(item[1])
+                size += len(item[1].msg) if _is_text(item[1].msg) else 0
+            try:
+                handler.ship(records)
+            except Exception:
+                # errors are reported by the handler, the thread must
+                # keep shipping the records of the other handlers
+                pass
+
 
+_log_shipper = None
+_log_shipper_lock = threading.Lock()
 
-handler = CfyLogHandler(cfy_ctx)
-logging.getLogger(SDK_LOGGER_NAME).addHandler(handler)
+
+def get_log_shipper():
+    """
+    Returns the log shipper of the process, creating it if needed.
+    """
+    global _log_shipper
+    with _log_shipper_lock:
+        if _log_shipper is None:
+            _log_shipper = LogShipper()
+        return _log_shipper
+
+
+def _is_text(value):
+    try:
+        return isinstance(value, basestring)
+    except NameError:
+        return isinstance(value, str)
 
 
 def get_relationships_by_type(ctx, type_name):
@@ -82,3 +239,63 @@ def load_connection_params(func):
         kwargs[CONNECTION_PARAMS] = get_connected_node(cfy_ctx).properties
         return func(*args, **kwargs)
     return wrapper
+
+
+def sdk_logging(func):
+    """
+    Passes the logs of the SDK through to the Cloudify logger while the
+    operation runs. The handler is attached per operation rather than at
+    import, so importing the plugin has no side effects, and the logs it
+    has queued are all shipped before the operation returns.
+    """
+    @wraps(func)
+    def wrapper(*args, **kwargs):
+        logger = logging.getLogger(SDK_LOGGER_NAME)
+        handler = CfyLogHandler(_get_current_ctx())
+        logger.addHandler(handler)
+        try:
+            return func(*args, **kwargs)
+        finally:
+            logger.removeHandler(handler)
+            handler.close()
+    return wrapper
+
+
+def _get_current_ctx():
+    """
+    Returns the context of the operation or workflow running in this thread,
+    rather than the thread-local ctx proxy.
+    """
+    try:
+        return current_ctx.get_ctx()
+    except NotInContext:
+        return current_workflow_ctx.get_ctx()
+
+
+def record_metrics(func):
+    """
+    Stores a summary of the requests sent by the operation in the
+    'metrics' runtime property, and writes the metrics of the process
+    to the textfile set on the iWorkflow node, if any. Operations of the
+    iWorkflow node itself get no connection_params, and read it from the
+    properties of their node.
+    """
+    @wraps(func)
+    def wrapper(*args, **kwargs):
+        since = metrics.registry.snapshot()
+        try:
+            return func(*args, **kwargs)
+        finally:
+            cfy_ctx.instance.runtime_properties[RUNTIME_METRICS] = \
+                metrics.registry.summary(since)
+            connection_params = kwargs.get(CONNECTION_PARAMS) or \
+                cfy_ctx.node.properties
+            textfile = connection_params.get(METRICS_TEXTFILE)
+            if textfile:
+                try:
+                    metrics.registry.write_textfile(textfile)
+                except (IOError, OSError) as e:
+                    cfy_ctx.logger.warn(
+                        "Cannot write metrics to {0}: {1}".format(textfile,
+                                                                  e))
+    return wrapper
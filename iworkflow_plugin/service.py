@@ -14,25 +14,52 @@
 #    * limitations under the License.
 
 import sys
+import time
 
+import requests
 from cloudify.decorators import operation
 from cloudify.exceptions import NonRecoverableError
-from cloudify.utils import exception_to_error_cause
 
-from iworkflow_plugin import load_connection_params
-from iworkflow_sdk import iworkflow, exceptions
+from iworkflow_plugin import (load_connection_params, record_metrics,
+                              sdk_logging)
+from iworkflow_sdk import iworkflow, exceptions, metrics, payload
+from iworkflow_sdk.backoff import BackoffPolicy
+from iworkflow_sdk.deadline import (Deadline,
+                                    DEFAULT_CONNECT_TIMEOUT,
+                                    DEFAULT_READ_TIMEOUT)
 
 KEY_TENANT_NAME = 'tenant_name'
 KEY_SERVICE_NAME = 'service_name'
 KEY_TEMPLATE_NAME = 'template_name'
+KEY_USE_EXTERNAL_RESOURCE = 'use_external_resource'
 
 PARAMS_IP = "ip"
 PARAMS_SYNC_GROUP = "sync_group"
 PARAMS_USER = "user"
 PARAMS_PASSWORD = "password"
+PARAMS_AUTH_MODE = "auth_mode"
+PARAMS_TOKEN_CACHE_DIR = "token_cache_dir"
+PARAMS_COALESCE_SYNC = "coalesce_sync"
+PARAMS_SYNC_DEBOUNCE = "sync_debounce"
+PARAMS_CONNECT_TIMEOUT = "connect_timeout"
+PARAMS_READ_TIMEOUT = "read_timeout"
+
+RUNTIME_POLL_ATTEMPT = "poll_attempt"
+RUNTIME_POLL_STARTED_AT = "poll_started_at"
+RUNTIME_PAYLOAD_HASH = "payload_hash"
+RUNTIME_SELF_LINK = "self_link"
+RUNTIME_GENERATION = "generation"
+RUNTIME_ETAG = "etag"
+
+# outcomes of the probe run before a service is created
+PROBE_KEEP = "keep"
+PROBE_UPDATE = "update"
+PROBE_CREATE = "create"
 
 
 @load_connection_params
+@sdk_logging
+@record_metrics
 @operation
 def create_service(vars,
                    tables,
@@ -41,12 +68,25 @@ def create_service(vars,
                    bigip_params,
                    reference_hostname,
                    retry_interval,
-                   ctx):
+                   ctx,
+                   poll_initial_interval=1,
+                   poll_max_interval=60,
+                   poll_multiplier=2,
+                   poll_timeout=1800,
+                   wait_timeout=0,
+                   operation_timeout=0):
     """
     Creates request payload
     and sends a 'create service' request
     to the iWorkflow.
-    Polls for a service status
+    Polls for a service status, retrying the operation
+    with exponential backoff until poll_timeout.
+    With wait_timeout, polls are first awaited within the operation
+    for up to wait_timeout seconds.
+    With operation_timeout, every request and wait of this run
+    gets at most the part of it that is left.
+    A service that is already deployed without errors is kept rather than
+    created again, and with use_external_resource it is only adopted.
     """
     template_name = ctx.node.properties.get(KEY_TEMPLATE_NAME)
 
@@ -54,52 +94,169 @@ def create_service(vars,
         raise NonRecoverableError("Template name is required")
 
     iworkflow_service = _get_iworkflow(ctx, connection_params)
+    deadline = Deadline(operation_timeout or None)
+
+    polling_policy = BackoffPolicy(poll_initial_interval,
+                                   poll_max_interval,
+                                   poll_multiplier,
+                                   poll_timeout)
 
     if ctx.operation.retry_number == 0:
         # start is executed for the first time, request service creation once.
-        _create_service_request(iworkflow_service,
-                                template_name,
-                                vars,
-                                tables,
-                                properties,
-                                reference_hostname,
-                                ctx)
+        _reset_polling_state(ctx)
+        # serialized once for both its hash and the request
+        body = iworkflow_service.serialize_payload(template_name,
+                                                   vars,
+                                                   tables,
+                                                   properties,
+                                                   reference_hostname)
+        payload_hash = payload.body_hash(body)
+        probe = _probe_service(iworkflow_service, payload_hash, ctx, deadline)
+        if probe == PROBE_KEEP:
+            return
 
-    _create_service_polling(iworkflow_service,
-                            retry_interval,
-                            ctx)
+        if probe == PROBE_UPDATE:
+            _update_service_request(iworkflow_service,
+                                    template_name,
+                                    vars,
+                                    tables,
+                                    properties,
+                                    reference_hostname,
+                                    ctx,
+                                    deadline,
+                                    body)
+        else:
+            _create_service_request(iworkflow_service,
+                                    template_name,
+                                    vars,
+                                    tables,
+                                    properties,
+                                    reference_hostname,
+                                    ctx,
+                                    deadline,
+                                    body)
+        ctx.instance.runtime_properties[RUNTIME_PAYLOAD_HASH] = payload_hash
 
-    iworkflow_service.sync(bigip_params.get(PARAMS_IP),
-                           bigip_params.get(PARAMS_SYNC_GROUP),
-                           bigip_params.get(PARAMS_USER),
-                           bigip_params.get(PARAMS_PASSWORD),
-                           retry_interval
-                           )
+    if not _create_service_polling(iworkflow_service,
+                                   polling_policy,
+                                   ctx,
+                                   wait_timeout,
+                                   deadline):
+        return
+
+    _sync(bigip_params, retry_interval, deadline)
 
 
 @load_connection_params
+@sdk_logging
+@record_metrics
 @operation
 def delete_service(connection_params,
-                   ctx):
+                   ctx,
+                   operation_timeout=0):
     """
     Sends 'delete service' request to the iWorkflow
     """
     iworkflow_service = _get_iworkflow(ctx, connection_params)
 
+    if ctx.node.properties.get(KEY_USE_EXTERNAL_RESOURCE):
+        _forget_service(ctx)
+        ctx.logger.info("Service {0} is an external resource, it is not "
+                        "deleted".format(iworkflow_service.service_name))
+        return
+
     try:
-        iworkflow_service.delete_service()
+        iworkflow_service.delete_service(Deadline(operation_timeout or None))
+        _forget_service(ctx)
         ctx.logger.info("Service {0} has been deleted".format(
             iworkflow_service.service_name))
+    except exceptions.IWorkflowNotFoundException:
+        # e.g. already deleted by delete_services
+        _forget_service(ctx)
+        ctx.logger.info("Service {0} does not exist anymore".format(
+            iworkflow_service.service_name))
     except Exception:
-        _, exc_value, exc_traceback = sys.exc_info()
         raise NonRecoverableError(
             "Failed deleting service '{0}'".format(
                 iworkflow_service.service_name
             ),
-            causes=[exception_to_error_cause(exc_value, exc_traceback)]
+            causes=_error_causes()
         )
 
 
+@sdk_logging
+@record_metrics
+@operation
+def delete_services(tenant_name,
+                    service_names,
+                    bigip_params,
+                    retry_interval,
+                    ctx,
+                    concurrency=10,
+                    poll_interval=10,
+                    timeout=1800):
+    """
+    Deletes many services of a tenant of this iWorkflow at once,
+    confirms their removal, then runs a single coalesced BIG-IP sync.
+    """
+    from iworkflow_sdk import bulk
+
+    results = bulk.delete_services(tenant_name,
+                                   service_names,
+                                   ctx.node.properties,
+                                   concurrency=concurrency,
+                                   poll_interval=poll_interval,
+                                   timeout=timeout)
+
+    failed = [result for result in results
+              if result.status != bulk.STATUS_DELETED]
+    ctx.logger.info("{0} of {1} services deleted".format(
+        len(results) - len(failed), len(results)))
+
+    if bigip_params and len(failed) < len(results):
+        _sync(dict(bigip_params, **{PARAMS_COALESCE_SYNC: True}),
+              retry_interval)
+
+    if failed:
+        raise NonRecoverableError(
+            "Failed deleting services: {0}".format(", ".join(
+                "{0} ({1})".format(result.service_name,
+                                   result.error or result.status)
+                for result in failed)))
+
+
+def _sync(bigip_params, retry_interval, deadline=None):
+    """
+    Saves and syncs the configuration of the BIG-IP given in bigip_params.
+    """
+    iworkflow.IWorkflowService.sync(
+        bigip_params.get(PARAMS_IP),
+        bigip_params.get(PARAMS_SYNC_GROUP),
+        bigip_params.get(PARAMS_USER),
+        bigip_params.get(PARAMS_PASSWORD),
+        retry_interval,
+        auth_mode=bigip_params.get(PARAMS_AUTH_MODE),
+        token_cache_dir=bigip_params.get(PARAMS_TOKEN_CACHE_DIR),
+        coalesce=bigip_params.get(PARAMS_COALESCE_SYNC, False),
+        debounce=bigip_params.get(PARAMS_SYNC_DEBOUNCE),
+        connect_timeout=bigip_params.get(PARAMS_CONNECT_TIMEOUT,
+                                         DEFAULT_CONNECT_TIMEOUT),
+        read_timeout=bigip_params.get(PARAMS_READ_TIMEOUT,
+                                      DEFAULT_READ_TIMEOUT),
+        deadline=deadline)
+
+
+def _error_causes():
+    """
+    Returns the error causes of the exception being handled.
+    """
+    # cloudify.utils is costly to import and only needed on failures
+    from cloudify.utils import exception_to_error_cause
+
+    _, exc_value, exc_traceback = sys.exc_info()
+    return [exception_to_error_cause(exc_value, exc_traceback)]
+
+
 def _get_iworkflow(ctx, connection_params):
     """
     Creates an IWorkflowService based on context parameters.
@@ -116,8 +273,86 @@ def _get_iworkflow(ctx, connection_params):
             "Creation failed: Both tenant name and service name are required"
         )
 
-    return iworkflow.IWorkflowService(tenant_name, service_name,
-                                      connection_params)
+    iworkflow_service = iworkflow.IWorkflowService(tenant_name,
+                                                   service_name,
+                                                   connection_params)
+    _restore_version(iworkflow_service, ctx)
+    return iworkflow_service
+
+
+def _probe_service(iworkflow_service, payload_hash, ctx, deadline=None):
+    """
+    Probes the service before it is created, with a single poll.
+    A service deployed without errors is kept, unless a former run deployed
+    it with another payload. With use_external_resource, the service is
+    adopted as is and has to exist.
+
+    :return: PROBE_KEEP when the existing service is used as is,
+             PROBE_UPDATE when it may exist and has to be replaced,
+             PROBE_CREATE when it does not exist
+    """
+    service_name = iworkflow_service.service_name
+    external = ctx.node.properties.get(KEY_USE_EXTERNAL_RESOURCE)
+    if not external and ctx.instance.runtime_properties.get(
+            RUNTIME_PAYLOAD_HASH) not in (None, payload_hash):
+        ctx.logger.info("Service {0} will be updated with the new "
+                        "payload".format(service_name))
+        return PROBE_UPDATE
+
+    try:
+        exists = iworkflow_service.service_exists(deadline)
+    except exceptions.IWorkflowException as e:
+        if external:
+            raise NonRecoverableError(
+                "External service {0} cannot be used: {1}".format(
+                    service_name, str(e)))
+        ctx.logger.info("Service {0} will be redeployed: {1}".format(
+            service_name, str(e)))
+        return PROBE_UPDATE
+    except requests.RequestException:
+        # a retry would skip the create, fail instead of polling for a
+        # service that was never requested
+        raise NonRecoverableError(
+            "Failed probing service '{0}'".format(service_name),
+            causes=_error_causes()
+        )
+
+    if not exists:
+        if external:
+            raise NonRecoverableError(
+                "External service {0} does not exist".format(service_name))
+        return PROBE_CREATE
+
+    _record_version(iworkflow_service, ctx)
+    if external:
+        ctx.logger.info("Using external service {0}".format(service_name))
+    else:
+        ctx.instance.runtime_properties[RUNTIME_PAYLOAD_HASH] = payload_hash
+        ctx.logger.info("Service {0} is already deployed, skipping its "
+                        "creation".format(service_name))
+    return PROBE_KEEP
+
+
+def _record_version(iworkflow_service, ctx):
+    """
+    Stores the selfLink, generation and ETag of the last polled version of
+    the service in runtime properties.
+    """
+    runtime_properties = ctx.instance.runtime_properties
+    runtime_properties[RUNTIME_SELF_LINK] = iworkflow_service.self_link
+    runtime_properties[RUNTIME_GENERATION] = iworkflow_service.generation
+    runtime_properties[RUNTIME_ETAG] = iworkflow_service.etag
+
+
+def _restore_version(iworkflow_service, ctx):
+    """
+    Restores the version recorded by a former run, so that the next poll
+    sends its ETag and is answered with a 304 if the service is unchanged.
+    """
+    runtime_properties = ctx.instance.runtime_properties
+    iworkflow_service.self_link = runtime_properties.get(RUNTIME_SELF_LINK)
+    iworkflow_service.generation = runtime_properties.get(RUNTIME_GENERATION)
+    iworkflow_service.etag = runtime_properties.get(RUNTIME_ETAG)
 
 
 def _create_service_request(iworkflow_service,
@@ -126,44 +361,146 @@ def _create_service_request(iworkflow_service,
                             tables,
                             properties,
                             reference_hostname,
-                            ctx):
+                            ctx,
+                            deadline=None,
+                            body=None):
     try:
         iworkflow_service.create_service(template_name,
                                          vars,
                                          tables,
                                          properties,
-                                         reference_hostname)
+                                         reference_hostname,
+                                         deadline,
+                                         body)
         ctx.logger.info("Service {0} has been requested".format(
             iworkflow_service.service_name))
     except Exception:
-        _, exc_value, exc_traceback = sys.exc_info()
         raise NonRecoverableError(
             "Failed creating service '{0}' for template '{1}'".format(
                 iworkflow_service.service_name,
                 template_name),
-            causes=[exception_to_error_cause(exc_value, exc_traceback)]
+            causes=_error_causes()
         )
 
 
-def _create_service_polling(iworkflow_service,
-                            retry_interval,
-                            ctx):
+def _update_service_request(iworkflow_service,
+                            template_name,
+                            vars,
+                            tables,
+                            properties,
+                            reference_hostname,
+                            ctx,
+                            deadline=None,
+                            body=None):
+    """
+    Replaces the definition of the service with the new payload,
+    or creates the service if it does not exist anymore.
+    """
     try:
-        iworkflow_service.poll_service()
-        ctx.logger.info("Service {0} has been created".format(
+        iworkflow_service.update_service(template_name,
+                                         vars,
+                                         tables,
+                                         properties,
+                                         reference_hostname,
+                                         deadline,
+                                         body)
+        ctx.logger.info("Service {0} has been updated".format(
             iworkflow_service.service_name))
-    except exceptions.IWorkflowNotFoundException as iwe:
-        return ctx.operation.retry(
-            message="Service {0} is not created yet. "
-                    "Response details: {1}".format(
-                        iworkflow_service.service_name, str(iwe)),
-            retry_after=retry_interval
-        )
+    except exceptions.IWorkflowNotFoundException:
+        _create_service_request(iworkflow_service,
+                                template_name,
+                                vars,
+                                tables,
+                                properties,
+                                reference_hostname,
+                                ctx,
+                                deadline,
+                                body)
     except Exception:
-        _, exc_value, exc_traceback = sys.exc_info()
         raise NonRecoverableError(
-            "Failed creating service '{0}'".format(
-                iworkflow_service.service_name
-            ),
-            causes=[exception_to_error_cause(exc_value, exc_traceback)]
+            "Failed updating service '{0}' for template '{1}'".format(
+                iworkflow_service.service_name,
+                template_name),
+            causes=_error_causes()
         )
+
+
+def _create_service_polling(iworkflow_service,
+                            polling_policy,
+                            ctx,
+                            wait_timeout=0,
+                            deadline=None):
+    """
+    Polls for the service.
+    While the next poll fits in wait_timeout seconds, and in the deadline,
+    the operation waits for it in-process, otherwise the operation is retried.
+    A poll interrupted by a timeout is retried as well.
+    The backoff state is kept in runtime properties,
+    so that it survives operation retries.
+
+    :return: True if the service has been created, otherwise the operation
+             is scheduled for a retry and False is returned
+    """
+    runtime_properties = ctx.instance.runtime_properties
+    started_at = runtime_properties.setdefault(RUNTIME_POLL_STARTED_AT,
+                                               time.time())
+    wait_deadline = time.time() + wait_timeout
+    if deadline and deadline.expires_at is not None:
+        wait_deadline = min(wait_deadline, deadline.expires_at)
+
+    while True:
+        try:
+            iworkflow_service.poll_service(deadline)
+            ctx.logger.info("Service {0} has been created".format(
+                iworkflow_service.service_name))
+            _record_version(iworkflow_service, ctx)
+            _reset_polling_state(ctx)
+            return True
+        except (exceptions.IWorkflowNotFoundException,
+                exceptions.IWorkflowTimeoutException,
+                requests.Timeout) as iwe:
+            not_found = iwe
+        except Exception:
+            raise NonRecoverableError(
+                "Failed creating service '{0}'".format(
+                    iworkflow_service.service_name
+                ),
+                causes=_error_causes()
+            )
+
+        if polling_policy.expired(started_at):
+            raise NonRecoverableError(
+                "Service {0} has not been created in {1}s".format(
+                    iworkflow_service.service_name,
+                    polling_policy.timeout))
+
+        metrics.registry.record_retry(iworkflow.ENDPOINT_POLL)
+        attempt = runtime_properties.get(RUNTIME_POLL_ATTEMPT, 0)
+        runtime_properties[RUNTIME_POLL_ATTEMPT] = attempt + 1
+        interval = min(polling_policy.interval(attempt),
+                       polling_policy.remaining(started_at))
+
+        if time.time() + interval > wait_deadline:
+            ctx.operation.retry(
+                message="Service {0} is not created yet. "
+                        "Response details: {1}".format(
+                            iworkflow_service.service_name, str(not_found)),
+                retry_after=interval
+            )
+            return False
+
+        ctx.logger.debug("Service {0} is not created yet, "
+                         "polling again in {1:.1f}s".format(
+                             iworkflow_service.service_name, interval))
+        time.sleep(interval)
+
+
+def _forget_service(ctx):
+    for key in (RUNTIME_PAYLOAD_HASH, RUNTIME_SELF_LINK, RUNTIME_GENERATION,
+                RUNTIME_ETAG):
+        ctx.instance.runtime_properties.pop(key, None)
+
+
+def _reset_polling_state(ctx):
+    ctx.instance.runtime_properties.pop(RUNTIME_POLL_ATTEMPT, None)
+    ctx.instance.runtime_properties.pop(RUNTIME_POLL_STARTED_AT, None)
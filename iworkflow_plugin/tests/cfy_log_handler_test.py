@@ -0,0 +1,175 @@
+########
+# Copyright (c) 2017 GigaSpaces Technologies Ltd. All rights reserved
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#        http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+#    * WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#    * See the License for the specific language governing permissions and
+#    * limitations under the License.
+
+import logging
+import threading
+import unittest
+
+from iworkflow_plugin import CfyLogHandler, LogShipper
+
+
+class _Logger(object):
+    """
+    Cloudify logger stub. With a gate, the first call blocks until it is
+    opened, so that the records emitted meanwhile are queued together.
+    """
+
+    def __init__(self, level=logging.DEBUG, gated=False):
+        self.level = level
+        self.calls = []
+        self.entered = threading.Event()
+        self.gate = threading.Event()
+        if not gated:
+            self.gate.set()
+
+    def isEnabledFor(self, level):
+        return level >= self.level
+
+    def log(self, level, message):
+        self.entered.set()
+        self.gate.wait()
+        self.calls.append((level, message))
+
+
+class _Context(object):
+
+    def __init__(self, logger):
+        self.logger = logger
+
+
+class CfyLogHandlerTest(unittest.TestCase):
+
+    def get_logger(self, cfy_logger, **kwargs):
+        handler = CfyLogHandler(_Context(cfy_logger),
+                                shipper=LogShipper(),
+                                **kwargs)
+        logger = logging.getLogger("iworkflow.test.{0}".format(id(handler)))
+        logger.propagate = False
+        logger.setLevel(logging.DEBUG)
+        logger.addHandler(handler)
+        self.addCleanup(logger.removeHandler, handler)
+        return logger, handler
+
+    def hold(self, logger, cfy_logger):
+        # the first record is being shipped until the gate is opened
+        logger.info("first")
+        self.assertTrue(cfy_logger.entered.wait(5))
+
+    def test_group_by_level(self):
+        # given
+        cfy_logger = _Logger(gated=True)
+        logger, handler = self.get_logger(cfy_logger)
+        self.hold(logger, cfy_logger)
+
+        # when
+        logger.info("a")
+        logger.info("b")
+        logger.warning("c")
+        logger.info("d")
+        cfy_logger.gate.set()
+        handler.close()
+
+        # then
+        self.assertEqual([(logging.INFO, "first"),
+                          (logging.INFO, "a\nb"),
+                          (logging.WARNING, "c"),
+                          (logging.INFO, "d")],
+                         cfy_logger.calls)
+
+    def test_max_batch_records(self):
+        # given
+        cfy_logger = _Logger(gated=True)
+        logger, handler = self.get_logger(cfy_logger, max_batch_records=2)
+        self.hold(logger, cfy_logger)
+
+        # when
+        for idx in range(5):
+            logger.info("message %d", idx)
+        cfy_logger.gate.set()
+        handler.close()
+
+        # then
+        self.assertEqual(["first",
+                          "message 0\nmessage 1",
+                          "message 2\nmessage 3",
+                          "message 4"],
+                         [message for _, message in cfy_logger.calls])
+
+    def test_max_batch_bytes(self):
+        # given
+        cfy_logger = _Logger(gated=True)
+        logger, handler = self.get_logger(cfy_logger, max_batch_bytes=10)
+        self.hold(logger, cfy_logger)
+
+        # when
+        for message in ("aaaaaa", "bbbbbb", "cccccc"):
+            logger.info(message)
+        cfy_logger.gate.set()
+        handler.close()
+
+        # then
+        self.assertEqual(["first", "aaaaaa\nbbbbbb", "cccccc"],
+                         [message for _, message in cfy_logger.calls])
+
+    def test_below_ctx_level_dropped(self):
+        # given
+        cfy_logger = _Logger(level=logging.INFO)
+        logger, handler = self.get_logger(cfy_logger)
+
+        # when
+        # would fail to format if it was not dropped
+        logger.debug("payload %s %s", "only one argument")
+        logger.info("kept")
+        handler.close()
+
+        # then
+        self.assertEqual([(logging.INFO, "kept")], cfy_logger.calls)
+
+    def test_close_ships_everything(self):
+        # given
+        cfy_logger = _Logger()
+        logger, handler = self.get_logger(cfy_logger, max_batch_records=3)
+
+        # when
+        for idx in range(50):
+            logger.info("message %d", idx)
+        handler.close()
+
+        # then
+        shipped = "\n".join(message for _, message in cfy_logger.calls)
+        self.assertEqual(["message {0}".format(idx) for idx in range(50)],
+                         shipped.split("\n"))
+
+    def test_handlers_share_shipper_thread(self):
+        # given
+        shipper = LogShipper()
+        first = _Logger()
+        second = _Logger()
+
+        # when
+        threads = []
+        for cfy_logger, message in ((first, "one"), (second, "two")):
+            handler = CfyLogHandler(_Context(cfy_logger), shipper=shipper)
+            handler.handle(logging.makeLogRecord(
+                {"msg": message, "levelno": logging.INFO,
+                 "levelname": "INFO"}))
+            handler.close()
+            threads.append(shipper._thread)
+
+        # then
+        self.assertEqual([(logging.INFO, "one")], first.calls)
+        self.assertEqual([(logging.INFO, "two")], second.calls)
+        self.assertIs(threads[0], threads[1])
+        self.assertTrue(threads[0].is_alive())
@@ -14,16 +14,23 @@
 #    * limitations under the License.
 
 
+import time
 import unittest
 from mock import MagicMock
 from mock import patch
 
+import requests
 from cloudify.mocks import MockCloudifyContext
 from cloudify.state import current_ctx
 from cloudify.exceptions import NonRecoverableError
 
-from iworkflow_plugin import constants
-from iworkflow_sdk import exceptions
+from iworkflow_plugin import service
+from iworkflow_sdk import bulk, exceptions, payload
+from iworkflow_sdk.backoff import BackoffPolicy
+from iworkflow_sdk.deadline import Deadline
+from iworkflow_sdk.iworkflow import IWorkflowService
+
+SERVICE_CLASS = "iworkflow_sdk.iworkflow.IWorkflowService"
 
 
 class ConnectionNodeMock:
@@ -33,238 +40,467 @@ class ConnectionNodeMock:
         }
 
 
+def prepare_ctx(retry_number=0, properties=None, runtime_properties=None):
+    _ctx = MockCloudifyContext(
+        node_id="test_id",
+        node_name="test_name",
+        deployment_id="test_name",
+        properties=properties if properties is not None else {
+            service.KEY_TENANT_NAME: 'tenant1',
+            service.KEY_SERVICE_NAME: 'service1',
+            service.KEY_TEMPLATE_NAME: 'template1',
+        },
+        runtime_properties=runtime_properties or {},
+        operation={"retry_number": retry_number}
+    )
+    _ctx._node.type = 'cloudify.iworkflow.Service'
+
+    current_ctx.set(_ctx)
+
+    return _ctx
+
+
+def create_service(_ctx, **kwargs):
+    service.create_service(vars={"var1": "a"},
+                           tables={"tab1": "b"},
+                           properties={"prop1": "c"},
+                           bigip_params={},
+                           reference_hostname="local1",
+                           retry_interval=10,
+                           ctx=_ctx,
+                           **kwargs)
+
+
 @patch("iworkflow_plugin.get_connected_node",
        return_value=ConnectionNodeMock())
+@patch(SERVICE_CLASS + ".sync")
 class TestPlugin(unittest.TestCase):
 
-    def test_create_success(self, mock_conn_params):
-        _ctx = self._prepare_ctx()
-
-        vars = {"var1": "a"}
-        tables = {"tab1": "b"}
-        properties = {"prop1": "c"}
-        ref_host = "local1"
+    def test_create_success(self, sync_method, mock_conn_params):
+        _ctx = prepare_ctx()
 
-        with patch("iworkflow_sdk.iworkflow.IWorkflowService.create_service",
+        with patch(SERVICE_CLASS + ".create_service",
                    MagicMock(return_value=None)) as create_method:
-            with patch("iworkflow_sdk.iworkflow.IWorkflowService.poll_service",
-                       MagicMock(return_value=None)) as poll_method:
-                from iworkflow_plugin import service
-                service.create_service(vars=vars,
-                                       tables=tables,
-                                       properties=properties,
-                                       reference_hostname=ref_host,
-                                       retry_interval=10,
-                                       ctx=_ctx)
+            # the probe does not find the service, the poll does
+            with patch(SERVICE_CLASS + ".poll_service",
+                       MagicMock(side_effect=[
+                           exceptions.IWorkflowNotFoundException, None])) \
+                    as poll_method:
+                create_service(_ctx)
 
                 self.assertTrue(create_method.called)
-                self.assertTrue(poll_method.called)
+                self.assertEqual(2, poll_method.call_count)
+        self.assertTrue(sync_method.called)
         self.assertTrue(mock_conn_params.called)
+        # the body hashed is the body sent
+        body = create_method.call_args[0][6]
+        self.assertEqual(payload.body_hash(body),
+                         _ctx.instance.runtime_properties[
+                             service.RUNTIME_PAYLOAD_HASH])
 
-    def test_create_no_params(self, mock_conn_params):
-        _ctx = MockCloudifyContext(
-            node_id="test_id",
-            node_name="test_name",
-            deployment_id="test_name",
-            properties={}
-        )
+    def test_create_no_params(self, sync_method, mock_conn_params):
+        _ctx = prepare_ctx(properties={})
 
-        _ctx._node.type = 'cloudify.iworkflow.Service'
-        current_ctx.set(_ctx)
-
-        vars = {"var1": "a"}
-        tables = {"tab1": "b"}
-        properties = {"prop1": "c"}
-        ref_host = "local1"
-
-        expected_error = 'Creation failed: ' \
-                         'Tenant, service, template must be set.'
+        expected_error = 'Template name is required'
 
         with self.assertRaisesRegexp(NonRecoverableError,
                                      expected_error):
-            from iworkflow_plugin import service
             # when
-            service.create_service(vars=vars,
-                                   tables=tables,
-                                   properties=properties,
-                                   reference_hostname=ref_host,
-                                   retry_interval=10,
-                                   ctx=_ctx)
+            create_service(_ctx)
         self.assertTrue(mock_conn_params.called)
 
-    def test_create_failure(self, mock_conn_params):
-
-        _ctx = self._prepare_ctx()
+    def test_create_failure(self, sync_method, mock_conn_params):
 
-        vars = {"var1": "a"}
-        tables = {"tab1": "b"}
-        properties = {"prop1": "c"}
-        ref_host = "local1"
+        _ctx = prepare_ctx()
 
         expected_error =\
             'Failed creating service \'{0}\' for template \'{1}\''\
             .format(_ctx._properties.get('service_name'),
                     _ctx._properties.get('template_name'))
 
-        with patch("iworkflow_sdk.iworkflow.IWorkflowService.create_service",
+        with patch(SERVICE_CLASS + ".create_service",
                    MagicMock(side_effect=Exception)) as create_method:
-            from iworkflow_plugin import service
-            # then
-            with self.assertRaisesRegexp(NonRecoverableError,
-                                         expected_error):
-                # when
-                service.create_service(vars=vars,
-                                       tables=tables,
-                                       properties=properties,
-                                       reference_hostname=ref_host,
-                                       retry_interval=10,
-                                       ctx=_ctx)
+            with patch(SERVICE_CLASS + ".poll_service",
+                       MagicMock(
+                           side_effect=exceptions.IWorkflowNotFoundException)):
+                # then
+                with self.assertRaisesRegexp(NonRecoverableError,
+                                             expected_error):
+                    # when
+                    create_service(_ctx)
                 self.assertTrue(create_method.called)
         self.assertTrue(mock_conn_params.called)
 
-    def test_create_success_poll_failure(self, mock_conn_params):
+    def test_create_success_poll_failure(self, sync_method,
+                                         mock_conn_params):
         # given
-        _ctx = self._prepare_ctx()
-
-        vars = {"var1": "a"}
-        tables = {"tab1": "b"}
-        properties = {"prop1": "c"}
-        ref_host = "local1"
+        _ctx = prepare_ctx()
 
         expected_error = 'Failed creating service \'{0}\''\
             .format(_ctx._properties.get('service_name'))
 
-        with patch("iworkflow_sdk.iworkflow.IWorkflowService.create_service",
+        with patch(SERVICE_CLASS + ".create_service",
                    MagicMock(return_value=None)) as create_method:
-            with patch("iworkflow_sdk.iworkflow.IWorkflowService.poll_service",
-                       MagicMock(side_effect=exceptions.IWorkflowException)) \
-                    as poll_method:
+            with patch(SERVICE_CLASS + ".poll_service",
+                       MagicMock(side_effect=[
+                           exceptions.IWorkflowNotFoundException,
+                           exceptions.IWorkflowException])) as poll_method:
                 # then
                 with self.assertRaisesRegexp(NonRecoverableError,
                                              expected_error):
                     # when
-                    from iworkflow_plugin import service
-                    service.create_service(vars=vars,
-                                           tables=tables,
-                                           properties=properties,
-                                           reference_hostname=ref_host,
-                                           retry_interval=10,
-                                           ctx=_ctx)
+                    create_service(_ctx)
 
-                    self.assertTrue(create_method.called)
-                    self.assertTrue(poll_method.called)
-        self.assertTrue(mock_conn_params.called)
+                self.assertTrue(create_method.called)
+                self.assertEqual(2, poll_method.call_count)
+        self.assertFalse(sync_method.called)
 
-    def test_poll_service_not_found(self, mock_conn_params):
+    def test_poll_service_not_found(self, sync_method, mock_conn_params):
         # given
-        _ctx = self._prepare_ctx()
-
-        vars = {"var1": "a"}
-        tables = {"tab1": "b"}
-        properties = {"prop1": "c"}
-        ref_host = "local1"
+        _ctx = prepare_ctx()
 
-        with patch("iworkflow_sdk.iworkflow.IWorkflowService.create_service",
+        with patch(SERVICE_CLASS + ".create_service",
                    MagicMock(return_value=None)) as create_method:
-            with patch("iworkflow_sdk.iworkflow.IWorkflowService.poll_service",
+            with patch(SERVICE_CLASS + ".poll_service",
                        MagicMock(
                            side_effect=exceptions.IWorkflowNotFoundException))\
                     as poll_method:
-                with patch("cloudify.ctx.operation.retry",
-                           MagicMock(return_value=None)) as retry_method:
+                with patch.object(_ctx.operation, "retry") as retry_method:
                     # when
-                    from iworkflow_plugin import service
-                    service.create_service(vars=vars,
-                                           tables=tables,
-                                           properties=properties,
-                                           reference_hostname=ref_host,
-                                           retry_interval=10,
-                                           ctx=_ctx)
+                    create_service(_ctx)
                     # then
                     self.assertTrue(create_method.called)
                     self.assertTrue(poll_method.called)
                     self.assertTrue(retry_method.called)
-        self.assertTrue(mock_conn_params.called)
+        self.assertFalse(sync_method.called)
 
-    def test_poll_retry_no_create(self, mock_conn_params):
+    def test_poll_retry_no_create(self, sync_method, mock_conn_params):
         # given
-        _ctx = self._prepare_ctx(1)
-
-        vars = {"var1": "a"}
-        tables = {"tab1": "b"}
-        properties = {"prop1": "c"}
-        ref_host = "local1"
+        _ctx = prepare_ctx(1)
 
         with patch(
-                "iworkflow_sdk.iworkflow.IWorkflowService.create_service",
+                SERVICE_CLASS + ".create_service",
                 MagicMock(return_value=None)) as create_method:
             with patch(
-                    "iworkflow_sdk.iworkflow.IWorkflowService.poll_service",
+                    SERVICE_CLASS + ".poll_service",
                     MagicMock(
                         side_effect=exceptions.IWorkflowNotFoundException)) \
                     as poll_method:
-                with patch("cloudify.ctx.operation.retry",
-                           MagicMock(return_value=None)) as retry_method:
+                with patch.object(_ctx.operation, "retry") as retry_method:
                     # when
-                    from iworkflow_plugin import service
-                    service.create_service(vars=vars,
-                                           tables=tables,
-                                           properties=properties,
-                                           reference_hostname=ref_host,
-                                           retry_interval=10,
-                                           ctx=_ctx)
+                    create_service(_ctx)
                     # then
                     self.assertFalse(create_method.called)
-                    self.assertTrue(poll_method.called)
+                    self.assertEqual(1, poll_method.call_count)
                     self.assertTrue(retry_method.called)
-        self.assertTrue(mock_conn_params.called)
 
-    def test_delete_success(self, mock_conn_params):
+    def test_create_existing_service_skipped(self, sync_method,
+                                             mock_conn_params):
         # given
-        _ctx = self._prepare_ctx()
+        _ctx = prepare_ctx()
+
+        with patch(SERVICE_CLASS + ".create_service") as create_method:
+            with patch(SERVICE_CLASS + ".poll_service",
+                       MagicMock(return_value=None)):
+                # when
+                create_service(_ctx)
+
+        # then
+        self.assertFalse(create_method.called)
+        self.assertFalse(sync_method.called)
+        self.assertIn(service.RUNTIME_PAYLOAD_HASH,
+                      _ctx.instance.runtime_properties)
+
+    def test_create_probe_connection_error(self, sync_method,
+                                           mock_conn_params):
+        # given
+        _ctx = prepare_ctx()
+
+        with patch(SERVICE_CLASS + ".create_service") as create_method:
+            with patch(SERVICE_CLASS + ".poll_service",
+                       MagicMock(side_effect=requests.ConnectionError)):
+                # then
+                with self.assertRaisesRegexp(NonRecoverableError,
+                                             "Failed probing service"):
+                    # when
+                    create_service(_ctx)
+
+        self.assertFalse(create_method.called)
+        self.assertNotIn(service.RUNTIME_PAYLOAD_HASH,
+                         _ctx.instance.runtime_properties)
+
+    def test_create_existing_service_revalidated(self, sync_method,
+                                                 mock_conn_params):
+        # given
+        version = {service.RUNTIME_GENERATION: 3,
+                   service.RUNTIME_SELF_LINK: "https://localhost/service1",
+                   service.RUNTIME_ETAG: '"3"'}
+        _ctx = prepare_ctx(runtime_properties=dict(version))
+
+        with patch(SERVICE_CLASS + ".create_service") as create_method:
+            with patch(SERVICE_CLASS + "._send_get_request",
+                       MagicMock(return_value=MagicMock(status_code=304))) \
+                    as get_method:
+                # when
+                create_service(_ctx)
+
+        # then
+        self.assertFalse(create_method.called)
+        self.assertEqual('"3"', get_method.call_args[0][0])
+        for key, value in version.items():
+            self.assertEqual(value, _ctx.instance.runtime_properties[key])
 
-        with patch("iworkflow_sdk.iworkflow.IWorkflowService.delete_service",
+    def test_create_changed_payload_updates(self, sync_method,
+                                            mock_conn_params):
+        # given
+        _ctx = prepare_ctx(runtime_properties={
+            service.RUNTIME_PAYLOAD_HASH: "former"})
+
+        with patch(SERVICE_CLASS + ".create_service") as create_method:
+            with patch(SERVICE_CLASS + ".update_service") as update_method:
+                with patch(SERVICE_CLASS + ".poll_service",
+                           MagicMock(return_value=None)):
+                    # when
+                    create_service(_ctx)
+
+        # then
+        self.assertTrue(update_method.called)
+        self.assertFalse(create_method.called)
+        self.assertTrue(sync_method.called)
+        self.assertNotEqual(
+            "former",
+            _ctx.instance.runtime_properties[service.RUNTIME_PAYLOAD_HASH])
+
+    def test_create_changed_payload_missing_creates(self, sync_method,
+                                                    mock_conn_params):
+        # given
+        _ctx = prepare_ctx(runtime_properties={
+            service.RUNTIME_PAYLOAD_HASH: "former"})
+
+        with patch(SERVICE_CLASS + ".create_service") as create_method:
+            with patch(SERVICE_CLASS + ".update_service",
+                       MagicMock(
+                           side_effect=exceptions.IWorkflowNotFoundException)):
+                with patch(SERVICE_CLASS + ".poll_service",
+                           MagicMock(return_value=None)):
+                    # when
+                    create_service(_ctx)
+
+        # then
+        self.assertTrue(create_method.called)
+        self.assertTrue(sync_method.called)
+
+    def test_create_errored_service_updates(self, sync_method,
+                                            mock_conn_params):
+        # given
+        _ctx = prepare_ctx()
+
+        with patch(SERVICE_CLASS + ".create_service") as create_method:
+            with patch(SERVICE_CLASS + ".update_service") as update_method:
+                with patch(SERVICE_CLASS + ".poll_service",
+                           MagicMock(side_effect=[
+                               exceptions.IWorkflowException("error1"),
+                               None])):
+                    # when
+                    create_service(_ctx)
+
+        # then
+        self.assertTrue(update_method.called)
+        self.assertFalse(create_method.called)
+
+    def test_delete_success(self, sync_method, mock_conn_params):
+        # given
+        _ctx = prepare_ctx()
+
+        with patch(SERVICE_CLASS + ".delete_service",
                    MagicMock(return_value=None)) as delete_method:
             # when
-            from iworkflow_plugin import service
             service.delete_service(ctx=_ctx)
             # then
             self.assertTrue(delete_method.called)
         self.assertTrue(mock_conn_params.called)
 
-    def test_delete_failure(self, mock_conn_params):
+    def test_delete_failure(self, sync_method, mock_conn_params):
         # given
-        _ctx = self._prepare_ctx()
+        _ctx = prepare_ctx()
 
         expected_error = 'Failed deleting service \'{0}\''\
             .format(_ctx._properties.get('service_name'))
 
-        with patch("iworkflow_sdk.iworkflow.IWorkflowService.delete_service",
+        with patch(SERVICE_CLASS + ".delete_service",
                    MagicMock(side_effect=Exception)) as delete_method:
-            # when
-            from iworkflow_plugin import service
             # then
             with self.assertRaisesRegexp(NonRecoverableError,
                                          expected_error):
                 # when
                 service.delete_service(ctx=_ctx)
-                self.assertTrue(delete_method.called)
+            self.assertTrue(delete_method.called)
         self.assertTrue(mock_conn_params.called)
 
-    def _prepare_ctx(self, retry_number=0):
-        _ctx = MockCloudifyContext(
-            node_id="test_id",
-            node_name="test_name",
-            deployment_id="test_name",
-            properties={
-                constants.KEY_TENANT_NAME: 'tenant1',
-                constants.KEY_SERVICE_NAME: 'service1',
-                constants.KEY_TEMPLATE_NAME: 'template1',
-            },
-            operation={"retry_number": retry_number}
-        )
-        _ctx._node.type = 'cloudify.iworkflow.Service'
-
-        current_ctx.set(_ctx)
-
-        return _ctx
+    def test_delete_services_metrics_textfile(self, sync_method,
+                                              mock_conn_params):
+        # given
+        _ctx = prepare_ctx(properties={
+            "metrics_textfile": "/tmp/iworkflow.prom"})
+
+        with patch("iworkflow_sdk.bulk.delete_services",
+                   return_value=[bulk.BulkResult(
+                       "service1", bulk.STATUS_DELETED, None)]):
+            with patch("iworkflow_sdk.metrics.registry.write_textfile") \
+                    as write_method:
+                # when
+                service.delete_services("tenant1", ["service1"], {}, 10,
+                                        ctx=_ctx)
+
+        # then
+        write_method.assert_called_once_with("/tmp/iworkflow.prom")
+        self.assertIn("metrics", _ctx.instance.runtime_properties)
+
+
+def polling_policy(wait=5, timeout=1800):
+    policy = BackoffPolicy(1, 60, 2, timeout)
+    # fixed waits instead of random ones
+    policy.interval = MagicMock(return_value=wait)
+    return policy
+
+
+class _Clock(object):
+    """
+    Stands for the time module, sleeping only advances its time.
+    """
+
+    def __init__(self):
+        self.now = time.time()
+        self.sleep = MagicMock(side_effect=self._advance)
+
+    def time(self):
+        return self.now
+
+    def _advance(self, seconds):
+        self.now += seconds
+
+
+class TestCreateServicePolling(unittest.TestCase):
+
+    def setUp(self):
+        self.iworkflow_service = IWorkflowService("tenant1", "service1", {})
+        self.clock = _Clock()
+        clock_patch = patch("iworkflow_plugin.service.time", self.clock)
+        clock_patch.start()
+        self.addCleanup(clock_patch.stop)
+
+    def poll(self, _ctx, side_effect, **kwargs):
+        with patch.object(self.iworkflow_service, "poll_service",
+                          MagicMock(side_effect=side_effect)) as poll_method:
+            with patch.object(_ctx.operation, "retry") as retry_method:
+                created = service._create_service_polling(
+                    self.iworkflow_service,
+                    kwargs.pop("policy", polling_policy()),
+                    _ctx,
+                    **kwargs)
+        return created, poll_method, retry_method
+
+    def test_retry_without_wait_timeout(self):
+        # given
+        _ctx = prepare_ctx()
+
+        # when
+        created, poll_method, retry_method = self.poll(
+            _ctx, exceptions.IWorkflowNotFoundException)
+
+        # then
+        self.assertFalse(created)
+        self.assertEqual(1, poll_method.call_count)
+        self.assertFalse(self.clock.sleep.called)
+        self.assertEqual(5, retry_method.call_args[1]["retry_after"])
+        runtime_properties = _ctx.instance.runtime_properties
+        self.assertEqual(1, runtime_properties[service.RUNTIME_POLL_ATTEMPT])
+        self.assertIn(service.RUNTIME_POLL_STARTED_AT, runtime_properties)
+
+    def test_wait_in_operation(self):
+        # given
+        _ctx = prepare_ctx()
+        self.iworkflow_service.generation = 2
+        self.iworkflow_service.self_link = "https://localhost/service1"
+        self.iworkflow_service.etag = '"2"'
+
+        # when
+        created, poll_method, retry_method = self.poll(
+            _ctx,
+            [exceptions.IWorkflowNotFoundException,
+             requests.Timeout,
+             None],
+            wait_timeout=60)
+
+        # then
+        self.assertTrue(created)
+        self.assertEqual(3, poll_method.call_count)
+        self.assertEqual(2, self.clock.sleep.call_count)
+        self.assertFalse(retry_method.called)
+        # the backoff state is reset on success
+        self.assertEqual({service.RUNTIME_GENERATION: 2,
+                          service.RUNTIME_SELF_LINK:
+                              "https://localhost/service1",
+                          service.RUNTIME_ETAG: '"2"'},
+                         _ctx.instance.runtime_properties)
+
+    def test_retry_after_wait_timeout(self):
+        # given
+        _ctx = prepare_ctx()
+
+        # when
+        created, poll_method, retry_method = self.poll(
+            _ctx, exceptions.IWorkflowNotFoundException, wait_timeout=12)
+
+        # then
+        self.assertFalse(created)
+        # waits of 5s fit twice in 12s
+        self.assertEqual(3, poll_method.call_count)
+        self.assertEqual(2, self.clock.sleep.call_count)
+        self.assertTrue(retry_method.called)
+        self.assertEqual(
+            3, _ctx.instance.runtime_properties[service.RUNTIME_POLL_ATTEMPT])
+
+    def test_wait_capped_by_deadline(self):
+        # given
+        _ctx = prepare_ctx()
+
+        # when
+        created, poll_method, retry_method = self.poll(
+            _ctx, exceptions.IWorkflowNotFoundException,
+            wait_timeout=60, deadline=Deadline(1))
+
+        # then
+        self.assertFalse(created)
+        self.assertFalse(self.clock.sleep.called)
+        self.assertTrue(retry_method.called)
+
+    def test_backoff_state_kept_across_retries(self):
+        # given
+        started_at = time.time() - 10
+        _ctx = prepare_ctx(2, runtime_properties={
+            service.RUNTIME_POLL_ATTEMPT: 4,
+            service.RUNTIME_POLL_STARTED_AT: started_at})
+        policy = polling_policy()
+
+        # when
+        self.poll(_ctx, exceptions.IWorkflowNotFoundException, policy=policy)
+
+        # then
+        policy.interval.assert_called_once_with(4)
+        runtime_properties = _ctx.instance.runtime_properties
+        self.assertEqual(5, runtime_properties[service.RUNTIME_POLL_ATTEMPT])
+        self.assertEqual(started_at,
+                         runtime_properties[service.RUNTIME_POLL_STARTED_AT])
+
+    def test_poll_timeout(self):
+        # given
+        _ctx = prepare_ctx(3, runtime_properties={
+            service.RUNTIME_POLL_STARTED_AT: time.time() - 100})
+
+        # then
+        with self.assertRaisesRegexp(NonRecoverableError,
+                                     "has not been created in 60s"):
+            # when
+            self.poll(_ctx, exceptions.IWorkflowNotFoundException,
+                      policy=polling_policy(timeout=60))
@@ -0,0 +1,316 @@
+########
+# Copyright (c) 2017 GigaSpaces Technologies Ltd. All rights reserved
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#        http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+#    * WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#    * See the License for the specific language governing permissions and
+#    * limitations under the License.
+
+import logging
+import unittest
+from mock import patch
+
+from cloudify.exceptions import NonRecoverableError
+from cloudify.state import current_workflow_ctx
+
+from iworkflow_plugin import IWORKFLOW_NODE_TYPE, service, workflows
+from iworkflow_sdk import bulk
+from iworkflow_sdk.iworkflow import IWorkflowService
+
+
+class _Instance(object):
+
+    def __init__(self, instance_id, runtime_properties=None):
+        self.id = instance_id
+        self.version = 1
+        self.runtime_properties = runtime_properties or {}
+
+
+class _Relationship(object):
+
+    def __init__(self, target_node):
+        self.target_node = target_node
+
+    def is_derived_from(self, type_name):
+        return type_name == workflows.CONTAINED_IN
+
+
+class _Node(object):
+
+    def __init__(self, node_id, type_name, properties, instances=(),
+                 inputs=None, relationships=()):
+        self.id = node_id
+        self.type_hierarchy = ['cloudify.nodes.Root', type_name]
+        self.properties = properties
+        self.instances = list(instances)
+        self.operations = {workflows.CREATE_OPERATION: {
+            'inputs': inputs or {}}}
+        self.relationships = list(relationships)
+
+
+class _Env(object):
+    """
+    Evaluates get_secret only, and records the context of each call.
+    """
+
+    def __init__(self, secrets):
+        self.secrets = secrets
+        self.contexts = []
+
+    def evaluate_functions(self, payload, context):
+        self.contexts.append(context)
+        return self._evaluate(payload)
+
+    def _evaluate(self, value):
+        if isinstance(value, dict):
+            if value.keys() == ['get_secret']:
+                return self.secrets[value['get_secret']]
+            return dict((k, self._evaluate(v)) for k, v in value.items())
+        if isinstance(value, list):
+            return [self._evaluate(v) for v in value]
+        return value
+
+
+class _Storage(object):
+
+    def __init__(self, instances, secrets):
+        self.instances = dict((i.id, i) for i in instances)
+        self.env = _Env(secrets)
+
+    def get_node_instance(self, instance_id):
+        return self.instances[instance_id]
+
+    def update_node_instance(self, instance_id, version,
+                             runtime_properties=None):
+        self.instances[instance_id].runtime_properties = runtime_properties
+
+
+class _Handler(object):
+
+    def __init__(self, storage):
+        self.storage = storage
+
+
+class _Internal(object):
+
+    def __init__(self, storage):
+        self.handler = _Handler(storage)
+
+
+class _Context(object):
+
+    def __init__(self, nodes, instances, secrets=None):
+        self.local = True
+        self.nodes = nodes
+        self.logger = logging.getLogger("iworkflow.test.workflows")
+        self.internal = _Internal(_Storage(instances, secrets or {}))
+
+    def runtime_properties(self, instance_id):
+        return self.internal.handler.storage.instances[
+            instance_id].runtime_properties
+
+
+CONNECTION = {"host": "iworkflow", "password": {"get_secret": "secret1"}}
+
+
+def service_node(node_id, iworkflow_node, service_name, tenant_name="t1",
+                 instances=None, bigip_ip=None, external=False):
+    inputs = {workflows.INPUT_VARS: [{"name": "v", "value": "a"}]}
+    if bigip_ip:
+        inputs[workflows.INPUT_BIGIP_PARAMS] = {
+            service.PARAMS_IP: bigip_ip,
+            service.PARAMS_SYNC_GROUP: "group1"}
+    return _Node(node_id, workflows.SERVICE_NODE_TYPE, {
+        service.KEY_TENANT_NAME: tenant_name,
+        service.KEY_SERVICE_NAME: service_name,
+        service.KEY_TEMPLATE_NAME: "template1",
+        service.KEY_USE_EXTERNAL_RESOURCE: external
+    }, instances or [_Instance(node_id + "_1")], inputs,
+        [_Relationship(iworkflow_node)])
+
+
+def payload_hash(service_name, tenant_name="t1"):
+    return IWorkflowService(tenant_name, service_name, {}).get_payload_hash(
+        "template1", [{"name": "v", "value": "a"}], [], [], None)
+
+
+def created(tenant_name, batch, connection_params, **kwargs):
+    return [bulk.BulkResult(item[bulk.KEY_SERVICE_NAME],
+                            bulk.STATUS_CREATED, None) for item in batch]
+
+
+@patch("iworkflow_plugin.workflows._sync")
+@patch("iworkflow_sdk.listing.iter_services", return_value=[])
+@patch("iworkflow_sdk.bulk.create_services", side_effect=created)
+class TestBatchCreateServices(unittest.TestCase):
+
+    def setUp(self):
+        self.iworkflow = _Node("iworkflow", IWORKFLOW_NODE_TYPE, CONNECTION,
+                               [_Instance("iworkflow_1")])
+
+    def run_workflow(self, nodes, **kwargs):
+        instances = [instance for node in nodes for instance in
+                     node.instances]
+        ctx = _Context(nodes, instances, {"secret1": "pass1"})
+        with current_workflow_ctx.push(ctx):
+            workflows.batch_create_services(ctx, **kwargs)
+        return ctx
+
+    def test_group_by_iworkflow_and_tenant(self, create_services,
+                                           iter_services, sync):
+        # given
+        other = _Node("other", IWORKFLOW_NODE_TYPE, {"host": "other"})
+        nodes = [self.iworkflow,
+                 other,
+                 service_node("s1", self.iworkflow, "service1"),
+                 service_node("s2", other, "service2"),
+                 service_node("s3", self.iworkflow, "service3"),
+                 service_node("s4", self.iworkflow, "service4", "t2")]
+
+        # when
+        ctx = self.run_workflow(nodes)
+
+        # then
+        calls = [(args[0], [item[bulk.KEY_SERVICE_NAME] for item in args[1]],
+                  args[2]) for args, _ in create_services.call_args_list]
+        self.assertEqual(calls, [
+            ("t1", ["service1", "service3"],
+             {"host": "iworkflow", "password": "pass1"}),
+            ("t1", ["service2"], {"host": "other"}),
+            ("t2", ["service4"], {"host": "iworkflow", "password": "pass1"})])
+        # each node is evaluated in the context of its first instance
+        self.assertIn({"self": "iworkflow_1"},
+                      ctx.internal.handler.storage.env.contexts)
+        self.assertIn({"self": "s1_1"},
+                      ctx.internal.handler.storage.env.contexts)
+
+    def test_inputs_evaluated(self, create_services, iter_services, sync):
+        # given
+        node = service_node("s1", self.iworkflow, "service1")
+        node.operations[workflows.CREATE_OPERATION]['inputs'][
+            workflows.INPUT_VARS] = [{"name": "v",
+                                      "value": {"get_secret": "secret1"}}]
+
+        # when
+        self.run_workflow([self.iworkflow, node])
+
+        # then
+        item = create_services.call_args[0][1][0]
+        self.assertEqual(item[bulk.KEY_VARS],
+                         [{"name": "v", "value": "pass1"}])
+
+    def test_evaluation_failure(self, create_services, iter_services, sync):
+        # given
+        node = service_node("s1", self.iworkflow, "service1")
+        node.properties[service.KEY_TENANT_NAME] = {"get_secret": "missing"}
+
+        # when
+        with self.assertRaises(NonRecoverableError) as cm:
+            self.run_workflow([self.iworkflow, node])
+
+        # then
+        self.assertIn("Node s1", str(cm.exception))
+        create_services.assert_not_called()
+
+    def test_up_to_date_skipped(self, create_services, iter_services, sync):
+        # given
+        iter_services.return_value = [{"name": "service1", "error": None},
+                                      {"name": "service2", "error": None}]
+        nodes = [self.iworkflow,
+                 service_node("s1", self.iworkflow, "service1", instances=[
+                     _Instance("s1_1", {service.RUNTIME_PAYLOAD_HASH:
+                                        payload_hash("service1")})]),
+                 service_node("s2", self.iworkflow, "service2"),
+                 service_node("s3", self.iworkflow, "service3")]
+
+        # when
+        ctx = self.run_workflow(nodes)
+
+        # then
+        batch = create_services.call_args[0][1]
+        self.assertEqual([(item[bulk.KEY_SERVICE_NAME], item[bulk.KEY_UPDATE])
+                          for item in batch], [("service3", False)])
+        for instance_id, service_name in (("s1_1", "service1"),
+                                          ("s2_1", "service2")):
+            self.assertEqual(ctx.runtime_properties(instance_id), {
+                service.RUNTIME_PAYLOAD_HASH: payload_hash(service_name),
+                workflows.RUNTIME_BATCH_RESULT: {
+                    "status": workflows.STATUS_UP_TO_DATE, "error": None}})
+
+    def test_changed_or_errored_updated(self, create_services, iter_services,
+                                        sync):
+        # given
+        iter_services.return_value = [{"name": "service1", "error": None},
+                                      {"name": "service2", "error": "bad"}]
+        nodes = [self.iworkflow,
+                 service_node("s1", self.iworkflow, "service1", instances=[
+                     _Instance("s1_1", {service.RUNTIME_PAYLOAD_HASH:
+                                        "other"})]),
+                 service_node("s2", self.iworkflow, "service2")]
+
+        # when
+        self.run_workflow(nodes)
+
+        # then
+        batch = create_services.call_args[0][1]
+        self.assertEqual([(item[bulk.KEY_SERVICE_NAME], item[bulk.KEY_UPDATE])
+                          for item in batch],
+                         [("service1", True), ("service2", True)])
+
+    def test_result_written_back(self, create_services, iter_services, sync):
+        # given
+        create_services.side_effect = lambda tenant, batch, params, **kw: [
+            bulk.BulkResult("service1", bulk.STATUS_CREATED, None),
+            bulk.BulkResult("service2", bulk.STATUS_FAILED, "boom")]
+        nodes = [self.iworkflow,
+                 service_node("s1", self.iworkflow, "service1", instances=[
+                     _Instance("s1_1"), _Instance("s1_2")]),
+                 service_node("s2", self.iworkflow, "service2", instances=[
+                     _Instance("s2_1", {service.RUNTIME_PAYLOAD_HASH:
+                                        "old", "kept": 1})])]
+        ctx = _Context(nodes, [i for n in nodes for i in n.instances],
+                       {"secret1": "pass1"})
+
+        # when
+        with current_workflow_ctx.push(ctx):
+            with self.assertRaises(NonRecoverableError) as cm:
+                workflows.batch_create_services(ctx)
+
+        # then
+        self.assertIn("service2 (boom)", str(cm.exception))
+        for instance_id in ("s1_1", "s1_2"):
+            self.assertEqual(ctx.runtime_properties(instance_id), {
+                service.RUNTIME_PAYLOAD_HASH: payload_hash("service1"),
+                workflows.RUNTIME_BATCH_RESULT: {
+                    "status": bulk.STATUS_CREATED, "error": None}})
+        self.assertEqual(ctx.runtime_properties("s2_1"), {
+            "kept": 1,
+            workflows.RUNTIME_BATCH_RESULT: {
+                "status": bulk.STATUS_FAILED, "error": "boom"}})
+
+    def test_sync_once_per_bigip(self, create_services, iter_services, sync):
+        # given
+        nodes = [self.iworkflow,
+                 service_node("s1", self.iworkflow, "service1",
+                              bigip_ip="10.0.0.1"),
+                 service_node("s2", self.iworkflow, "service2",
+                              bigip_ip="10.0.0.1"),
+                 service_node("s3", self.iworkflow, "service3",
+                              bigip_ip="10.0.0.2"),
+                 service_node("s4", self.iworkflow, "service4")]
+
+        # when
+        self.run_workflow(nodes, retry_interval=5)
+
+        # then
+        self.assertEqual(
+            [(args[0][service.PARAMS_IP], args[1])
+             for args, _ in sync.call_args_list],
+            [("10.0.0.1", 5), ("10.0.0.2", 5)])
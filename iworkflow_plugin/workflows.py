@@ -0,0 +1,310 @@
+########
+# Copyright (c) 2017 GigaSpaces Technologies Ltd. All rights reserved
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#        http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+#    * WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#    * See the License for the specific language governing permissions and
+#    * limitations under the License.
+
+from collections import OrderedDict
+
+from cloudify import manager
+from cloudify.exceptions import NonRecoverableError
+
+from iworkflow_plugin import IWORKFLOW_NODE_TYPE, sdk_logging
+from iworkflow_plugin.service import (KEY_SERVICE_NAME,
+                                      KEY_TEMPLATE_NAME,
+                                      KEY_TENANT_NAME,
+                                      KEY_USE_EXTERNAL_RESOURCE,
+                                      PARAMS_IP,
+                                      PARAMS_SYNC_GROUP,
+                                      PROBE_CREATE,
+                                      PROBE_KEEP,
+                                      PROBE_UPDATE,
+                                      RUNTIME_PAYLOAD_HASH,
+                                      _sync)
+from iworkflow_sdk import bulk, iworkflow, listing, payload
+
+SERVICE_NODE_TYPE = 'cloudify.iworkflow.Service'
+CREATE_OPERATION = 'cloudify.interfaces.lifecycle.create'
+CONTAINED_IN = 'cloudify.relationships.contained_in'
+
+INPUT_VARS = 'vars'
+INPUT_TABLES = 'tables'
+INPUT_PROPERTIES = 'properties'
+INPUT_BIGIP_PARAMS = 'bigip_params'
+INPUT_REFERENCE_HOSTNAME = 'reference_hostname'
+
+RUNTIME_BATCH_RESULT = 'batch_result'
+
+STATUS_UP_TO_DATE = 'up_to_date'
+
+
+@sdk_logging
+def batch_create_services(ctx,
+                          concurrency=bulk.DEFAULT_CONCURRENCY,
+                          poll_interval=bulk.DEFAULT_POLL_INTERVAL,
+                          timeout=bulk.DEFAULT_TIMEOUT,
+                          retry_interval=10):
+    """
+    Creates the services of all cloudify.iworkflow.Service node instances
+    of the deployment in one go: the services of each tenant of an
+    iWorkflow are created concurrently and polled together, the result of
+    each instance is stored in its runtime properties, and every BIG-IP
+    is synced once at the end.
+    Existing services are kept, updated or created by the same rule as
+    the create operation, so a later install finds them all up to date.
+    Services of nodes with use_external_resource are only checked to
+    exist. The intrinsic functions of the node properties and create
+    inputs are evaluated by the manager, as for an operation.
+    """
+    failed = []
+    to_sync = OrderedDict()
+
+    groups, connections = _group_services(ctx)
+    for (iworkflow_node_id, tenant_name), entries in groups.items():
+        connection_params = connections[iworkflow_node_id]
+        listed = _list_services(tenant_name, connection_params, ctx)
+
+        to_create = []
+        for instances, inputs, item, payload_hash, external in entries:
+            if external:
+                # adopted as is, never created
+                result = _adopt(tenant_name, item, listed)
+                for instance in instances:
+                    _store_result(ctx, instance, None, result.status,
+                                  result.error)
+                if result.error:
+                    failed.append(result)
+                continue
+
+            probe = _probe(instances, item, payload_hash, listed)
+            if probe == PROBE_KEEP:
+                for instance in instances:
+                    _store_result(ctx, instance, payload_hash,
+                                  STATUS_UP_TO_DATE)
+            else:
+                item[bulk.KEY_UPDATE] = probe == PROBE_UPDATE
+                to_create.append((instances, inputs, item, payload_hash))
+
+        ctx.logger.info("Creating or updating {0} services of tenant {1}, "
+                        "{2} are up to date or external".format(
+                            len(to_create), tenant_name,
+                            len(entries) - len(to_create)))
+        if not to_create:
+            continue
+        results = bulk.create_services(
+            tenant_name,
+            [item for _, _, item, _ in to_create],
+            connection_params,
+            concurrency=concurrency,
+            poll_interval=poll_interval,
+            timeout=timeout)
+
+        for (instances, inputs, _, payload_hash), result in \
+                zip(to_create, results):
+            created = result.status == bulk.STATUS_CREATED
+            for instance in instances:
+                _store_result(ctx, instance,
+                              payload_hash if created else None,
+                              result.status, result.error)
+            if not created:
+                failed.append(result)
+                continue
+            bigip_params = inputs.get(INPUT_BIGIP_PARAMS)
+            if bigip_params:
+                to_sync[(bigip_params.get(PARAMS_IP),
+                         bigip_params.get(PARAMS_SYNC_GROUP))] = bigip_params
+
+    for bigip_params in to_sync.values():
+        ctx.logger.info("Syncing {0} to {1}".format(
+            bigip_params.get(PARAMS_IP),
+            bigip_params.get(PARAMS_SYNC_GROUP)))
+        _sync(bigip_params, retry_interval)
+
+    if failed:
+        raise NonRecoverableError(
+            "Failed creating services: {0}".format(", ".join(
+                "{0} ({1})".format(result.service_name,
+                                   result.error or result.status)
+                for result in failed)))
+
+
+def _group_services(ctx):
+    """
+    Returns the services of the Service nodes of the deployment, grouped by
+    the id of their iWorkflow node and tenant, each with the node instances
+    it belongs to, its create inputs, its bulk item and the hash of its
+    payload, along with the connection params of each iWorkflow node.
+    """
+    groups = OrderedDict()
+    connections = {}
+    for node in ctx.nodes:
+        if SERVICE_NODE_TYPE not in node.type_hierarchy:
+            continue
+
+        # all instances of a node stand for the same service
+        instances = [_get_instance(ctx, node_instance.id)
+                     for node_instance in node.instances]
+        evaluated = _evaluate(ctx, node, {
+            'properties': node.properties,
+            'inputs': node.operations.get(CREATE_OPERATION, {}).get(
+                'inputs', {})})
+        properties = evaluated['properties']
+        inputs = evaluated['inputs']
+
+        tenant_name = properties.get(KEY_TENANT_NAME)
+        service_name = properties.get(KEY_SERVICE_NAME)
+        template_name = properties.get(KEY_TEMPLATE_NAME)
+        if not (tenant_name and service_name and template_name):
+            raise NonRecoverableError(
+                "Node {0}: tenant name, service name and template name "
+                "are required".format(node.id))
+
+        iworkflow_node = _get_iworkflow_node(node)
+        if iworkflow_node.id not in connections:
+            connections[iworkflow_node.id] = _evaluate(
+                ctx, iworkflow_node, iworkflow_node.properties)
+        item = {
+            bulk.KEY_SERVICE_NAME: service_name,
+            bulk.KEY_TEMPLATE_NAME: template_name,
+            bulk.KEY_VARS: inputs.get(INPUT_VARS, []),
+            bulk.KEY_TABLES: inputs.get(INPUT_TABLES, []),
+            bulk.KEY_PROPERTIES: inputs.get(INPUT_PROPERTIES, []),
+            bulk.KEY_REFERENCE_HOSTNAME: inputs.get(INPUT_REFERENCE_HOSTNAME)
+        }
+        # serialized once for both its hash and the request
+        item[bulk.KEY_BODY] = iworkflow.IWorkflowService(
+            tenant_name,
+            service_name,
+            connections[iworkflow_node.id]).serialize_payload(
+                template_name,
+                item[bulk.KEY_VARS],
+                item[bulk.KEY_TABLES],
+                item[bulk.KEY_PROPERTIES],
+                item[bulk.KEY_REFERENCE_HOSTNAME])
+        payload_hash = payload.body_hash(item[bulk.KEY_BODY])
+
+        groups.setdefault((iworkflow_node.id, tenant_name), []).append(
+            (instances, inputs, item, payload_hash,
+             properties.get(KEY_USE_EXTERNAL_RESOURCE)))
+    return groups, connections
+
+
+def _evaluate(ctx, node, value):
+    """
+    Evaluates the intrinsic functions of the value (get_secret,
+    get_attribute, concat...) in the context of the first instance of
+    the node, as the manager does for the inputs of an operation.
+    """
+    context = {}
+    for node_instance in node.instances:
+        context['self'] = node_instance.id
+        break
+    try:
+        if ctx.local:
+            return ctx.internal.handler.storage.env.evaluate_functions(
+                payload=value, context=context)
+        return manager.get_rest_client().evaluate.functions(
+            ctx.deployment.id, context, value)['payload']
+    except Exception as e:
+        raise NonRecoverableError(
+            "Node {0}: cannot evaluate the intrinsic functions of its "
+            "properties and inputs: {1}".format(node.id, e))
+
+
+def _probe(instances, item, payload_hash, listed):
+    """
+    Applies the rule of the probe of the create operation
+    to the listing of the tenant.
+
+    :return: PROBE_KEEP, PROBE_UPDATE or PROBE_CREATE
+    """
+    stored = set(instance.runtime_properties.get(RUNTIME_PAYLOAD_HASH)
+                 for instance in instances)
+    if listed is None or stored - set([None, payload_hash]):
+        return PROBE_UPDATE
+    service_name = item[bulk.KEY_SERVICE_NAME]
+    if service_name not in listed:
+        return PROBE_CREATE
+    if listed[service_name]:
+        return PROBE_UPDATE
+    return PROBE_KEEP
+
+
+def _adopt(tenant_name, item, listed):
+    service_name = item[bulk.KEY_SERVICE_NAME]
+    if listed is None:
+        error = "services of tenant {0} cannot be listed".format(tenant_name)
+    elif service_name not in listed:
+        error = "external service does not exist in tenant {0}".format(
+            tenant_name)
+    elif listed[service_name]:
+        error = "external service is deployed with an error: {0}".format(
+            listed[service_name])
+    else:
+        return bulk.BulkResult(service_name, STATUS_UP_TO_DATE, None)
+    return bulk.BulkResult(service_name, bulk.STATUS_FAILED, error)
+
+
+def _get_iworkflow_node(node):
+    for relationship in node.relationships:
+        if relationship.is_derived_from(CONTAINED_IN) and \
+                IWORKFLOW_NODE_TYPE in \
+                relationship.target_node.type_hierarchy:
+            return relationship.target_node
+    raise NonRecoverableError("Node {0} must have a 'contained_in' "
+                              "relationship to a node of type '{1}'"
+                              .format(node.id, IWORKFLOW_NODE_TYPE))
+
+
+def _list_services(tenant_name, connection_params, ctx):
+    """
+    Returns the error of each service of the tenant, keyed by name,
+    or None if they cannot be listed.
+    """
+    try:
+        return dict((service["name"], service["error"])
+                    for service in listing.iter_services(
+                        tenant_name, connection_params,
+                        fields=("name", "error")))
+    except Exception as e:
+        ctx.logger.warn("Cannot list the services of tenant {0}, all will "
+                        "be updated or created: {1}".format(tenant_name, e))
+        return None
+
+
+def _get_instance(ctx, instance_id):
+    if ctx.local:
+        return ctx.internal.handler.storage.get_node_instance(instance_id)
+    return manager.get_node_instance(instance_id)
+
+
+def _store_result(ctx, instance, payload_hash, status, error=None):
+    """
+    Stores the result of the batch and the payload hash the create
+    operation compares with in the runtime properties of the instance.
+    """
+    runtime_properties = dict(instance.runtime_properties)
+    runtime_properties[RUNTIME_BATCH_RESULT] = {"status": status,
+                                                "error": error}
+    if payload_hash:
+        runtime_properties[RUNTIME_PAYLOAD_HASH] = payload_hash
+    else:
+        runtime_properties.pop(RUNTIME_PAYLOAD_HASH, None)
+
+    if ctx.local:
+        ctx.internal.handler.storage.update_node_instance(
+            instance.id, instance.version,
+            runtime_properties=runtime_properties)
+    else:
+        instance.runtime_properties.clear()
+        instance.runtime_properties.update(runtime_properties)
+        manager.update_node_instance(instance)
@@ -0,0 +1,321 @@
+########
+# Copyright (c) 2017 GigaSpaces Technologies Ltd. All rights reserved
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#        http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+#    * WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#    * See the License for the specific language governing permissions and
+#    * limitations under the License.
+
+"""
+Non-blocking variants of IWorkflowService and sync.do_sync.
+
+Every operation returns a Future right away. Requests are sent by a small,
+bounded pool of I/O workers, while waiting between polls is done by the
+timers of a single event loop thread, so thousands of services and syncs can
+be in progress at once without holding a thread each.
+"""
+
+import heapq
+import itertools
+import logging
+import threading
+import time
+from multiprocessing.pool import ThreadPool
+
+from . import metrics
+from . import sync
+from . deadline import Deadline
+from . iworkflow import IWorkflowService, ENDPOINT_POLL
+from . exceptions import (IWorkflowNotFoundException,
+                          IWorkflowTimeoutException)
+from . import LOGGER_NAME
+
+DEFAULT_IO_WORKERS = 20
+
+logger = logging.getLogger(LOGGER_NAME)
+
+
+class Future(object):
+    """
+    Result of an asynchronous operation.
+    """
+
+    def __init__(self):
+        self._done = threading.Event()
+        self._lock = threading.Lock()
+        self._result = None
+        self._exception = None
+        self._callbacks = []
+
+    def done(self):
+        return self._done.is_set()
+
+    def result(self, timeout=None):
+        """
+        Waits for the operation and returns its result,
+        or raises the exception it failed with.
+        """
+        exception = self.exception(timeout)
+        if exception is not None:
+            raise exception
+        return self._result
+
+    def exception(self, timeout=None):
+        if not self._done.wait(timeout):
+            raise IWorkflowTimeoutException(
+                "Operation did not complete in {0}s".format(timeout))
+        return self._exception
+
+    def add_done_callback(self, callback):
+        """
+        Calls callback(future) once the future is done,
+        right away if it already is.
+        """
+        with self._lock:
+            if not self.done():
+                self._callbacks.append(callback)
+                return
+        callback(self)
+
+    def set_result(self, result):
+        self._complete(result, None)
+
+    def set_exception(self, exception):
+        self._complete(None, exception)
+
+    def _complete(self, result, exception):
+        with self._lock:
+            self._result = result
+            self._exception = exception
+            self._done.set()
+            callbacks, self._callbacks = self._callbacks, []
+        for callback in callbacks:
+            try:
+                callback(self)
+            except Exception:
+                logger.exception("Future callback failed")
+
+
+class EventLoop(object):
+    """
+    Runs timer callbacks on a single thread and requests
+    on a bounded pool of I/O workers.
+    """
+
+    def __init__(self, io_workers=DEFAULT_IO_WORKERS):
+        self._timers = []
+        self._sequence = itertools.count()
+        self._condition = threading.Condition()
+        self._running = True
+        self._pool = ThreadPool(io_workers)
+        self._thread = threading.Thread(target=self._run,
+                                        name="iworkflow-event-loop")
+        self._thread.daemon = True
+        self._thread.start()
+
+    def call_later(self, delay, callback, *args):
+        with self._condition:
+            heapq.heappush(self._timers, (time.time() + delay,
+                                          next(self._sequence),
+                                          callback,
+                                          args))
+            self._condition.notify()
+
+    def run_in_io(self, func, *args):
+        """
+        Runs a blocking call on an I/O worker.
+
+        :return: Future of the call's result
+        """
+        future = Future()
+
+        def run():
+            try:
+                future.set_result(func(*args))
+            except Exception as e:
+                future.set_exception(e)
+
+        self._pool.apply_async(run)
+        return future
+
+    def stop(self):
+        with self._condition:
+            self._running = False
+            self._condition.notify()
+        self._thread.join()
+        self._pool.close()
+        self._pool.join()
+
+    def _run(self):
+        while True:
+            with self._condition:
+                while self._running and not self._is_due():
+                    timeout = None
+                    if self._timers:
+                        timeout = self._timers[0][0] - time.time()
+                    self._condition.wait(timeout)
+                if not self._running:
+                    return
+                _, _, callback, args = heapq.heappop(self._timers)
+            try:
+                callback(*args)
+            except Exception:
+                logger.exception("Event loop callback failed")
+
+    def _is_due(self):
+        return bool(self._timers) and self._timers[0][0] <= time.time()
+
+
+_loop = None
+_loop_lock = threading.Lock()
+
+
+def get_event_loop():
+    """
+    Returns the event loop shared by the process, starting it if needed.
+    """
+    global _loop
+    with _loop_lock:
+        if _loop is None:
+            _loop = EventLoop()
+        return _loop
+
+
+class AsyncIWorkflowService(object):
+    """
+    Non-blocking counterpart of IWorkflowService.
+    Requests and responses are handled by an IWorkflowService,
+    which stays available as `blocking` for synchronous callers.
+    """
+
+    def __init__(self, tenant_name, service_name, connection_params,
+                 loop=None):
+        self.blocking = IWorkflowService(tenant_name,
+                                         service_name,
+                                         connection_params)
+        self.loop = loop or get_event_loop()
+
+    @property
+    def service_name(self):
+        return self.blocking.service_name
+
+    def create_service(self,
+                       template_name,
+                       vars,
+                       tables,
+                       properties,
+                       reference_hostname,
+                       deadline=None):
+        return self.loop.run_in_io(self.blocking.create_service,
+                                   template_name,
+                                   vars,
+                                   tables,
+                                   properties,
+                                   reference_hostname,
+                                   deadline)
+
+    def poll_service(self, deadline=None):
+        return self.loop.run_in_io(self.blocking.poll_service, deadline)
+
+    def delete_service(self, deadline=None):
+        return self.loop.run_in_io(self.blocking.delete_service, deadline)
+
+    def wait_for_service(self, retry_interval, timeout):
+        """
+        Polls the service every retry_interval seconds until it exists.
+
+        :param timeout: seconds, None to wait without limit
+        :return: Future failing with IWorkflowTimeoutException when the
+                 service does not exist after timeout seconds
+        """
+        result = Future()
+        deadline = Deadline(timeout)
+
+        def poll():
+            self.poll_service(deadline).add_done_callback(on_poll)
+
+        def on_poll(future):
+            exception = future.exception()
+            if exception is None:
+                result.set_result(None)
+            elif not isinstance(exception, IWorkflowNotFoundException):
+                result.set_exception(exception)
+            elif deadline.remaining() is not None and \
+                    retry_interval > deadline.remaining():
+                result.set_exception(IWorkflowTimeoutException(
+                    "Service {0} has not been created in {1}s".format(
+                        self.service_name, timeout)))
+            else:
+                metrics.registry.record_retry(ENDPOINT_POLL)
+                self.loop.call_later(retry_interval, poll)
+
+        poll()
+        return result
+
+
+def do_sync_async(ip,
+                  sync_group,
+                  user,
+                  password,
+                  retry_timer,
+                  auth_mode=None,
+                  token_cache_dir=None,
+                  timeout=sync.DEFAULT_SYNC_TIMEOUT,
+                  connect_timeout=sync.DEFAULT_CONNECT_TIMEOUT,
+                  read_timeout=sync.DEFAULT_READ_TIMEOUT,
+                  loop=None):
+    """
+    Non-blocking counterpart of sync.do_sync.
+
+    :return: Future done once the sync group is in sync
+    """
+    loop = loop or get_event_loop()
+    policy = sync.get_status_policy(retry_timer, timeout)
+    http_session = sync.HttpSession(user, password, auth_mode,
+                                    token_cache_dir,
+                                    connect_timeout=connect_timeout,
+                                    read_timeout=read_timeout)
+    result = Future()
+
+    def check_status(active_ip, started_at, attempt):
+        loop.run_in_io(sync.get_active_status,
+                       http_session,
+                       active_ip,
+                       ip).add_done_callback(
+            lambda future: on_status(started_at, attempt, future))
+
+    def on_status(started_at, attempt, future):
+        try:
+            active_ip, status = future.result()
+            logger.info("Status: {0}: {1}".format(status.status,
+                                                  status.summary))
+            sync.check_status(status, policy, started_at)
+        except Exception as e:
+            result.set_exception(e)
+            return
+
+        if status.in_sync:
+            result.set_result(status)
+        else:
+            loop.call_later(min(policy.interval(attempt),
+                                policy.remaining(started_at)),
+                            check_status, active_ip, started_at, attempt + 1)
+
+    def on_started(future):
+        if future.exception() is not None:
+            result.set_exception(future.exception())
+        else:
+            check_status(future.result(), time.time(), 0)
+
+    loop.run_in_io(sync.start_sync,
+                   http_session,
+                   ip,
+                   sync_group).add_done_callback(on_started)
+    return result
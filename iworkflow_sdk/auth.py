@@ -0,0 +1,254 @@
+########
+# Copyright (c) 2017 GigaSpaces Technologies Ltd. All rights reserved
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#        http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+#    * WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#    * See the License for the specific language governing permissions and
+#    * limitations under the License.
+
+import fcntl
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+
+from requests import codes
+from requests.auth import AuthBase
+from requests.compat import urlparse
+
+from . exceptions import IWorkflowAuthException
+from . import LOGGER_NAME
+
+LOGIN_ENDPOINT = "/mgmt/shared/authn/login"
+TOKEN_HEADER = "X-F5-Auth-Token"
+
+AUTH_MODE_BASIC = "basic"
+AUTH_MODE_TOKEN = "token"
+
+DEFAULT_LOGIN_PROVIDER = "tmos"
+DEFAULT_TOKEN_TIMEOUT = 1200
+# a token is refreshed this many seconds before it expires
+EXPIRY_MARGIN = 60
+
+KEY_TOKEN = "token"
+KEY_EXPIRATION_MICROS = "expirationMicros"
+KEY_TIMEOUT = "timeout"
+KEY_EXPIRES = "expires"
+
+log = logging.getLogger(LOGGER_NAME)
+
+
+class TokenCache(object):
+    """
+    Two-tier cache of authentication tokens.
+    Tokens are kept in memory and, when a directory is given, also on disk
+    so that separate processes on the same host share one token.
+    Disk access is guarded by an exclusive file lock.
+    """
+
+    def __init__(self, cache_dir=None):
+        self.cache_dir = cache_dir
+        self._tokens = {}
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._tokens.get(key)
+            if _is_valid(entry):
+                return entry[KEY_TOKEN]
+
+            entry = self._read(key)
+            if _is_valid(entry):
+                self._tokens[key] = entry
+                return entry[KEY_TOKEN]
+            return None
+
+    def set(self, key, token, expires):
+        entry = {KEY_TOKEN: token, KEY_EXPIRES: expires}
+        with self._lock:
+            self._tokens[key] = entry
+            self._write(key, entry)
+
+    def invalidate(self, key, token):
+        """
+        Drops the token from both tiers, unless it has already been
+        replaced with a newer one.
+        """
+        with self._lock:
+            entry = self._tokens.get(key)
+            if entry and entry[KEY_TOKEN] == token:
+                del self._tokens[key]
+            disk_entry = self._read(key)
+            if disk_entry and disk_entry[KEY_TOKEN] == token:
+                self._write(key, None)
+
+    def _path(self, key):
+        name = hashlib.sha1(
+            "|".join(str(part) for part in key).encode("utf-8")).hexdigest()
+        return os.path.join(self.cache_dir, "{0}.token".format(name))
+
+    def _read(self, key):
+        if not self.cache_dir:
+            return None
+        path = self._path(key)
+        if not os.path.exists(path):
+            return None
+        try:
+            with open(path, "r") as token_file:
+                fcntl.flock(token_file, fcntl.LOCK_SH)
+                try:
+                    content = token_file.read()
+                finally:
+                    fcntl.flock(token_file, fcntl.LOCK_UN)
+            return json.loads(content) if content else None
+        except (IOError, ValueError):
+            log.debug("Cannot read token cache file {0}".format(path))
+            return None
+
+    def _write(self, key, entry):
+        if not self.cache_dir:
+            return
+        if not os.path.isdir(self.cache_dir):
+            os.makedirs(self.cache_dir, 0o700)
+        path = self._path(key)
+        fd = os.open(path, os.O_WRONLY | os.O_CREAT, 0o600)
+        with os.fdopen(fd, "w") as token_file:
+            fcntl.flock(token_file, fcntl.LOCK_EX)
+            try:
+                token_file.truncate()
+                if entry:
+                    token_file.write(json.dumps(entry))
+                token_file.flush()
+            finally:
+                fcntl.flock(token_file, fcntl.LOCK_UN)
+
+
+_caches = {}
+_caches_lock = threading.Lock()
+
+
+def get_token_cache(cache_dir=None):
+    """
+    Returns the process-wide token cache for the given disk directory
+    (or the memory-only one when no directory is given).
+    """
+    cache_dir = cache_dir or None
+    with _caches_lock:
+        cache = _caches.get(cache_dir)
+        if cache is None:
+            cache = TokenCache(cache_dir)
+            _caches[cache_dir] = cache
+        return cache
+
+
+class TokenAuth(AuthBase):
+    """
+    Authenticates requests with an X-F5-Auth-Token obtained through
+    LOGIN_ENDPOINT. The token is taken from the cache while it is valid,
+    and a request rejected with 401 is retried once with a new token.
+    """
+
+    def __init__(self,
+                 user,
+                 password,
+                 session,
+                 cache,
+                 verify=False,
+                 login_provider=None,
+                 timeout=None):
+        self.user = user
+        self.password = password
+        self.session = session
+        self.cache = cache
+        self.verify = verify
+        self.login_provider = login_provider or DEFAULT_LOGIN_PROVIDER
+        self.timeout = timeout
+
+    def __call__(self, request):
+        request.headers[TOKEN_HEADER] = self.get_token(_base_url(request))
+        request.register_hook("response", self._handle_401)
+        return request
+
+    def get_token(self, base_url):
+        token = self.cache.get(self._cache_key(base_url))
+        if token is None:
+            token = self._login(base_url)
+        return token
+
+    def _cache_key(self, base_url):
+        return (base_url, self.user, self.login_provider)
+
+    def _login(self, base_url):
+        log.debug("Requesting token for user {0} from {1}".format(
+            self.user, base_url))
+        resp = self.session.post(
+            url="{0}{1}".format(base_url, LOGIN_ENDPOINT),
+            json={
+                "username": self.user,
+                "password": self.password,
+                "loginProviderName": self.login_provider
+            },
+            verify=self.verify,
+            timeout=self.timeout)
+
+        if resp.status_code != codes.ok:
+            raise IWorkflowAuthException(
+                "Login failed with HTTP response code = {0}".format(
+                    resp.status_code))
+        try:
+            token_json = resp.json().get(KEY_TOKEN)
+            token = token_json[KEY_TOKEN]
+        except Exception:
+            raise IWorkflowAuthException("No token in the login response")
+
+        self.cache.set(self._cache_key(base_url), token,
+                       _expires(token_json))
+        return token
+
+    def _handle_401(self, resp, **kwargs):
+        request = resp.request
+        if resp.status_code != codes.unauthorized or \
+                getattr(request, "_token_retried", False):
+            return resp
+
+        # consume the content so the connection goes back to the pool
+        resp.content
+        resp.close()
+
+        base_url = _base_url(request)
+        self.cache.invalidate(self._cache_key(base_url),
+                              request.headers.get(TOKEN_HEADER))
+        retry = request.copy()
+        retry._token_retried = True
+        retry.headers[TOKEN_HEADER] = self._login(base_url)
+
+        new_resp = resp.connection.send(retry, **kwargs)
+        new_resp.history.append(resp)
+        new_resp.request = retry
+        return new_resp
+
+
+def _base_url(request):
+    url = urlparse(request.url)
+    return "{0}://{1}".format(url.scheme, url.netloc)
+
+
+def _expires(token_json):
+    if token_json.get(KEY_EXPIRATION_MICROS):
+        return token_json[KEY_EXPIRATION_MICROS] / 1000000.0
+    timeout = token_json.get(KEY_TIMEOUT) or DEFAULT_TOKEN_TIMEOUT
+    return time.time() + timeout
+
+
+def _is_valid(entry):
+    return bool(entry) and \
+        entry.get(KEY_EXPIRES, 0) - EXPIRY_MARGIN > time.time()
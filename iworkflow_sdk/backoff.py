@@ -0,0 +1,59 @@
+########
+# Copyright (c) 2017 GigaSpaces Technologies Ltd. All rights reserved
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#        http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+#    * WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#    * See the License for the specific language governing permissions and
+#    * limitations under the License.
+
+import random
+import time
+
+DEFAULT_INITIAL_INTERVAL = 1
+DEFAULT_MAX_INTERVAL = 60
+DEFAULT_MULTIPLIER = 2
+DEFAULT_TIMEOUT = 1800
+
+
+class BackoffPolicy(object):
+    """
+    Exponential backoff with full jitter and an overall deadline.
+    The n-th wait (counted from 0) is a random value between 0 and
+    min(max_interval, initial_interval * multiplier ** n), so that pollers
+    started together drift apart instead of retrying in lockstep.
+    """
+
+    def __init__(self,
+                 initial_interval=DEFAULT_INITIAL_INTERVAL,
+                 max_interval=DEFAULT_MAX_INTERVAL,
+                 multiplier=DEFAULT_MULTIPLIER,
+                 timeout=DEFAULT_TIMEOUT):
+        self.initial_interval = initial_interval
+        self.max_interval = max_interval
+        self.multiplier = multiplier
+        self.timeout = timeout
+
+    def interval(self, attempt):
+        return random.uniform(0, self.max_wait(attempt))
+
+    def max_wait(self, attempt):
+        # the exponent is bounded to avoid huge powers on long polls
+        return min(self.max_interval,
+                   self.initial_interval * self.multiplier ** min(attempt, 64))
+
+    def remaining(self, started_at):
+        """
+        :param started_at: epoch time at which the polling started
+        :return: seconds left before the deadline, negative when passed
+        """
+        return started_at + self.timeout - time.time()
+
+    def expired(self, started_at):
+        return self.remaining(started_at) <= 0
@@ -0,0 +1,273 @@
+########
+# Copyright (c) 2017 GigaSpaces Technologies Ltd. All rights reserved
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#        http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+#    * WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#    * See the License for the specific language governing permissions and
+#    * limitations under the License.
+
+import logging
+import time
+from collections import namedtuple
+from multiprocessing.pool import ThreadPool
+
+from . deadline import Deadline
+from . iworkflow import IWorkflowService, ENDPOINT_POLL
+from . exceptions import (IWorkflowNotFoundException,
+                          IWorkflowTimeoutException)
+from . import metrics
+from . import LOGGER_NAME
+
+KEY_SERVICE_NAME = "service_name"
+KEY_TEMPLATE_NAME = "template_name"
+KEY_VARS = "vars"
+KEY_TABLES = "tables"
+KEY_PROPERTIES = "properties"
+KEY_REFERENCE_HOSTNAME = "reference_hostname"
+KEY_UPDATE = "update"
+KEY_BODY = "body"
+
+STATUS_CREATED = "created"
+STATUS_DELETED = "deleted"
+STATUS_FAILED = "failed"
+STATUS_TIMED_OUT = "timed_out"
+
+DEFAULT_CONCURRENCY = 10
+DEFAULT_POLL_INTERVAL = 10
+DEFAULT_TIMEOUT = 1800
+
+logger = logging.getLogger(LOGGER_NAME)
+
+BulkResult = namedtuple("BulkResult", ["service_name", "status", "error"])
+
+
+def create_services(tenant_name,
+                    batch,
+                    connection_params,
+                    reference_hostname=None,
+                    concurrency=DEFAULT_CONCURRENCY,
+                    poll_interval=DEFAULT_POLL_INTERVAL,
+                    timeout=DEFAULT_TIMEOUT):
+    """
+    Creates many services of one tenant.
+    Create requests are sent by at most `concurrency` threads at a time,
+    after which all accepted services are polled together, one round
+    every `poll_interval` seconds, until `timeout` seconds (None for no
+    limit) have passed.
+
+    :param tenant_name: tenant the services belong to
+    :param batch: list of dicts, each with 'service_name', 'template_name',
+                  'vars', 'tables', 'properties' and, optionally,
+                  'reference_hostname', 'update', set to replace a
+                  service that may exist already rather than create it,
+                  and 'body', the payload already serialized by
+                  IWorkflowService.serialize_payload
+    :param connection_params: iWorkflow connection parameters
+    :param reference_hostname: default reference hostname of the items
+    :return: list of BulkResult, in the order of the batch
+    """
+    services = [IWorkflowService(tenant_name,
+                                 item[KEY_SERVICE_NAME],
+                                 connection_params)
+                for item in batch]
+    results = [None] * len(batch)
+    to_create = list(range(len(batch)))
+
+    if connection_params.get("validate_templates"):
+        # fail the invalid items before any of the batch is sent
+        to_create = []
+        for idx, (service, item) in enumerate(zip(services, batch)):
+            error = _validate(service, item)
+            if error:
+                results[idx] = _result(service, STATUS_FAILED, error)
+            else:
+                to_create.append(idx)
+
+    pool = ThreadPool(max(1, min(concurrency, len(batch))))
+    try:
+        created = pool.map(
+            _create,
+            [(services[idx], batch[idx], reference_hostname)
+             for idx in to_create])
+
+        pending = []
+        for idx, error in zip(to_create, created):
+            if error:
+                results[idx] = _result(services[idx], STATUS_FAILED, error)
+            else:
+                pending.append(idx)
+
+        deadline = Deadline(timeout)
+        while pending:
+            polled = pool.map(_poll, [(services[idx], deadline)
+                                      for idx in pending])
+            still_pending = []
+            for idx, (done, error) in zip(pending, polled):
+                if error:
+                    results[idx] = _result(services[idx], STATUS_FAILED,
+                                           error)
+                elif done:
+                    results[idx] = _result(services[idx], STATUS_CREATED)
+                else:
+                    metrics.registry.record_retry(ENDPOINT_POLL)
+                    still_pending.append(idx)
+            pending = still_pending
+
+            if pending and _out_of_time(deadline, poll_interval):
+                break
+            if pending:
+                logger.info("{0} services not created yet, "
+                            "retry in {1}s".format(len(pending),
+                                                   poll_interval))
+                time.sleep(poll_interval)
+    finally:
+        pool.close()
+        pool.join()
+
+    for idx in pending:
+        results[idx] = _result(services[idx], STATUS_TIMED_OUT)
+
+    return results
+
+
+def delete_services(tenant_name,
+                    service_names,
+                    connection_params,
+                    concurrency=DEFAULT_CONCURRENCY,
+                    poll_interval=DEFAULT_POLL_INTERVAL,
+                    timeout=DEFAULT_TIMEOUT):
+    """
+    Deletes many services of one tenant.
+    Delete requests are sent by at most `concurrency` threads at a time.
+    Removal is then confirmed by listing the services of the tenant,
+    one listing every `poll_interval` seconds for all of them,
+    until `timeout` seconds (None for no limit) have passed.
+    Services that do not exist are reported as deleted.
+
+    :return: list of BulkResult, in the order of service_names
+    """
+    services = [IWorkflowService(tenant_name, service_name, connection_params)
+                for service_name in service_names]
+    results = [None] * len(services)
+    if not services:
+        return results
+
+    pool = ThreadPool(max(1, min(concurrency, len(services))))
+    try:
+        deleted = pool.map(_delete, services)
+    finally:
+        pool.close()
+        pool.join()
+
+    pending = []
+    for idx, error in enumerate(deleted):
+        if error:
+            results[idx] = _result(services[idx], STATUS_FAILED, error)
+        else:
+            pending.append(idx)
+
+    deadline = Deadline(timeout)
+    while pending:
+        try:
+            listed = services[pending[0]].list_service_names(deadline)
+        except IWorkflowTimeoutException:
+            break
+        except Exception as e:
+            logger.warn("Cannot list the services of tenant {0}: "
+                        "{1}".format(tenant_name, e))
+            listed = None
+
+        if listed is not None:
+            still_pending = []
+            for idx in pending:
+                if services[idx].service_name in listed:
+                    still_pending.append(idx)
+                else:
+                    results[idx] = _result(services[idx], STATUS_DELETED)
+            pending = still_pending
+
+        if pending and _out_of_time(deadline, poll_interval):
+            break
+        if pending:
+            logger.info("{0} services not deleted yet, "
+                        "retry in {1}s".format(len(pending), poll_interval))
+            time.sleep(poll_interval)
+
+    for idx in pending:
+        results[idx] = _result(services[idx], STATUS_TIMED_OUT)
+
+    return results
+
+
+def _validate(service, item):
+    try:
+        service.validate_service(item[KEY_TEMPLATE_NAME],
+                                 item.get(KEY_VARS, []),
+                                 item.get(KEY_TABLES, []))
+        return None
+    except Exception as e:
+        return str(e)
+
+
+def _create(args):
+    service, item, reference_hostname = args
+    payload_args = (item[KEY_TEMPLATE_NAME],
+                    item.get(KEY_VARS, []),
+                    item.get(KEY_TABLES, []),
+                    item.get(KEY_PROPERTIES, []),
+                    item.get(KEY_REFERENCE_HOSTNAME, reference_hostname))
+    body = item.get(KEY_BODY)
+    try:
+        if item.get(KEY_UPDATE):
+            try:
+                service.update_service(*payload_args, body=body)
+                return None
+            except IWorkflowNotFoundException:
+                logger.info("Service {0} does not exist, creating it".format(
+                    service.service_name))
+        service.create_service(*payload_args, body=body)
+        return None
+    except Exception as e:
+        return str(e)
+
+
+def _delete(service):
+    try:
+        service.delete_service()
+        return None
+    except IWorkflowNotFoundException:
+        return None
+    except Exception as e:
+        return str(e)
+
+
+def _poll(args):
+    service, deadline = args
+    try:
+        service.poll_service(deadline)
+        return True, None
+    except (IWorkflowNotFoundException, IWorkflowTimeoutException):
+        # left pending, reported as timed out if it stays so
+        return False, None
+    except Exception as e:
+        return False, str(e)
+
+
+def _result(service, status, error=None):
+    return BulkResult(service.service_name, status, error)
+
+
+def _out_of_time(deadline, poll_interval):
+    """
+    Returns whether another poll round does not fit in the deadline,
+    never for a deadline without limit.
+    """
+    remaining = deadline.remaining()
+    return remaining is not None and poll_interval > remaining
@@ -0,0 +1,74 @@
+########
+# Copyright (c) 2017 GigaSpaces Technologies Ltd. All rights reserved
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#        http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+#    * WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#    * See the License for the specific language governing permissions and
+#    * limitations under the License.
+
+import time
+
+from . exceptions import IWorkflowTimeoutException
+
+DEFAULT_CONNECT_TIMEOUT = 10
+DEFAULT_READ_TIMEOUT = 60
+
+
+class Deadline(object):
+    """
+    Point in time by which an operation has to be done.
+    It is handed down to every request of the operation,
+    each of which waits at most for the time that is left.
+    """
+
+    def __init__(self, timeout=None):
+        """
+        :param timeout: seconds from now, None for no deadline
+        """
+        self.timeout = timeout
+        self.expires_at = None if timeout is None else time.time() + timeout
+
+    def remaining(self):
+        """
+        :return: seconds left, never negative, None for no deadline
+        """
+        if self.expires_at is None:
+            return None
+        return max(0, self.expires_at - time.time())
+
+    @property
+    def expired(self):
+        return self.remaining() == 0
+
+    def check(self, action):
+        if self.expired:
+            raise IWorkflowTimeoutException(
+                "Deadline of {0}s exceeded before {1}".format(self.timeout,
+                                                              action))
+
+
+def get_timeout(connect_timeout=DEFAULT_CONNECT_TIMEOUT,
+                read_timeout=DEFAULT_READ_TIMEOUT,
+                deadline=None):
+    """
+    Returns the (connect, read) timeout of a request,
+    both shortened to what is left of the deadline.
+    """
+    remaining = deadline.remaining() if deadline else None
+    if remaining is None:
+        return connect_timeout, read_timeout
+    return (_shorten(connect_timeout, remaining),
+            _shorten(read_timeout, remaining))
+
+
+def _shorten(timeout, remaining):
+    # requests does not accept a zero timeout
+    remaining = max(remaining, 0.001)
+    return remaining if timeout is None else min(timeout, remaining)
@@ -22,5 +22,21 @@ class IWorkflowNotFoundException(IWorkflowException):
     pass
 
 
+class IWorkflowTimeoutException(IWorkflowException):
+    pass
+
+
+class IWorkflowAuthException(IWorkflowException):
+    pass
+
+
+class IWorkflowValidationException(IWorkflowException):
+    pass
+
+
 class BigipSyncException(Exception):
     pass
+
+
+class BigipSyncTimeoutException(BigipSyncException):
+    pass
@@ -13,18 +13,40 @@
 #    * See the License for the specific language governing permissions and
 #    * limitations under the License.
 
-import json
-import requests
 from requests.auth import HTTPBasicAuth
 from requests import codes
 import logging
 
-import payload
-import sync
-from . exceptions import (IWorkflowException, IWorkflowNotFoundException)
+from . import auth
+from . import metrics
+from . import payload
+from . import sessions
+from . import templates
+from . import tenant_poller
+from . deadline import (get_timeout,
+                        DEFAULT_CONNECT_TIMEOUT,
+                        DEFAULT_READ_TIMEOUT)
+from . exceptions import (IWorkflowException,
+                          IWorkflowNotFoundException,
+                          IWorkflowValidationException)
 from . import LOGGER_NAME
 
 SERVICE_ENDPOINT = "/mgmt/cm/cloud/tenants/{0}/services/iapp/"
+TEMPLATE_ENDPOINT = payload.TENANT_TEMPLATE_REFERENCE_ENDPOINT
+
+# names the requests are recorded under in the metrics
+ENDPOINT_CREATE = "create"
+ENDPOINT_UPDATE = "update"
+ENDPOINT_POLL = "poll"
+ENDPOINT_LIST = "list"
+ENDPOINT_TEMPLATE = "template"
+ENDPOINT_DELETE = "delete"
+
+# bytes of a payload logged at debug level
+DEFAULT_PAYLOAD_LOG_BUDGET = 4096
+
+# the only fields of a service document polling reads
+POLL_FIELDS = ("name", "generation", "error", "selfLink")
 
 logger = logging.getLogger(LOGGER_NAME)
 
@@ -36,50 +58,183 @@ class IWorkflowService:
         self.service_name = service_name
         self.connection_params = connection_params
         self.sslVerify = False
+        self.generation = None
+        self.self_link = None
+        # ETag of the last polled version of the service, sent back to
+        # revalidate it; may be restored from a former run, in which case
+        # that version was deployed without error
+        self.etag = None
+        self._poll_error = None
 
     def create_service(self,
                        template_name,
                        vars,
                        tables,
                        properties,
-                       reference_hostname):
-
-        data = payload.create_payload(self.tenant_name,
-                                      self.service_name,
-                                      template_name,
-                                      vars,
-                                      tables,
-                                      properties,
-                                      self._get_proto(),
-                                      reference_hostname,
-                                      self.connection_params.get("port"))
+                       reference_hostname,
+                       deadline=None,
+                       body=None):
+        """
+        :param deadline: deadline.Deadline limiting the time
+                         spent on the requests
+        :param body: the payload as returned by serialize_payload,
+                     to send it without serializing it again
+        """
+        body = self._prepare_body(template_name,
+                                  vars,
+                                  tables,
+                                  properties,
+                                  reference_hostname,
+                                  deadline,
+                                  body)
 
-        logger.debug("Payload = {0}".format(json.dumps(data)))
-
-        create_response = self._send_create_request(data)
+        create_response = self._send_create_request(
+            body, self._get_timeout(deadline, "creating the service"))
 
         if create_response.status_code == codes.ok:
             logger.info("Create returns 200 OK")
+            self._invalidate_status_cache()
             return
         error = self._retrive_error_message(create_response, "message")
         raise IWorkflowException(
             'Error received while polling service: {0}'.format(error)
         )
 
-    def poll_service(self):
+    def update_service(self,
+                       template_name,
+                       vars,
+                       tables,
+                       properties,
+                       reference_hostname,
+                       deadline=None,
+                       body=None):
+        """
+        Replaces the definition of a deployed service.
+
+        :param deadline: deadline.Deadline limiting the time
+                         spent on the requests
+        :param body: the payload as returned by serialize_payload,
+                     to send it without serializing it again
+        """
+        body = self._prepare_body(template_name,
+                                  vars,
+                                  tables,
+                                  properties,
+                                  reference_hostname,
+                                  deadline,
+                                  body)
+
+        update_response = self._send_update_request(
+            body, self._get_timeout(deadline, "updating the service"))
+
+        code = update_response.status_code
+        if code == codes.ok:
+            logger.info("Update returns 200 OK")
+            # the last polled version is outdated
+            self._remember_version(None, None)
+            self._invalidate_status_cache()
+            return
+        error = self._retrive_error_message(update_response, "message")
+        if code == codes.not_found:
+            raise IWorkflowNotFoundException(
+                "Cannot update service {0}: {1}".format(self.service_name,
+                                                        error))
+        raise IWorkflowException(
+            'Error received while updating service: {0}'.format(error)
+        )
+
+    def validate_service(self, template_name, vars, tables, deadline=None):
+        """
+        Checks vars and tables against the template definition,
+        which is cached and only downloaded again when it has changed.
+        """
+        index = templates.catalog.get(
+            (self._get_base_url(), template_name),
+            template_name,
+            lambda etag: self._send_template_request(
+                template_name,
+                etag,
+                self._get_timeout(deadline, "getting the template")))
+
+        errors = index.validate(vars, tables)
+        if errors:
+            raise IWorkflowValidationException(
+                "Invalid input for template {0}: {1}".format(
+                    template_name, "; ".join(errors)))
+
+    def get_payload_hash(self,
+                         template_name,
+                         vars,
+                         tables,
+                         properties,
+                         reference_hostname):
+        """
+        Returns the hash of the payload create_service would send,
+        to tell whether a deployed service is up to date.
+        """
+        return payload.body_hash(self.serialize_payload(template_name,
+                                                        vars,
+                                                        tables,
+                                                        properties,
+                                                        reference_hostname))
+
+    def serialize_payload(self,
+                          template_name,
+                          vars,
+                          tables,
+                          properties,
+                          reference_hostname):
+        """
+        Returns the payload create_service would send, serialized.
+        Its hash (payload.body_hash) and the request can share it.
+        """
+        return payload.serialize_payload(self._create_payload(
+            template_name,
+            vars,
+            tables,
+            properties,
+            reference_hostname))
+
+    def service_exists(self, deadline=None):
+        """
+        Returns whether the service is deployed,
+        raises if it is deployed with an error.
+        """
+        try:
+            self.poll_service(deadline)
+            return True
+        except IWorkflowNotFoundException:
+            return False
+
+    def poll_service(self, deadline=None):
         logger.info("Poll service started")
-        get_response = self._send_get_request()
+        if self.connection_params.get("status_cache_ttl"):
+            return self._poll_service_from_collection(deadline)
+
+        get_response = self._send_get_request(
+            self.etag, self._get_timeout(deadline, "polling the service"))
 
         code = get_response.status_code
 
-        if code == codes.ok:
+        if code == codes.not_modified and self.etag:
+            logger.debug("Service {0} has not changed".format(
+                self.service_name))
+            error = self._poll_error
+            if error:
+                raise IWorkflowException(
+                    'Error received while polling service: {0}'.format(error)
+                )
+            return
+        elif code == codes.ok:
             error = self._retrive_error_message(get_response, "error")
+            self._remember_version(get_response, error)
             if error:
                 raise IWorkflowException(
                     'Error received while polling service: {0}'.format(error)
                 )
             return
         elif code == codes.not_found:
+            self._remember_version(None, None)
             error = self._retrive_error_message(get_response, "message")
             raise IWorkflowNotFoundException(
                 'Error received while polling service: {0}'.format(error)
@@ -89,60 +244,229 @@ class IWorkflowService:
             "An unexpected HTTP response code = {} has been received"
             .format(code))
 
-    def delete_service(self):
-        delete_response = self._send_delete_request()
+    def _remember_version(self, resp, error):
+        self.etag = None
+        self._poll_error = error
+        self.generation = None
+        self.self_link = None
+        if resp is not None:
+            self.etag = resp.headers.get(templates.HEADER_ETAG)
+            try:
+                doc = resp.json()
+                self.generation = doc.get("generation")
+                self.self_link = doc.get("selfLink")
+            except Exception:
+                logger.debug("No generation in the response")
+
+    def _get_status_poller(self):
+        return tenant_poller.get_poller(
+            self._get_base_url(),
+            self.connection_params.get("user"),
+            self.tenant_name,
+            self.connection_params.get("status_cache_ttl"))
+
+    def _invalidate_status_cache(self):
+        """
+        Drops the cached collection of the tenant, which no longer
+        reflects the service once it has been requested.
+        """
+        if self.connection_params.get("status_cache_ttl"):
+            self._get_status_poller().invalidate()
+
+    def _poll_service_from_collection(self, deadline=None):
+        service = self._get_status_poller().get_service(
+            self.service_name,
+            lambda: self._send_list_request(
+                self._get_timeout(deadline, "listing the services")))
+        if service is None:
+            self._remember_version(None, None)
+            raise IWorkflowNotFoundException(
+                'Error received while polling service: '
+                'service {0} not found'.format(self.service_name))
+
+        self.generation = service.get("generation")
+        self.self_link = service.get("selfLink")
+        error = service.get("error")
+        if error:
+            raise IWorkflowException(
+                'Error received while polling service: {0}'.format(error)
+            )
+
+    def delete_service(self, deadline=None):
+        delete_response = self._send_delete_request(
+            self._get_timeout(deadline, "deleting the service"))
 
         code = delete_response.status_code
 
         if code == codes.ok:
             logger.info("Service {0} deleted".format(self.service_name))
+            self._invalidate_status_cache()
             return
+        elif code == codes.not_found:
+            raise IWorkflowNotFoundException(
+                "Cannot delete service {0}: it does not exist".format(
+                    self.service_name))
         else:
             raise IWorkflowException(
                 "Cannot delete service {0}".format(self.service_name))
 
-    def _send_create_request(self, data):
-        url = self._create_url()
-        logger.info(url)
-        return requests.post(url=url,
-                             json=data,
-                             headers=self._get_headers(),
-                             auth=self._get_auth(),
-                             verify=self.sslVerify)
-
-    def _send_get_request(self):
-        url = self._get_url()
-        logger.info(url)
-        return requests.get(url=url,
-                            headers=self._get_headers(),
-                            auth=self._get_auth(),
-                            verify=self.sslVerify)
+    def list_service_names(self, deadline=None):
+        """
+        Returns the names of all services of the tenant,
+        listed with a single request.
+        """
+        list_response = self._send_list_request(
+            self._get_timeout(deadline, "listing the services"))
+
+        if list_response.status_code != codes.ok:
+            raise IWorkflowException(
+                "An unexpected HTTP response code = {0} has been received "
+                "while listing the services of tenant {1}".format(
+                    list_response.status_code, self.tenant_name))
+        items = list_response.json().get("items") or []
+        return set(item.get("name") for item in items)
+
+    def list_services_page(self, top, skip, fields=None, deadline=None):
+        """
+        Returns one page of the services of the tenant, at most `top` of
+        them after the first `skip`, holding only `fields` when given.
+        The service name is not used, it may be None.
+        """
+        page_response = self._send_page_request(
+            top, skip, fields,
+            self._get_timeout(deadline, "listing the services"))
+
+        if page_response.status_code != codes.ok:
+            raise IWorkflowException(
+                "An unexpected HTTP response code = {0} has been received "
+                "while listing the services of tenant {1}".format(
+                    page_response.status_code, self.tenant_name))
+        return page_response.json().get("items") or []
+
+    def _prepare_body(self,
+                      template_name,
+                      vars,
+                      tables,
+                      properties,
+                      reference_hostname,
+                      deadline=None,
+                      body=None):
+        """
+        Validates the input if enabled and returns the serialized payload,
+        unless it has been serialized already.
+        """
+        if self.connection_params.get("validate_templates"):
+            self.validate_service(template_name, vars, tables, deadline)
+
+        if body is None:
+            body = self.serialize_payload(template_name,
+                                          vars,
+                                          tables,
+                                          properties,
+                                          reference_hostname)
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug(u"Payload = {0}".format(payload.preview(
+                body,
+                self.connection_params.get("payload_log_budget",
+                                           DEFAULT_PAYLOAD_LOG_BUDGET))))
+        return body
+
+    def _create_payload(self,
+                        template_name,
+                        vars,
+                        tables,
+                        properties,
+                        reference_hostname):
+        return payload.create_payload(self.tenant_name,
+                                      self.service_name,
+                                      template_name,
+                                      vars,
+                                      tables,
+                                      properties,
+                                      self._get_proto(),
+                                      reference_hostname,
+                                      self.connection_params.get("port"))
+
+    def _send_create_request(self, body, timeout=None):
+        return self._send(ENDPOINT_CREATE, "POST", self._create_url(),
+                          timeout, data=body)
+
+    def _send_update_request(self, body, timeout=None):
+        return self._send(ENDPOINT_UPDATE, "PUT", self._get_url(),
+                          timeout, data=body)
+
+    def _send_get_request(self, etag=None, timeout=None):
+        headers = self._get_headers()
+        if etag:
+            headers[templates.HEADER_IF_NONE_MATCH] = etag
+        return self._send(ENDPOINT_POLL, "GET",
+                          self._select(self._get_url()),
+                          timeout, headers=headers)
+
+    def _send_list_request(self, timeout=None):
+        return self._send(ENDPOINT_LIST, "GET",
+                          self._select(self._create_url()),
+                          timeout)
+
+    def _send_page_request(self, top, skip, fields=None, timeout=None):
+        url = "{0}?$top={1}&$skip={2}".format(self._create_url(), top, skip)
+        if fields:
+            url = "{0}&$select={1}".format(url, ",".join(fields))
+        return self._send(ENDPOINT_LIST, "GET", url, timeout)
 
-    def _send_delete_request(self):
-        url = self._get_url()
+    def _send_template_request(self, template_name, etag=None,
+                               timeout=None):
+        url = "{0}{1}{2}".format(self._get_base_url(),
+                                 TEMPLATE_ENDPOINT,
+                                 template_name)
+        headers = self._get_headers()
+        if etag:
+            headers[templates.HEADER_IF_NONE_MATCH] = etag
+        return self._send(ENDPOINT_TEMPLATE, "GET", url,
+                          timeout, headers=headers)
+
+    def _send_delete_request(self, timeout=None):
+        return self._send(ENDPOINT_DELETE, "DELETE", self._get_url(),
+                          timeout)
+
+    def _send(self, endpoint, method, url, timeout, headers=None, **kwargs):
+        """
+        Sends a request, recording it in the metrics
+        under the endpoint name.
+        """
         logger.info(url)
-        return requests.delete(url=url,
-                               headers=self._get_headers(),
-                               auth=self._get_auth(),
-                               verify=self.sslVerify)
+        return metrics.registry.observe(
+            endpoint,
+            lambda: self._get_session().request(
+                method,
+                url=url,
+                headers=headers or self._get_headers(),
+                auth=self._get_auth(timeout),
+                verify=self.sslVerify,
+                timeout=timeout,
+                **kwargs))
 
     def _create_url(self):
         endpoint = SERVICE_ENDPOINT.format(self.tenant_name)
-        return "{0}://{1}:{2}{3}".format(
-            self._get_proto(),
-            self.connection_params.get("ip"),
-            self.connection_params.get("port"),
-            endpoint)
+        return "{0}{1}".format(self._get_base_url(), endpoint)
 
     def _get_url(self):
         endpoint = SERVICE_ENDPOINT.format(self.tenant_name)
-        return "{0}://{1}:{2}{3}{4}".format(
-            self._get_proto(),
-            self.connection_params.get("ip"),
-            self.connection_params.get("port"),
+        return "{0}{1}{2}".format(
+            self._get_base_url(),
             endpoint,
             self.service_name)
 
+    @staticmethod
+    def _select(url):
+        return "{0}?$select={1}".format(url, ",".join(POLL_FIELDS))
+
+    def _get_base_url(self):
+        return "{0}://{1}:{2}".format(
+            self._get_proto(),
+            self.connection_params.get("ip"),
+            self.connection_params.get("port"))
+
     @staticmethod
     def _get_headers():
         return {
@@ -150,7 +474,38 @@ class IWorkflowService:
             'Cache-Control': "no-cache"
         }
 
-    def _get_auth(self):
+    def _get_session(self):
+        return sessions.get_session(self.connection_params.get("ip"),
+                                    self.connection_params.get("port"),
+                                    self.connection_params.get("user"),
+                                    self.connection_params.get("use_ssl"),
+                                    self.connection_params.get("pool_size"))
+
+    def _get_timeout(self, deadline, action):
+        """
+        Returns the (connect, read) timeout of the next request,
+        raises if the deadline has passed already.
+        """
+        if deadline:
+            deadline.check(action)
+        return get_timeout(
+            self.connection_params.get("connect_timeout",
+                                       DEFAULT_CONNECT_TIMEOUT),
+            self.connection_params.get("read_timeout",
+                                       DEFAULT_READ_TIMEOUT),
+            deadline)
+
+    def _get_auth(self, timeout=None):
+        if self.connection_params.get("auth_mode") == auth.AUTH_MODE_TOKEN:
+            return auth.TokenAuth(
+                self.connection_params.get("user"),
+                self.connection_params.get("password"),
+                self._get_session(),
+                auth.get_token_cache(
+                    self.connection_params.get("token_cache_dir")),
+                verify=self.sslVerify,
+                login_provider=self.connection_params.get("login_provider"),
+                timeout=timeout)
         return HTTPBasicAuth(self.connection_params.get("user"),
                              self.connection_params.get("password"))
 
@@ -176,5 +531,32 @@ class IWorkflowService:
              sync_group,
              user,
              password,
-             retry_timer):
-        sync.do_sync(bigip_ip, sync_group, user, password, retry_timer)
+             retry_timer,
+             auth_mode=None,
+             token_cache_dir=None,
+             coalesce=False,
+             debounce=None,
+             connect_timeout=DEFAULT_CONNECT_TIMEOUT,
+             read_timeout=DEFAULT_READ_TIMEOUT,
+             deadline=None):
+        # the BIG-IP modules are only loaded by the operations syncing
+        from . import sync, sync_coalescer
+
+        if coalesce:
+            if debounce is None:
+                debounce = sync_coalescer.DEFAULT_DEBOUNCE
+            sync_coalescer.coalesced_sync(bigip_ip, sync_group, user,
+                                          password, retry_timer,
+                                          auth_mode=auth_mode,
+                                          token_cache_dir=token_cache_dir,
+                                          debounce=debounce,
+                                          connect_timeout=connect_timeout,
+                                          read_timeout=read_timeout,
+                                          deadline=deadline)
+        else:
+            sync.do_sync(bigip_ip, sync_group, user, password, retry_timer,
+                         auth_mode=auth_mode,
+                         token_cache_dir=token_cache_dir,
+                         connect_timeout=connect_timeout,
+                         read_timeout=read_timeout,
+                         deadline=deadline)
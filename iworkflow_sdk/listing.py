@@ -0,0 +1,63 @@
+########
+# Copyright (c) 2017 GigaSpaces Technologies Ltd. All rights reserved
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#        http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+#    * WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#    * See the License for the specific language governing permissions and
+#    * limitations under the License.
+
+import logging
+
+from . iworkflow import IWorkflowService
+from . import LOGGER_NAME
+
+DEFAULT_PAGE_SIZE = 100
+
+logger = logging.getLogger(LOGGER_NAME)
+
+
+def iter_services(tenant_name,
+                  connection_params,
+                  fields=None,
+                  page_size=DEFAULT_PAGE_SIZE,
+                  deadline=None):
+    """
+    Yields the services of a tenant, requesting them `page_size` at a time
+    with $top and $skip, so that only one page is held in memory however
+    many services the tenant has. Nothing is requested until the first
+    service is read.
+
+    :param tenant_name: tenant the services belong to
+    :param connection_params: iWorkflow connection parameters
+    :param fields: names of the fields to request with $select,
+                   all fields when None
+    :param page_size: number of services requested at a time
+    :param deadline: deadline.Deadline limiting the time
+                     spent on the requests
+    :return: generator of dicts, holding only `fields` when given
+    """
+    if page_size < 1:
+        raise ValueError("page_size must be positive, got {0}".format(
+            page_size))
+
+    client = IWorkflowService(tenant_name, None, connection_params)
+    skip = 0
+    while True:
+        items = client.list_services_page(page_size, skip, fields, deadline)
+        logger.debug("Fetched {0} services of tenant {1} from {2}".format(
+            len(items), tenant_name, skip))
+        for item in items:
+            if fields:
+                item = dict((field, item.get(field)) for field in fields)
+            yield item
+
+        if len(items) < page_size:
+            return
+        skip += len(items)
@@ -0,0 +1,371 @@
+########
+# Copyright (c) 2017 GigaSpaces Technologies Ltd. All rights reserved
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#        http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+#    * WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#    * See the License for the specific language governing permissions and
+#    * limitations under the License.
+
+"""
+Request metrics of the SDK.
+
+Every request sent to iWorkflow or BIG-IP is recorded in the process-wide
+`registry` under a short endpoint name (create, poll, delete, list,
+template, device, save, sync, status), together with its status code and
+latency. The registry can be read as a dict, summarized for the requests of
+one operation, or added to a Prometheus textfile for node_exporter.
+"""
+
+import copy
+import os
+import re
+import tempfile
+import threading
+import time
+
+try:
+    import fcntl
+except ImportError:
+    # no flock, e.g. on Windows agents
+    fcntl = None
+
+# upper bounds of the latency histogram buckets, in seconds
+BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, float("inf"))
+
+CODE_ERROR = "error"
+
+KEY_REQUESTS = "requests"
+KEY_LATENCY = "latency"
+KEY_RETRIES = "retries"
+KEY_SYNC_WAIT = "sync_wait"
+KEY_COUNT = "count"
+KEY_ERRORS = "errors"
+KEY_SECONDS = "seconds"
+KEY_SUM = "sum"
+KEY_BUCKETS = "buckets"
+
+PREFIX = "iworkflow"
+
+# a sample line of the textfile: name{labels} value
+SAMPLE_LINE = re.compile(r'^(\w+)(?:\{(.*)\})? (\S+)$')
+SAMPLE_LABEL = re.compile(r'(\w+)="([^"]*)"')
+
+
+class MetricsRegistry(object):
+    """
+    Counters and latency histograms, safe to update from many threads.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self._requests = {}
+            self._latency = {}
+            self._retries = {}
+            self._sync_wait = _histogram()
+            # metrics already added to the textfile by write_textfile
+            self._written = _empty()
+
+    def observe(self, endpoint, send):
+        """
+        Calls send() and records the response it returns,
+        or the exception it raises.
+
+        :param endpoint: name of the endpoint the request is sent to
+        :param send: callable sending the request
+        :return: the response
+        """
+        started_at = time.time()
+        code = CODE_ERROR
+        try:
+            resp = send()
+            code = str(resp.status_code)
+            return resp
+        finally:
+            self.record_request(endpoint, code, time.time() - started_at)
+
+    def record_request(self, endpoint, code, duration):
+        with self._lock:
+            key = (endpoint, code)
+            self._requests[key] = self._requests.get(key, 0) + 1
+            _observe(self._latency.setdefault(endpoint, _histogram()),
+                     duration)
+
+    def record_retry(self, endpoint):
+        with self._lock:
+            self._retries[endpoint] = self._retries.get(endpoint, 0) + 1
+
+    def record_sync_wait(self, duration):
+        with self._lock:
+            _observe(self._sync_wait, duration)
+
+    def snapshot(self):
+        """
+        :return: dict copy of every metric
+        """
+        with self._lock:
+            return {
+                KEY_REQUESTS: dict(self._requests),
+                KEY_LATENCY: copy.deepcopy(self._latency),
+                KEY_RETRIES: dict(self._retries),
+                KEY_SYNC_WAIT: copy.deepcopy(self._sync_wait)
+            }
+
+    def summary(self, since=None):
+        """
+        Sums up the requests recorded after a snapshot,
+        e.g. those of one operation.
+
+        :param since: snapshot taken before, None to sum up everything
+        :return: dict of requests per endpoint, retries per endpoint
+                 and the time spent waiting for syncs
+        """
+        now = self.snapshot()
+        since = since or _empty()
+
+        requests = {}
+        for (endpoint, code), count in now[KEY_REQUESTS].items():
+            count -= since[KEY_REQUESTS].get((endpoint, code), 0)
+            if not count:
+                continue
+            entry = requests.setdefault(endpoint, {KEY_COUNT: 0,
+                                                   KEY_ERRORS: 0,
+                                                   KEY_SECONDS: 0})
+            entry[KEY_COUNT] += count
+            if code == CODE_ERROR or int(code) >= 400:
+                entry[KEY_ERRORS] += count
+        for endpoint, entry in requests.items():
+            seconds = now[KEY_LATENCY][endpoint][KEY_SUM] - \
+                since[KEY_LATENCY].get(endpoint, {}).get(KEY_SUM, 0)
+            entry[KEY_SECONDS] = round(seconds, 3)
+
+        retries = {}
+        for endpoint, count in now[KEY_RETRIES].items():
+            count -= since[KEY_RETRIES].get(endpoint, 0)
+            if count:
+                retries[endpoint] = count
+
+        return {
+            KEY_REQUESTS: requests,
+            KEY_RETRIES: retries,
+            KEY_SYNC_WAIT: round(now[KEY_SYNC_WAIT][KEY_SUM] -
+                                 since[KEY_SYNC_WAIT][KEY_SUM], 3)
+        }
+
+    def to_prometheus(self):
+        """
+        :return: every metric in the Prometheus text exposition format
+        """
+        return _render(self.snapshot())
+
+    def write_textfile(self, path):
+        """
+        Adds the metrics recorded since the last call to those in path, for
+        the node_exporter textfile collector. Each operation runs in its own
+        process, so the file sums up the processes that wrote to it and its
+        counters never go back. Writers are serialized with a lock file,
+        and the file is replaced at once, so it is never read half-written.
+        """
+        with _locked(path + ".lock"):
+            now = self.snapshot()
+            total = _add(_parse(path), _subtract(now, self._written))
+
+            directory = os.path.dirname(os.path.abspath(path))
+            fd, tmp_path = tempfile.mkstemp(dir=directory, suffix=".tmp")
+            try:
+                with os.fdopen(fd, "w") as textfile:
+                    textfile.write(_render(total))
+                os.chmod(tmp_path, 0o644)
+                os.rename(tmp_path, path)
+            except Exception:
+                os.remove(tmp_path)
+                raise
+            self._written = now
+
+
+class _locked(object):
+    """
+    Holds an exclusive flock on path, where flock is available.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.lock_file = None
+
+    def __enter__(self):
+        if fcntl is not None:
+            self.lock_file = open(self.path, "a")
+            fcntl.flock(self.lock_file, fcntl.LOCK_EX)
+
+    def __exit__(self, *exc_info):
+        if self.lock_file is not None:
+            fcntl.flock(self.lock_file, fcntl.LOCK_UN)
+            self.lock_file.close()
+
+
+def _empty():
+    return {KEY_REQUESTS: {}, KEY_LATENCY: {},
+            KEY_RETRIES: {}, KEY_SYNC_WAIT: _histogram()}
+
+
+def _combine(left, right, sign):
+    """
+    :return: left + right, or left - right with sign -1, metric by metric
+    """
+    result = copy.deepcopy(left)
+    for key in (KEY_REQUESTS, KEY_RETRIES):
+        for name, count in right[key].items():
+            result[key][name] = result[key].get(name, 0) + sign * count
+    for endpoint, histogram in right[KEY_LATENCY].items():
+        _add_histogram(result[KEY_LATENCY].setdefault(endpoint,
+                                                      _histogram()),
+                       histogram, sign)
+    _add_histogram(result[KEY_SYNC_WAIT], right[KEY_SYNC_WAIT], sign)
+    return result
+
+
+def _add(left, right):
+    return _combine(left, right, 1)
+
+
+def _subtract(left, right):
+    return _combine(left, right, -1)
+
+
+def _add_histogram(histogram, other, sign):
+    histogram[KEY_COUNT] += sign * other[KEY_COUNT]
+    histogram[KEY_SUM] += sign * other[KEY_SUM]
+    for idx, count in enumerate(other[KEY_BUCKETS]):
+        histogram[KEY_BUCKETS][idx] += sign * count
+
+
+def _render(metrics):
+    """
+    :return: the metrics in the Prometheus text exposition format
+    """
+    lines = [
+        "# HELP {0}_requests_total Requests sent, by endpoint and "
+        "status code.".format(PREFIX),
+        "# TYPE {0}_requests_total counter".format(PREFIX)]
+    for (endpoint, code), count in sorted(metrics[KEY_REQUESTS].items()):
+        lines.append('{0}_requests_total{{endpoint="{1}",code="{2}"}} '
+                     '{3}'.format(PREFIX, endpoint, code, count))
+
+    lines.extend([
+        "# HELP {0}_request_duration_seconds Latency of the requests, "
+        "by endpoint.".format(PREFIX),
+        "# TYPE {0}_request_duration_seconds histogram".format(PREFIX)])
+    for endpoint, histogram in sorted(metrics[KEY_LATENCY].items()):
+        lines.extend(_histogram_lines(
+            "{0}_request_duration_seconds".format(PREFIX),
+            'endpoint="{0}",'.format(endpoint),
+            histogram))
+
+    lines.extend([
+        "# HELP {0}_retries_total Requests repeated, by endpoint."
+        .format(PREFIX),
+        "# TYPE {0}_retries_total counter".format(PREFIX)])
+    for endpoint, count in sorted(metrics[KEY_RETRIES].items()):
+        lines.append('{0}_retries_total{{endpoint="{1}"}} {2}'.format(
+            PREFIX, endpoint, count))
+
+    lines.extend([
+        "# HELP {0}_sync_wait_seconds Time spent waiting for BIG-IP "
+        "syncs to complete.".format(PREFIX),
+        "# TYPE {0}_sync_wait_seconds histogram".format(PREFIX)])
+    lines.extend(_histogram_lines("{0}_sync_wait_seconds".format(PREFIX),
+                                  "",
+                                  metrics[KEY_SYNC_WAIT]))
+    return "\n".join(lines) + "\n"
+
+
+def _parse(path):
+    """
+    Reads back a textfile written by _render; samples it does not know,
+    e.g. of buckets that have changed, are ignored.
+
+    :return: the metrics of the file, empty if there is no file
+    """
+    metrics = _empty()
+    try:
+        with open(path) as textfile:
+            lines = textfile.read().splitlines()
+    except (IOError, OSError):
+        return metrics
+
+    bucket_index = dict((_le(bound), idx) for idx, bound in enumerate(BUCKETS))
+    for line in lines:
+        match = SAMPLE_LINE.match(line)
+        if not match:
+            continue
+        name, labels, value = match.groups()
+        labels = dict(SAMPLE_LABEL.findall(labels or ""))
+        name = name[len(PREFIX) + 1:] if name.startswith(PREFIX + "_") \
+            else None
+
+        if name == "requests_total":
+            metrics[KEY_REQUESTS][(labels.get("endpoint"),
+                                   labels.get("code"))] = int(value)
+        elif name == "retries_total":
+            metrics[KEY_RETRIES][labels.get("endpoint")] = int(value)
+        elif name and name.startswith("request_duration_seconds_"):
+            histogram = metrics[KEY_LATENCY].setdefault(
+                labels.get("endpoint"), _histogram())
+            _parse_histogram(histogram, name, labels, value, bucket_index)
+        elif name and name.startswith("sync_wait_seconds_"):
+            _parse_histogram(metrics[KEY_SYNC_WAIT], name, labels, value,
+                             bucket_index)
+    return metrics
+
+
+def _parse_histogram(histogram, name, labels, value, bucket_index):
+    if name.endswith("_bucket"):
+        idx = bucket_index.get(labels.get("le"))
+        if idx is not None:
+            histogram[KEY_BUCKETS][idx] = int(value)
+    elif name.endswith("_sum"):
+        histogram[KEY_SUM] = float(value)
+    elif name.endswith("_count"):
+        histogram[KEY_COUNT] = int(value)
+
+
+def _le(bound):
+    return "+Inf" if bound == float("inf") else repr(float(bound))
+
+
+def _histogram():
+    return {KEY_COUNT: 0, KEY_SUM: 0.0, KEY_BUCKETS: [0] * len(BUCKETS)}
+
+
+def _observe(histogram, value):
+    histogram[KEY_COUNT] += 1
+    histogram[KEY_SUM] += value
+    for idx, bound in enumerate(BUCKETS):
+        if value <= bound:
+            histogram[KEY_BUCKETS][idx] += 1
+
+
+def _histogram_lines(name, labels, histogram):
+    lines = []
+    for bound, count in zip(BUCKETS, histogram[KEY_BUCKETS]):
+        le = _le(bound)
+        lines.append('{0}_bucket{{{1}le="{2}"}} {3}'.format(
+            name, labels, le, count))
+    labels = "{{{0}}}".format(labels.rstrip(",")) if labels else ""
+    lines.append("{0}_sum{1} {2}".format(name, labels, histogram[KEY_SUM]))
+    lines.append("{0}_count{1} {2}".format(name, labels,
+                                           histogram[KEY_COUNT]))
+    return lines
+
+
+registry = MetricsRegistry()
@@ -13,6 +13,8 @@
 #    * See the License for the specific language governing permissions and
 #    * limitations under the License.
 
+import hashlib
+import json
 
 TENANT_TEMPLATE_REFERENCE_ENDPOINT = "/mgmt/cm/cloud/tenant/templates/iapp/"
 TENANT_REFERENCE_ENDPOINT = "/mgmt/cm/cloud/tenants/"
@@ -26,6 +28,13 @@ PAYLOAD_KEY_PROPERTIES = "properties"
 PAYLOAD_KEY_LINK = "link"
 
 
+# skeletons are cached per (tenant, template, proto, reference host),
+# the cache is dropped whenever it grows past this size
+MAX_CACHED_SKELETONS = 1024
+
+_skeletons = {}
+
+
 def create_payload(tenant_name,
                    service_name,
                    template_name,
@@ -36,25 +45,82 @@ def create_payload(tenant_name,
                    reference_hostname,
                    reference_port):
 
-    result = dict()
+    result = dict(_skeleton(tenant_name,
+                            template_name,
+                            proto,
+                            reference_hostname,
+                            reference_port))
 
-    result.update(_service_name(service_name))
-    result.update(_tenant_template_reference(template_name, proto,
-                                             reference_hostname,
-                                             reference_port))
-    result.update(_tenant_reference(tenant_name,
-                                    proto,
-                                    reference_hostname,
-                                    reference_port))
-    result.update(_vars(vars))
-    result.update(_tables(tables))
-    result.update(_properties(properties))
+    result[PAYLOAD_KEY_NAME] = service_name
+    result[PAYLOAD_KEY_VARS] = vars
+    result[PAYLOAD_KEY_TABLES] = tables
+    result[PAYLOAD_KEY_PROPERTIES] = properties
 
     return result
 
 
-def _service_name(service_name):
-    return {PAYLOAD_KEY_NAME: service_name}
+def serialize_payload(data):
+    """
+    Serializes a payload once, so that the same bytes are used
+    for its hash, logging, the request and its retries.
+    Keys are sorted, so the bytes do not depend on their order.
+    """
+    return json.dumps(data, sort_keys=True,
+                      separators=(',', ':')).encode('utf-8')
+
+
+def preview(body, budget):
+    """
+    Returns the text of a serialized payload for logging, cut to at most
+    `budget` bytes so that big payloads do not flood the logs.
+    A budget of 0 or None keeps the whole payload.
+    """
+    if budget and len(body) > budget:
+        return u"{0}... ({1} bytes truncated)".format(
+            body[:budget].decode('utf-8', 'ignore'), len(body) - budget)
+    return body.decode('utf-8')
+
+
+def payload_hash(data):
+    """
+    Returns a stable hash of the payload,
+    which does not depend on the order of its keys.
+    """
+    return body_hash(serialize_payload(data))
+
+
+def body_hash(body):
+    """
+    Returns the hash of a payload serialized by serialize_payload.
+    """
+    return hashlib.sha256(body).hexdigest()
+
+
+def _skeleton(tenant_name,
+              template_name,
+              proto,
+              reference_hostname,
+              reference_port):
+    """
+    Returns the part of the payload shared by all services of a tenant
+    deployed from the same template. It must not be modified.
+    """
+    key = (tenant_name, template_name, proto, reference_hostname)
+    skeleton = _skeletons.get(key)
+    if skeleton is None:
+        skeleton = dict()
+        skeleton.update(_tenant_template_reference(template_name,
+                                                   proto,
+                                                   reference_hostname,
+                                                   reference_port))
+        skeleton.update(_tenant_reference(tenant_name,
+                                          proto,
+                                          reference_hostname,
+                                          reference_port))
+        if len(_skeletons) >= MAX_CACHED_SKELETONS:
+            _skeletons.clear()
+        _skeletons[key] = skeleton
+    return skeleton
 
 
 def _tenant_template_reference(template_name,
@@ -86,15 +152,3 @@ def _tenant_reference(tenant_name, proto, reference_hostname, reference_port):
     }
 
     return {PAYLOAD_KEY_TENANT_REFERENCE: tenat_reference}
-
-
-def _vars(vars):
-    return {PAYLOAD_KEY_VARS: vars}
-
-
-def _tables(tables):
-    return {PAYLOAD_KEY_TABLES: tables}
-
-
-def _properties(properties):
-    return {PAYLOAD_KEY_PROPERTIES: properties}
@@ -0,0 +1,68 @@
+########
+# Copyright (c) 2017 GigaSpaces Technologies Ltd. All rights reserved
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#        http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+#    * WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#    * See the License for the specific language governing permissions and
+#    * limitations under the License.
+
+import threading
+
+import requests
+from requests.adapters import HTTPAdapter
+
+DEFAULT_POOL_SIZE = 10
+
+_lock = threading.Lock()
+_sessions = {}
+
+
+def get_session(ip, port, user, use_ssl, pool_size=None):
+    """
+    Returns a keep-alive session shared by every caller in the process
+    that talks to the same appliance as the same user.
+    Connections (and so their TLS sessions) are reused between requests
+    instead of doing a new TCP+TLS handshake for each of them.
+
+    :param ip: appliance address
+    :param port: appliance port
+    :param user: user the requests are sent as
+    :param use_ssl: whether https is used
+    :param pool_size: maximum number of kept-alive connections,
+                      only used when the session is created
+    :return: a requests.Session
+    """
+    key = (ip, str(port), user, bool(use_ssl))
+
+    with _lock:
+        session = _sessions.get(key)
+        if session is None:
+            session = _create_session(pool_size or DEFAULT_POOL_SIZE)
+            _sessions[key] = session
+        return session
+
+
+def close_sessions():
+    """
+    Closes all pooled sessions and empties the registry.
+    """
+    with _lock:
+        for session in _sessions.values():
+            session.close()
+        _sessions.clear()
+
+
+def _create_session(pool_size):
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=1,
+                          pool_maxsize=pool_size)
+    session.mount('https://', adapter)
+    session.mount('http://', adapter)
+    return session
@@ -1,8 +1,19 @@
 import requests
 import time
 import logging
-
-from . exceptions import BigipSyncException
+from collections import namedtuple
+
+from requests.auth import HTTPBasicAuth
+
+from . import auth
+from . import metrics
+from . import sessions
+from . import topology
+from . backoff import BackoffPolicy
+from . deadline import (get_timeout,
+                        DEFAULT_CONNECT_TIMEOUT,
+                        DEFAULT_READ_TIMEOUT)
+from . exceptions import BigipSyncException, BigipSyncTimeoutException
 from . import LOGGER_NAME
 
 BIGIP_SAVE_ENDPOINT = "/mgmt/tm/sys/config"
@@ -10,12 +21,6 @@ BIGIP_SYNC_ENDPOINT = "/mgmt/tm/cm/config-sync"
 BIGIP_DEVICE_ENDPOINT = "/mgmt/tm/cm/device"
 BIGIP_STATUS_ENDPOINT = "/mgmt/tm/cm/sync-status"
 
-BIGIP_FAILOVER_STATE = "failoverState"
-BIGIP_STANDBY_STATE = "standby"
-BIGIP_MGMT_IP = "managementIp"
-BIGIP_ACTIVE_STATE = "active"
-BIGIP_SELF_DEVICE = "selfDevice"
-BIGIP_ITEMS = "items"
 BIGIP_CMD = "command"
 BIGIP_CMD_SAVE = "save"
 BIGIP_CMD_RUN = "run"
@@ -26,131 +31,306 @@ BIGIP_NESTED_STATS = "nestedStats"
 BIGIP_STATUS = "status"
 BIGIP_SUMMARY = "summary"
 BIGIP_DESCRIPTION = "description"
+BIGIP_PORT = 443
+BIGIP_HEADERS = {'Content-Type': 'application/json'}
+BIGIP_COLOR = "color"
 BIGIP_IN_SYNC = "In Sync"
+# states a sync does not recover from without an intervention
+BIGIP_FAILED_STATES = ("Changes Pending", "Disconnected", "Sync Failure")
+
+DEFAULT_SYNC_TIMEOUT = 600
+
+# names the requests are recorded under in the metrics
+METRICS_ENDPOINTS = {
+    BIGIP_DEVICE_ENDPOINT: "device",
+    BIGIP_SAVE_ENDPOINT: "save",
+    BIGIP_SYNC_ENDPOINT: "sync",
+    BIGIP_STATUS_ENDPOINT: "status"
+}
 
 log = logging.getLogger(LOGGER_NAME)
 
+# device topology of the clusters synced by this process
+topology_cache = topology.TopologyCache()
+
+
+def do_sync(ip, sync_group, user, password, retry_timer,
+            auth_mode=None, token_cache_dir=None,
+            timeout=DEFAULT_SYNC_TIMEOUT,
+            connect_timeout=DEFAULT_CONNECT_TIMEOUT,
+            read_timeout=DEFAULT_READ_TIMEOUT,
+            deadline=None):
+    """
+    Saves and syncs the configuration of the group, then waits for it
+    to be in sync, polling at most every retry_timer seconds
+    for up to timeout seconds, or until the deadline if it comes first.
+    """
+    http_session = HttpSession(user, password, auth_mode, token_cache_dir,
+                               connect_timeout=connect_timeout,
+                               read_timeout=read_timeout,
+                               deadline=deadline)
+
+    active_ip = start_sync(http_session, ip, sync_group)
+
+    started_at = time.time()
+    try:
+        await_status(http_session, active_ip,
+                     get_status_policy(retry_timer, timeout, deadline),
+                     cluster_ip=ip)
+    finally:
+        metrics.registry.record_sync_wait(time.time() - started_at)
 
-def do_sync(ip, sync_group, user, password, retry_timer):
-    HttpSession.setup_session(user, password)
 
-    active_ip = _get_device(ip)
+def get_status_policy(retry_timer, timeout, deadline=None):
+    remaining = deadline.remaining() if deadline else None
+    if remaining is not None:
+        timeout = min(timeout, remaining)
+    return BackoffPolicy(initial_interval=min(1, retry_timer),
+                         max_interval=retry_timer,
+                         timeout=timeout)
 
-    _request_save(active_ip)
-    _request_sync(active_ip, sync_group)
 
-    _await_status(active_ip, retry_timer)
+def start_sync(http_session, ip, sync_group):
+    """
+    Saves the configuration of the active unit and requests
+    a config-sync of the group, without waiting for its completion.
 
+    :param http_session: HttpSession to send the requests with
+    :return: ip of the active unit, whose sync status is to be awaited
+    """
+    active_ip = _get_device(http_session, ip)
 
-def _get_device(ip):
-    resp = _do_get(ip, BIGIP_DEVICE_ENDPOINT)
+    endpoint = BIGIP_SAVE_ENDPOINT
+    try:
+        _request_save(http_session, active_ip)
+        endpoint = BIGIP_SYNC_ENDPOINT
+        _request_sync(http_session, active_ip, sync_group)
+    except BigipSyncTimeoutException:
+        raise
+    except (BigipSyncException, requests.RequestException) as e:
+        active_ip = _rediscover(http_session, ip, active_ip, endpoint, e)
+        _request_save(http_session, active_ip)
+        _request_sync(http_session, active_ip, sync_group)
 
-    return _determine_active_device(ip, resp)
+    return active_ip
 
 
-def _determine_active_device(current_ip, resp_devices):
-    try:
-        if _get_self_device(resp_devices)\
-                .get(BIGIP_FAILOVER_STATE) == \
-                BIGIP_STANDBY_STATE:
-            log.warn("Device is standby unit")
-            return next(
-                dev.get(BIGIP_MGMT_IP)
-                for dev in resp_devices.get(BIGIP_ITEMS)
-                if dev.get(BIGIP_FAILOVER_STATE) ==
-                BIGIP_ACTIVE_STATE
-                )
-        else:
-            return current_ip
-    except Exception:
-        raise BigipSyncException("Cannot find an active device")
+def _get_device(http_session, ip):
+    return topology_cache.get_active_ip(
+        ip,
+        lambda device_ip: http_session.get(device_ip,
+                                           BIGIP_DEVICE_ENDPOINT).json())
 
 
-def _get_self_device(devices):
-    self_device_idx = 0
+def _rediscover(http_session, ip, active_ip, endpoint, error):
+    """
+    Discovers the active unit of the cluster again after a request to the
+    cached one failed, as it may have failed over.
 
-    while True:
-        try:
-            if devices \
-                .get(BIGIP_ITEMS) \
-                .get(self_device_idx) \
-                .get(BIGIP_SELF_DEVICE) \
-                    == "true":
-                return devices.get(BIGIP_ITEMS).get(self_device_idx)
-            else:
-                self_device_idx = + 1
-        except Exception:
-            raise BigipSyncException("Cannot find an active device")
-
-
-def _request_save(ip):
+    :return: ip of the active unit
+    """
+    log.warn("Request to {0}{1} failed: {2}".format(
+        active_ip, endpoint, error))
+    topology_cache.invalidate(ip)
+    metrics.registry.record_retry(METRICS_ENDPOINTS[endpoint])
+    return _get_device(http_session, ip)
+
+
+def _request_save(http_session, ip):
     payload = dict()
     payload[BIGIP_CMD] = BIGIP_CMD_SAVE
 
-    _do_post(ip, BIGIP_SAVE_ENDPOINT, payload)
+    http_session.post(ip, BIGIP_SAVE_ENDPOINT, payload)
 
 
-def _request_sync(ip, sync_group):
+def _request_sync(http_session, ip, sync_group):
     payload = dict()
     payload[BIGIP_CMD] = BIGIP_CMD_RUN
     payload[BIGIP_CMD_UTIL_ARGS] = \
         BIGIP_SYNC_TO_GROUP.format(sync_group)
 
-    _do_post(ip, BIGIP_SAVE_ENDPOINT, payload)
-
+    http_session.post(ip, BIGIP_SYNC_ENDPOINT, payload)
 
-def _do_post(ip, endpoint, payload):
-    resp = HttpSession.session.post(
-        "https://{0}{1}".format(ip, endpoint),
-        json=payload
-    )
 
-    if resp.status_code != requests.codes.OK:
-        raise BigipSyncException("Received unsupported status code={}".format(
-            resp.status_code
-        ))
+def await_status(http_session, ip, policy, cluster_ip=None):
+    """
+    Polls the sync status of the device with the given backoff policy
+    until it is in sync.
+    Fails as soon as the status is a failure state,
+    or once the policy's timeout has passed.
 
-    return resp
+    :param http_session: HttpSession to send the requests with
+    :param policy: backoff.BackoffPolicy
+    :param cluster_ip: ip the device was discovered from, to discover the
+                       active unit again if a poll fails
+    """
+    started_at = time.time()
+    attempt = 0
 
-
-def _do_get(ip, endpoint):
-    resp = HttpSession.session.get("https://{0}{1}".format(ip, endpoint))
-
-    if resp.status_code != requests.codes.OK:
-        raise BigipSyncException("")
-
-    return resp
-
-
-def _await_status(ip, retry_timer):
     while True:
-        status_json = _do_get(ip, BIGIP_STATUS_ENDPOINT).json()
-        entries = status_json \
-            .get(BIGIP_ENTRIES) \
-            .get(
-                ('https://{0}{1}/0'.format("localhost",
-                                           BIGIP_STATUS_ENDPOINT))) \
-            .get(BIGIP_NESTED_STATS) \
-            .get(BIGIP_ENTRIES)
-
-        status = entries.get(BIGIP_STATUS) \
-            .get(BIGIP_DESCRIPTION)
-        summary = entries.get(BIGIP_SUMMARY) \
-            .get(BIGIP_DESCRIPTION)
-        log.info("Status: {0}: {1}".format(status, summary))
-        if status == BIGIP_IN_SYNC:
-            break
-        else:
-            log.info("Retry in {0}s".format(retry_timer))
-            time.sleep(retry_timer)
-
-
-class HttpSession:
-    session = None
+        ip, status = get_active_status(http_session, ip, cluster_ip)
+        log.info("Status: {0}: {1}".format(status.status, status.summary))
+        check_status(status, policy, started_at)
+        if status.in_sync:
+            return status
+
+        interval = min(policy.interval(attempt),
+                       policy.remaining(started_at))
+        attempt += 1
+        metrics.registry.record_retry(
+            METRICS_ENDPOINTS[BIGIP_STATUS_ENDPOINT])
+        log.info("Retry in {0:.1f}s".format(interval))
+        time.sleep(interval)
+
+
+def check_status(status, policy, started_at):
+    """
+    Raises if waiting for the status should not go on.
+    """
+    if status.failed:
+        raise BigipSyncException("Sync failed: {0}: {1}".format(
+            status.status, status.summary))
+    if not status.in_sync and policy.expired(started_at):
+        raise BigipSyncTimeoutException(
+            "Not in sync after {0}s, last status: {1}: {2}".format(
+                policy.timeout, status.status, status.summary))
+
+
+def get_status(http_session, ip):
+    return SyncStatus.parse(
+        http_session.get(ip, BIGIP_STATUS_ENDPOINT).json())
+
+
+def get_active_status(http_session, ip, cluster_ip=None):
+    """
+    Gets the sync status of the device. If the poll fails and cluster_ip is
+    given, the active unit is discovered again and polled instead.
+
+    :return: (ip of the polled device, SyncStatus)
+    """
+    try:
+        return ip, get_status(http_session, ip)
+    except BigipSyncTimeoutException:
+        raise
+    except (BigipSyncException, requests.RequestException) as e:
+        if cluster_ip is None:
+            raise
+        ip = _rediscover(http_session, cluster_ip, ip,
+                         BIGIP_STATUS_ENDPOINT, e)
+        return ip, get_status(http_session, ip)
+
+
+class SyncStatus(namedtuple("SyncStatus", ["status", "summary", "color"])):
+    """
+    Sync status of a device, as reported by BIGIP_STATUS_ENDPOINT.
+    """
 
     @classmethod
-    def setup_session(cls, user, password):
-        cls.session = requests.session()
-        cls.session.auth = (user, password)
-        cls.session.verify = False
-        cls.session.headers.update({'Content-Type': 'application/json'})
+    def parse(cls, status_json):
+        try:
+            # a single entry is expected, its key is the entry's selfLink
+            entry = next(iter(status_json[BIGIP_ENTRIES].values()))
+            entries = entry[BIGIP_NESTED_STATS][BIGIP_ENTRIES]
+            return cls(entries[BIGIP_STATUS][BIGIP_DESCRIPTION],
+                       entries.get(BIGIP_SUMMARY, {}).get(BIGIP_DESCRIPTION),
+                       entries.get(BIGIP_COLOR, {}).get(BIGIP_DESCRIPTION))
+        except (KeyError, AttributeError, TypeError, StopIteration):
+            raise BigipSyncException("Unexpected sync status response")
+
+    @property
+    def in_sync(self):
+        return self.status == BIGIP_IN_SYNC
+
+    @property
+    def failed(self):
+        return self.status in BIGIP_FAILED_STATES
+
+
+class HttpSession(object):
+    """
+    Sends requests to the devices of a cluster as one user.
+    Connections are kept alive in a pool per (device, user) shared by the
+    process, so syncs to many clusters can run in parallel threads.
+    """
+
+    def __init__(self, user, password,
+                 auth_mode=None, token_cache_dir=None,
+                 connect_timeout=DEFAULT_CONNECT_TIMEOUT,
+                 read_timeout=DEFAULT_READ_TIMEOUT,
+                 deadline=None):
+        self.user = user
+        self.connect_timeout = connect_timeout
+        self.read_timeout = read_timeout
+        self.deadline = deadline
+        self.password = password
+        self.token_cache = None
+        self.basic_auth = None
+        # token auths per device, logging in through its pooled session
+        self._token_auths = {}
+        if auth_mode == auth.AUTH_MODE_TOKEN:
+            self.token_cache = auth.get_token_cache(token_cache_dir)
+        else:
+            self.basic_auth = HTTPBasicAuth(user, password)
+
+    def get(self, ip, endpoint):
+        timeout = self._get_timeout(endpoint)
+        resp = metrics.registry.observe(
+            METRICS_ENDPOINTS.get(endpoint, endpoint),
+            lambda: self._get_session(ip).get(
+                "https://{0}{1}".format(ip, endpoint),
+                auth=self._get_auth(ip),
+                headers=BIGIP_HEADERS,
+                verify=False,
+                timeout=timeout))
+
+        if resp.status_code != requests.codes.OK:
+            raise BigipSyncException(
+                "Received unsupported status code={0} from {1}".format(
+                    resp.status_code, endpoint))
+
+        return resp
+
+    def post(self, ip, endpoint, payload):
+        timeout = self._get_timeout(endpoint)
+        resp = metrics.registry.observe(
+            METRICS_ENDPOINTS.get(endpoint, endpoint),
+            lambda: self._get_session(ip).post(
+                "https://{0}{1}".format(ip, endpoint),
+                json=payload,
+                auth=self._get_auth(ip),
+                headers=BIGIP_HEADERS,
+                verify=False,
+                timeout=timeout))
+
+        if resp.status_code != requests.codes.OK:
+            raise BigipSyncException(
+                "Received unsupported status code={0} from {1}".format(
+                    resp.status_code, endpoint))
+
+        return resp
+
+    def _get_timeout(self, endpoint):
+        if self.deadline and self.deadline.expired:
+            raise BigipSyncTimeoutException(
+                "Deadline of {0}s exceeded before requesting {1}".format(
+                    self.deadline.timeout, endpoint))
+        return get_timeout(self.connect_timeout,
+                           self.read_timeout,
+                           self.deadline)
+
+    def _get_session(self, ip):
+        return sessions.get_session(ip, BIGIP_PORT, self.user, True)
+
+    def _get_auth(self, ip):
+        if self.basic_auth is not None:
+            return self.basic_auth
+        token_auth = self._token_auths.get(ip)
+        if token_auth is None:
+            token_auth = auth.TokenAuth(
+                self.user,
+                self.password,
+                self._get_session(ip),
+                self.token_cache,
+                timeout=(self.connect_timeout, self.read_timeout))
+            self._token_auths[ip] = token_auth
+        return token_auth
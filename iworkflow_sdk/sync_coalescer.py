@@ -0,0 +1,194 @@
+########
+# Copyright (c) 2017 GigaSpaces Technologies Ltd. All rights reserved
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#        http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+#    * WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#    * See the License for the specific language governing permissions and
+#    * limitations under the License.
+
+"""
+Coalescing of BIG-IP config-syncs.
+
+Sync requests for the same (device, sync group) are recorded in a state file
+shared by all processes of the host. Once no new request has arrived for
+`debounce` seconds, one of the requesters runs a single save+sync on behalf
+of all of them, while the others wait for its outcome. A requester is done
+when a sync that started after its request has completed.
+"""
+
+import errno
+import fcntl
+import hashlib
+import json
+import logging
+import os
+import tempfile
+import time
+from contextlib import contextmanager
+
+from . import sync
+from . exceptions import BigipSyncException, BigipSyncTimeoutException
+from . import LOGGER_NAME
+
+DEFAULT_DEBOUNCE = 2
+DEFAULT_MAX_DELAY = 30
+DEFAULT_CHECK_INTERVAL = 0.5
+DEFAULT_STATE_DIR = os.path.join(tempfile.gettempdir(), "iworkflow-sync")
+
+KEY_FIRST_REQUEST = "first_request"
+KEY_LAST_REQUEST = "last_request"
+KEY_RUNNING_PID = "running_pid"
+KEY_RUNNING_SINCE = "running_since"
+KEY_COMPLETED_SINCE = "completed_since"
+KEY_ERROR = "error"
+
+log = logging.getLogger(LOGGER_NAME)
+
+
+def coalesced_sync(ip,
+                   sync_group,
+                   user,
+                   password,
+                   retry_timer,
+                   auth_mode=None,
+                   token_cache_dir=None,
+                   state_dir=None,
+                   debounce=DEFAULT_DEBOUNCE,
+                   max_delay=DEFAULT_MAX_DELAY,
+                   check_interval=DEFAULT_CHECK_INTERVAL,
+                   connect_timeout=sync.DEFAULT_CONNECT_TIMEOUT,
+                   read_timeout=sync.DEFAULT_READ_TIMEOUT,
+                   deadline=None):
+    """
+    Requests a save+sync of the group and returns once a sync including
+    this request has completed, running it only if nobody else does.
+    Takes the same parameters as sync.do_sync, plus:
+
+    :param state_dir: directory of the state files shared between processes
+    :param debounce: seconds without new requests before a sync starts
+    :param max_delay: seconds after which a sync starts even if requests
+                      keep arriving
+    :param check_interval: seconds between checks of the shared state
+    """
+    path = _state_path(state_dir or DEFAULT_STATE_DIR, ip, sync_group)
+
+    with _locked_state(path) as state:
+        requested_at = time.time()
+        if not state.get(KEY_FIRST_REQUEST):
+            state[KEY_FIRST_REQUEST] = requested_at
+        state[KEY_LAST_REQUEST] = requested_at
+
+    while True:
+        with _locked_state(path) as state:
+            if state.get(KEY_COMPLETED_SINCE, 0) >= requested_at:
+                error = state.get(KEY_ERROR)
+                if error:
+                    raise BigipSyncException(
+                        "Coalesced sync failed: {0}".format(error))
+                return
+
+            lead = not _is_running(state) and _is_due(state,
+                                                      debounce,
+                                                      max_delay)
+            if lead:
+                started_at = time.time()
+                state[KEY_RUNNING_PID] = os.getpid()
+                state[KEY_RUNNING_SINCE] = started_at
+                state[KEY_FIRST_REQUEST] = None
+
+        if lead:
+            _run(path, started_at, ip, sync_group, user, password,
+                 retry_timer, auth_mode, token_cache_dir,
+                 connect_timeout, read_timeout, deadline)
+        elif deadline and deadline.expired:
+            raise BigipSyncTimeoutException(
+                "Deadline of {0}s exceeded while waiting for the coalesced "
+                "sync of {1}".format(deadline.timeout, sync_group))
+        else:
+            time.sleep(check_interval)
+
+
+def _run(path, started_at, ip, sync_group, user, password,
+         retry_timer, auth_mode, token_cache_dir,
+         connect_timeout, read_timeout, deadline):
+    log.info("Running coalesced sync of {0} on {1}".format(sync_group, ip))
+    error = None
+    try:
+        sync.do_sync(ip, sync_group, user, password, retry_timer,
+                     auth_mode=auth_mode,
+                     token_cache_dir=token_cache_dir,
+                     connect_timeout=connect_timeout,
+                     read_timeout=read_timeout,
+                     deadline=deadline)
+    except Exception as e:
+        error = str(e) or type(e).__name__
+    finally:
+        with _locked_state(path) as state:
+            state[KEY_RUNNING_PID] = None
+            state[KEY_COMPLETED_SINCE] = started_at
+            state[KEY_ERROR] = error
+
+
+def _is_running(state):
+    pid = state.get(KEY_RUNNING_PID)
+    if not pid:
+        return False
+    try:
+        os.kill(pid, 0)
+    except OSError as e:
+        if e.errno == errno.ESRCH:
+            log.warn("Process {0} running the sync is gone".format(pid))
+            return False
+    return True
+
+
+def _is_due(state, debounce, max_delay):
+    first_request = state.get(KEY_FIRST_REQUEST)
+    if not first_request:
+        # every request so far is covered by the sync that ran last
+        first_request = state.get(KEY_LAST_REQUEST)
+    now = time.time()
+    return now - state.get(KEY_LAST_REQUEST, 0) >= debounce or \
+        now - first_request >= max_delay
+
+
+def _state_path(state_dir, ip, sync_group):
+    name = hashlib.sha1(
+        "{0}|{1}".format(ip, sync_group).encode("utf-8")).hexdigest()
+    return os.path.join(state_dir, "{0}.json".format(name))
+
+
+@contextmanager
+def _locked_state(path):
+    """
+    Yields the state stored in path for update,
+    holding an exclusive lock on the file meanwhile.
+    """
+    state_dir = os.path.dirname(path)
+    if not os.path.isdir(state_dir):
+        try:
+            os.makedirs(state_dir, 0o700)
+        except OSError as e:
+            if e.errno != errno.EEXIST:
+                raise
+
+    fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o600)
+    with os.fdopen(fd, "r+") as state_file:
+        fcntl.flock(state_file, fcntl.LOCK_EX)
+        try:
+            content = state_file.read()
+            state = json.loads(content) if content else {}
+            yield state
+            state_file.seek(0)
+            state_file.truncate()
+            state_file.write(json.dumps(state))
+            state_file.flush()
+        finally:
+            fcntl.flock(state_file, fcntl.LOCK_UN)
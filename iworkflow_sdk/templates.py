@@ -0,0 +1,165 @@
+########
+# Copyright (c) 2017 GigaSpaces Technologies Ltd. All rights reserved
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#        http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+#    * WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#    * See the License for the specific language governing permissions and
+#    * limitations under the License.
+
+import logging
+import threading
+import time
+
+from requests import codes
+
+from . exceptions import IWorkflowException, IWorkflowValidationException
+from . import LOGGER_NAME
+
+DEFAULT_TTL = 300
+
+KEY_NAME = "name"
+KEY_VALUE = "value"
+KEY_VARS = "vars"
+KEY_TABLES = "tables"
+KEY_SECTIONS = "sections"
+KEY_COLUMNS = "columns"
+KEY_ROWS = "rows"
+KEY_IS_REQUIRED = "isRequired"
+KEY_DEFAULT_VALUE = "defaultValue"
+
+HEADER_ETAG = "ETag"
+HEADER_IF_NONE_MATCH = "If-None-Match"
+
+logger = logging.getLogger(LOGGER_NAME)
+
+
+class TemplateIndex(object):
+    """
+    Variables and table columns a tenant template accepts,
+    each mapped to whether it has to be given.
+    """
+
+    def __init__(self, name, vars, tables):
+        self.name = name
+        self.vars = vars
+        self.tables = tables
+
+    @classmethod
+    def parse(cls, name, template_json):
+        vars = {}
+        tables = {}
+        # vars and tables may be listed at the top level or per section
+        for container in [template_json] + \
+                (template_json.get(KEY_SECTIONS) or []):
+            for var in container.get(KEY_VARS) or []:
+                vars[var[KEY_NAME]] = _is_required(var)
+            for table in container.get(KEY_TABLES) or []:
+                tables[table[KEY_NAME]] = dict(
+                    (column[KEY_NAME], _is_required(column))
+                    for column in table.get(KEY_COLUMNS) or [])
+        return cls(name, vars, tables)
+
+    def validate(self, vars, tables):
+        """
+        :param vars: vars of a service payload
+        :param tables: tables of a service payload
+        :return: list of the problems found, empty if the input is valid
+        """
+        errors = []
+
+        given_vars = set(var.get(KEY_NAME) for var in vars or [])
+        for name in sorted(given_vars - set(self.vars)):
+            errors.append("unknown var '{0}'".format(name))
+        for name in sorted(self.vars):
+            if self.vars[name] and name not in given_vars:
+                errors.append("missing required var '{0}'".format(name))
+
+        for table in tables or []:
+            errors.extend(self._validate_table(table))
+
+        return errors
+
+    def _validate_table(self, table):
+        name = table.get(KEY_NAME)
+        if name not in self.tables:
+            return ["unknown table '{0}'".format(name)]
+
+        errors = []
+        allowed = self.tables[name]
+        columns = table.get(KEY_COLUMNS) or []
+        for column in columns:
+            if column not in allowed:
+                errors.append("unknown column '{0}' in table '{1}'".format(
+                    column, name))
+        for column in sorted(allowed):
+            if allowed[column] and column not in columns:
+                errors.append(
+                    "missing required column '{0}' in table '{1}'".format(
+                        column, name))
+        for idx, row in enumerate(table.get(KEY_ROWS) or []):
+            if len(row) != len(columns):
+                errors.append(
+                    "row {0} of table '{1}' has {2} values for {3} "
+                    "columns".format(idx, name, len(row), len(columns)))
+        return errors
+
+
+class TemplateCatalog(object):
+    """
+    Cache of template indexes. Entries older than ttl are revalidated
+    with their ETag, so an unchanged template is not downloaded again.
+    """
+
+    def __init__(self, ttl=DEFAULT_TTL):
+        self.ttl = ttl
+        self._entries = {}
+        self._lock = threading.Lock()
+
+    def get(self, key, name, fetch):
+        """
+        :param key: cache key of the template
+        :param name: template name
+        :param fetch: callable sending the template request,
+                      given the ETag to revalidate or None
+        :return: TemplateIndex
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+        if entry and time.time() - entry[2] < self.ttl:
+            return entry[1]
+
+        resp = fetch(entry[0] if entry else None)
+        if resp.status_code == codes.not_modified and entry:
+            logger.debug("Template {0} has not changed".format(name))
+            index = entry[1]
+        elif resp.status_code == codes.ok:
+            index = TemplateIndex.parse(name, resp.json())
+        elif resp.status_code == codes.not_found:
+            raise IWorkflowValidationException(
+                "Template {0} does not exist".format(name))
+        else:
+            raise IWorkflowException(
+                "An unexpected HTTP response code = {0} has been received "
+                "while getting template {1}".format(resp.status_code, name))
+
+        with self._lock:
+            self._entries[key] = (resp.headers.get(HEADER_ETAG) or
+                                  (entry[0] if entry else None),
+                                  index,
+                                  time.time())
+        return index
+
+
+catalog = TemplateCatalog()
+
+
+def _is_required(definition):
+    return bool(definition.get(KEY_IS_REQUIRED)) and \
+        definition.get(KEY_DEFAULT_VALUE) in (None, "")
@@ -0,0 +1,89 @@
+########
+# Copyright (c) 2017 GigaSpaces Technologies Ltd. All rights reserved
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#        http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+#    * WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#    * See the License for the specific language governing permissions and
+#    * limitations under the License.
+
+import logging
+import threading
+import time
+
+from requests import codes
+
+from . exceptions import IWorkflowException
+from . import LOGGER_NAME
+
+KEY_ITEMS = "items"
+KEY_NAME = "name"
+
+logger = logging.getLogger(LOGGER_NAME)
+
+
+class TenantStatusPoller(object):
+    """
+    Keeps the services collection of a tenant for `ttl` seconds,
+    so that polling N services of a tenant costs one request
+    per round instead of N.
+    """
+
+    def __init__(self, ttl):
+        self.ttl = ttl
+        self._services = None
+        self._fetched_at = 0
+        self._lock = threading.Lock()
+
+    def get_service(self, service_name, fetch):
+        """
+        :param service_name: name of the service to look for
+        :param fetch: callable sending the collection request, used when the
+                      cached collection is older than ttl
+        :return: the service document, None if the tenant has no such service
+        """
+        with self._lock:
+            if self._services is None or \
+                    time.time() - self._fetched_at >= self.ttl:
+                self._services = self._fetch(fetch)
+                self._fetched_at = time.time()
+            return self._services.get(service_name)
+
+    def invalidate(self):
+        with self._lock:
+            self._services = None
+
+    @staticmethod
+    def _fetch(fetch):
+        resp = fetch()
+        if resp.status_code != codes.ok:
+            raise IWorkflowException(
+                "An unexpected HTTP response code = {0} has been received "
+                "while listing services".format(resp.status_code))
+
+        items = resp.json().get(KEY_ITEMS) or []
+        logger.debug("Fetched status of {0} services".format(len(items)))
+        return dict((item.get(KEY_NAME), item) for item in items)
+
+
+_pollers = {}
+_pollers_lock = threading.Lock()
+
+
+def get_poller(base_url, user, tenant_name, ttl):
+    """
+    Returns the poller shared by all services of the tenant in the process.
+    """
+    key = (base_url, user, tenant_name)
+    with _pollers_lock:
+        poller = _pollers.get(key)
+        if poller is None:
+            poller = TenantStatusPoller(ttl)
+            _pollers[key] = poller
+        return poller
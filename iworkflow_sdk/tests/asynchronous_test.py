@@ -0,0 +1,155 @@
+########
+# Copyright (c) 2017 GigaSpaces Technologies Ltd. All rights reserved
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#        http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+#    * WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#    * See the License for the specific language governing permissions and
+#    * limitations under the License.
+
+
+import unittest
+from mock import patch
+import requests_mock
+
+from iworkflow_sdk import asynchronous
+from iworkflow_sdk import sync
+from iworkflow_sdk.exceptions import (
+    IWorkflowException,
+    IWorkflowTimeoutException
+)
+from iworkflow_sdk.iworkflow import SERVICE_ENDPOINT
+
+tenant_name = 'tenant1'
+service_name = 'service1'
+conn_params = {
+    "ip": "1.2.3.4",
+    "port": 443,
+    "user": "user1",
+    "password": "pass1",
+    "use_ssl": True
+}
+url = "https://1.2.3.4:443{0}".format(SERVICE_ENDPOINT.format(tenant_name))
+status_url = "https://5.6.7.8{0}".format(sync.BIGIP_STATUS_ENDPOINT)
+save_url = "https://5.6.7.8{0}".format(sync.BIGIP_SAVE_ENDPOINT)
+sync_url = "https://5.6.7.8{0}".format(sync.BIGIP_SYNC_ENDPOINT)
+
+
+def get_status_response(status):
+    return {
+        "entries": {
+            "https://localhost/mgmt/tm/cm/sync-status/0": {
+                "nestedStats": {
+                    "entries": {
+                        "status": {"description": status},
+                        "summary": {"description": "summary"}
+                    }
+                }
+            }
+        }
+    }
+
+
+class AsyncIWorkflowServiceTest(unittest.TestCase):
+
+    def setUp(self):
+        self.loop = asynchronous.EventLoop(io_workers=2)
+
+    def tearDown(self):
+        self.loop.stop()
+
+    def get_service(self):
+        return asynchronous.AsyncIWorkflowService(tenant_name,
+                                                  service_name,
+                                                  conn_params,
+                                                  loop=self.loop)
+
+    def test_create_and_wait(self):
+        # given
+        service = self.get_service()
+
+        with requests_mock.mock() as m:
+            m.post(url, json={})
+            poll = m.get("{0}{1}".format(url, service_name), [
+                {'json': {}, 'status_code': 404},
+                {'json': {}, 'status_code': 200}
+            ])
+
+            # when
+            service.create_service("template1", [], [], [],
+                                   "localhost").result(5)
+            result = service.wait_for_service(0, 5).result(5)
+
+            # then
+            self.assertIsNone(result)
+            self.assertEqual(2, poll.call_count)
+
+    def test_wait_without_timeout(self):
+        # given
+        service = self.get_service()
+
+        with requests_mock.mock() as m:
+            poll = m.get("{0}{1}".format(url, service_name), [
+                {'json': {}, 'status_code': 404},
+                {'json': {}, 'status_code': 404},
+                {'json': {}, 'status_code': 200}
+            ])
+
+            # when
+            result = service.wait_for_service(0, None).result(5)
+
+            # then
+            self.assertIsNone(result)
+            self.assertEqual(3, poll.call_count)
+
+    def test_wait_timed_out(self):
+        # given
+        service = self.get_service()
+
+        with requests_mock.mock() as m:
+            m.get("{0}{1}".format(url, service_name),
+                  json={}, status_code=404)
+
+            # then
+            with self.assertRaises(IWorkflowTimeoutException):
+                # when
+                service.wait_for_service(1, 0).result(5)
+
+    def test_delete_error(self):
+        # given
+        service = self.get_service()
+
+        with requests_mock.mock() as m:
+            m.delete("{0}{1}".format(url, service_name),
+                     json={}, status_code=400)
+
+            # then
+            with self.assertRaises(IWorkflowException):
+                # when
+                service.delete_service().result(5)
+
+    @patch("iworkflow_sdk.sync._get_device", return_value="5.6.7.8")
+    def test_do_sync_async(self, get_device):
+        with requests_mock.mock() as m:
+            save = m.post(save_url, json={})
+            config_sync = m.post(sync_url, json={})
+            status = m.get(status_url, [
+                {'json': get_status_response("Syncing")},
+                {'json': get_status_response(sync.BIGIP_IN_SYNC)}
+            ])
+
+            # when
+            asynchronous.do_sync_async("5.6.7.8", "group1", "user1",
+                                       "pass1", 0,
+                                       loop=self.loop).result(5)
+
+            # then
+            self.assertEqual(1, save.call_count)
+            self.assertEqual(1, config_sync.call_count)
+            self.assertEqual(2, status.call_count)
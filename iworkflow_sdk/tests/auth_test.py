@@ -0,0 +1,184 @@
+########
+# Copyright (c) 2017 GigaSpaces Technologies Ltd. All rights reserved
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#        http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+#    * WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#    * See the License for the specific language governing permissions and
+#    * limitations under the License.
+
+
+import shutil
+import tempfile
+import time
+import unittest
+
+import requests_mock
+
+from iworkflow_sdk import auth
+from iworkflow_sdk import sessions
+from iworkflow_sdk import sync
+from iworkflow_sdk.exceptions import IWorkflowAuthException
+from iworkflow_sdk.iworkflow import IWorkflowService
+from iworkflow_sdk.iworkflow import SERVICE_ENDPOINT
+
+tenant_name = 'tenant1'
+service_name = 'service1'
+base_url = 'https://1.2.3.4:443'
+login_url = '{0}{1}'.format(base_url, auth.LOGIN_ENDPOINT)
+service_url = '{0}{1}{2}'.format(base_url,
+                                 SERVICE_ENDPOINT.format(tenant_name),
+                                 service_name)
+
+
+def get_connection_params(cache_dir=None):
+    return {
+        "ip": "1.2.3.4",
+        "port": 443,
+        "user": "user1",
+        "password": "pass1",
+        "use_ssl": True,
+        "auth_mode": auth.AUTH_MODE_TOKEN,
+        "token_cache_dir": cache_dir
+    }
+
+
+def get_login_response(token):
+    return {"token": {"token": token, "timeout": 1200}}
+
+
+class TokenAuthTest(unittest.TestCase):
+
+    def setUp(self):
+        auth._caches.clear()
+
+    def test_login_once(self):
+        # given
+        iworkflow_service = IWorkflowService(tenant_name, service_name,
+                                             get_connection_params())
+
+        with requests_mock.mock() as m:
+            login = m.post(login_url, json=get_login_response('token1'))
+            poll = m.get(service_url, json={})
+
+            # when
+            iworkflow_service.poll_service()
+            iworkflow_service.poll_service()
+
+            # then
+            self.assertEqual(1, login.call_count)
+            self.assertEqual(2, poll.call_count)
+            self.assertEqual('token1',
+                             poll.last_request.headers[auth.TOKEN_HEADER])
+            self.assertNotIn('Authorization', poll.last_request.headers)
+
+    def test_refresh_on_401(self):
+        # given
+        iworkflow_service = IWorkflowService(tenant_name, service_name,
+                                             get_connection_params())
+
+        with requests_mock.mock() as m:
+            login = m.post(login_url, [
+                {'json': get_login_response('token1')},
+                {'json': get_login_response('token2')}
+            ])
+            poll = m.get(service_url, [
+                {'json': {}, 'status_code': 401},
+                {'json': {}, 'status_code': 200}
+            ])
+
+            # when
+            iworkflow_service.poll_service()
+
+            # then
+            self.assertEqual(2, login.call_count)
+            self.assertEqual(2, poll.call_count)
+            self.assertEqual('token2',
+                             poll.last_request.headers[auth.TOKEN_HEADER])
+
+    def test_login_failure(self):
+        # given
+        iworkflow_service = IWorkflowService(tenant_name, service_name,
+                                             get_connection_params())
+
+        with requests_mock.mock() as m:
+            m.post(login_url, json={}, status_code=401)
+
+            # then
+            with self.assertRaises(IWorkflowAuthException):
+                # when
+                iworkflow_service.poll_service()
+
+    def test_bigip_login_through_pooled_session(self):
+        # given
+        http_session = sync.HttpSession("user1", "pass1",
+                                        auth.AUTH_MODE_TOKEN)
+        bigip_url = "https://5.6.7.8"
+
+        with requests_mock.mock() as m:
+            login = m.post("{0}{1}".format(bigip_url, auth.LOGIN_ENDPOINT),
+                           json=get_login_response('token1'))
+            status = m.get("{0}{1}".format(bigip_url,
+                                           sync.BIGIP_STATUS_ENDPOINT),
+                           json={})
+
+            # when
+            http_session.get("5.6.7.8", sync.BIGIP_STATUS_ENDPOINT)
+            http_session.get("5.6.7.8", sync.BIGIP_STATUS_ENDPOINT)
+
+            # then
+            self.assertEqual(1, login.call_count)
+            self.assertEqual('token1',
+                             status.last_request.headers[auth.TOKEN_HEADER])
+            self.assertIs(sessions.get_session("5.6.7.8", sync.BIGIP_PORT,
+                                               "user1", True),
+                          http_session._get_auth("5.6.7.8").session)
+
+
+class TokenCacheTest(unittest.TestCase):
+
+    def setUp(self):
+        self.cache_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.cache_dir)
+
+    def test_disk_tier_shared(self):
+        # given
+        key = (base_url, 'user1', 'tmos')
+        auth.TokenCache(self.cache_dir).set(key, 'token1',
+                                            time.time() + 600)
+
+        # when
+        token = auth.TokenCache(self.cache_dir).get(key)
+
+        # then
+        self.assertEqual('token1', token)
+
+    def test_expired_token(self):
+        # given
+        key = (base_url, 'user1', 'tmos')
+        cache = auth.TokenCache(self.cache_dir)
+        cache.set(key, 'token1', time.time() + 10)
+
+        # then
+        self.assertIsNone(cache.get(key))
+
+    def test_invalidate(self):
+        # given
+        key = (base_url, 'user1', 'tmos')
+        cache = auth.TokenCache(self.cache_dir)
+        cache.set(key, 'token1', time.time() + 600)
+
+        # when
+        cache.invalidate(key, 'token1')
+
+        # then
+        self.assertIsNone(cache.get(key))
+        self.assertIsNone(auth.TokenCache(self.cache_dir).get(key))
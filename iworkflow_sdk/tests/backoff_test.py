@@ -0,0 +1,55 @@
+########
+# Copyright (c) 2017 GigaSpaces Technologies Ltd. All rights reserved
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#        http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+#    * WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#    * See the License for the specific language governing permissions and
+#    * limitations under the License.
+
+
+import time
+import unittest
+
+from iworkflow_sdk.backoff import BackoffPolicy
+
+
+class BackoffPolicyTest(unittest.TestCase):
+
+    def test_max_wait_grows_to_cap(self):
+        # given
+        policy = BackoffPolicy(initial_interval=1,
+                               max_interval=10,
+                               multiplier=2)
+
+        # then
+        self.assertEqual([1, 2, 4, 8, 10, 10, 10],
+                         [policy.max_wait(n) for n in range(7)])
+        self.assertEqual(10, policy.max_wait(10000))
+
+    def test_interval_full_jitter(self):
+        # given
+        policy = BackoffPolicy(initial_interval=1,
+                               max_interval=10,
+                               multiplier=2)
+
+        # when
+        intervals = [policy.interval(2) for _ in range(100)]
+
+        # then
+        self.assertTrue(all(0 <= i <= 4 for i in intervals))
+        self.assertTrue(len(set(intervals)) > 1)
+
+    def test_deadline(self):
+        # given
+        policy = BackoffPolicy(timeout=60)
+
+        # then
+        self.assertFalse(policy.expired(time.time()))
+        self.assertTrue(policy.expired(time.time() - 61))
@@ -0,0 +1,229 @@
+########
+# Copyright (c) 2017 GigaSpaces Technologies Ltd. All rights reserved
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#        http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+#    * WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#    * See the License for the specific language governing permissions and
+#    * limitations under the License.
+
+
+import unittest
+import requests_mock
+
+from iworkflow_sdk import bulk
+from iworkflow_sdk.iworkflow import SERVICE_ENDPOINT
+
+tenant_name = 'tenant1'
+conn_params = {
+    "ip": "1.2.3.4",
+    "port": 443,
+    "user": "user1",
+    "password": "pass1",
+    "use_ssl": True
+}
+url = "https://1.2.3.4:443{0}".format(SERVICE_ENDPOINT.format(tenant_name))
+
+
+def get_batch(*service_names):
+    return [{
+        "service_name": name,
+        "template_name": "template1",
+        "vars": [],
+        "tables": [],
+        "properties": []
+    } for name in service_names]
+
+
+class BulkCreateTest(unittest.TestCase):
+
+    def test_create_services(self):
+        # given
+        batch = get_batch("service1", "service2", "service3")
+
+        with requests_mock.mock() as m:
+            create = m.post(url, json={})
+            m.get("{0}service1".format(url), json={})
+            m.get("{0}service2".format(url), [
+                {'json': {}, 'status_code': 404},
+                {'json': {}, 'status_code': 200}
+            ])
+            m.get("{0}service3".format(url), json={'error': 'error1'})
+
+            # when
+            results = bulk.create_services(tenant_name, batch, conn_params,
+                                           reference_hostname="localhost",
+                                           concurrency=2,
+                                           poll_interval=0)
+
+        # then
+        self.assertEqual(3, create.call_count)
+        self.assertEqual(
+            [("service1", bulk.STATUS_CREATED),
+             ("service2", bulk.STATUS_CREATED),
+             ("service3", bulk.STATUS_FAILED)],
+            [(r.service_name, r.status) for r in results])
+        self.assertIn("error1", results[2].error)
+
+    def test_create_services_without_timeout(self):
+        # given
+        batch = get_batch("service1")
+
+        with requests_mock.mock() as m:
+            m.post(url, json={})
+            poll = m.get("{0}service1".format(url), [
+                {'json': {}, 'status_code': 404},
+                {'json': {}, 'status_code': 200}
+            ])
+
+            # when
+            results = bulk.create_services(tenant_name, batch, conn_params,
+                                           reference_hostname="localhost",
+                                           poll_interval=0,
+                                           timeout=None)
+
+        # then
+        self.assertEqual(bulk.STATUS_CREATED, results[0].status)
+        self.assertEqual(2, poll.call_count)
+
+    def test_update_services(self):
+        # given
+        batch = get_batch("service1", "service2")
+        for item in batch:
+            item[bulk.KEY_UPDATE] = True
+
+        with requests_mock.mock() as m:
+            create = m.post(url, json={})
+            update1 = m.put("{0}service1".format(url), json={})
+            m.put("{0}service2".format(url), json={}, status_code=404)
+            m.get("{0}service1".format(url), json={})
+            m.get("{0}service2".format(url), json={})
+
+            # when
+            results = bulk.create_services(tenant_name, batch, conn_params,
+                                           reference_hostname="localhost",
+                                           poll_interval=0)
+
+        # then
+        self.assertEqual(1, update1.call_count)
+        # service2 does not exist anymore, it is created
+        self.assertEqual(1, create.call_count)
+        self.assertEqual("service2", create.last_request.json()["name"])
+        self.assertEqual([bulk.STATUS_CREATED] * 2,
+                         [r.status for r in results])
+
+    def test_create_request_failed(self):
+        # given
+        batch = get_batch("service1")
+
+        with requests_mock.mock() as m:
+            m.post(url, json={'message': 'bad template'}, status_code=400)
+
+            # when
+            results = bulk.create_services(tenant_name, batch, conn_params,
+                                           reference_hostname="localhost")
+
+        # then
+        self.assertEqual(bulk.STATUS_FAILED, results[0].status)
+        self.assertIn("bad template", results[0].error)
+
+    def test_create_services_timed_out(self):
+        # given
+        batch = get_batch("service1")
+
+        with requests_mock.mock() as m:
+            m.post(url, json={})
+            m.get("{0}service1".format(url), json={}, status_code=404)
+
+            # when
+            results = bulk.create_services(tenant_name, batch, conn_params,
+                                           reference_hostname="localhost",
+                                           poll_interval=1,
+                                           timeout=0)
+
+        # then
+        self.assertEqual(bulk.STATUS_TIMED_OUT, results[0].status)
+
+
+class BulkDeleteTest(unittest.TestCase):
+
+    def test_delete_services(self):
+        with requests_mock.mock() as m:
+            # given
+            m.delete("{0}service1".format(url), json={})
+            m.delete("{0}service2".format(url), json={}, status_code=404)
+            m.delete("{0}service3".format(url), json={}, status_code=500)
+            listing = m.get(url, json={"items": []})
+
+            # when
+            results = bulk.delete_services(
+                tenant_name, ["service1", "service2", "service3"],
+                conn_params)
+
+        # then
+        self.assertEqual([bulk.STATUS_DELETED,
+                          bulk.STATUS_DELETED,
+                          bulk.STATUS_FAILED],
+                         [result.status for result in results])
+        self.assertEqual(1, listing.call_count)
+
+    def test_delete_confirmed_by_sweep(self):
+        with requests_mock.mock() as m:
+            # given
+            m.delete("{0}service1".format(url), json={})
+            m.delete("{0}service2".format(url), json={})
+            listing = m.get(url, [
+                {"json": {"items": [{"name": "service2"}]}},
+                {"json": {"items": []}}
+            ])
+
+            # when
+            results = bulk.delete_services(tenant_name,
+                                           ["service1", "service2"],
+                                           conn_params,
+                                           poll_interval=0)
+
+        # then
+        self.assertEqual([bulk.STATUS_DELETED, bulk.STATUS_DELETED],
+                         [result.status for result in results])
+        self.assertEqual(2, listing.call_count)
+
+    def test_delete_without_timeout(self):
+        with requests_mock.mock() as m:
+            # given
+            m.delete("{0}service1".format(url), json={})
+            listing = m.get(url, [
+                {"json": {"items": [{"name": "service1"}]}},
+                {"json": {"items": []}}
+            ])
+
+            # when
+            results = bulk.delete_services(tenant_name, ["service1"],
+                                           conn_params,
+                                           poll_interval=0,
+                                           timeout=None)
+
+        # then
+        self.assertEqual(bulk.STATUS_DELETED, results[0].status)
+        self.assertEqual(2, listing.call_count)
+
+    def test_delete_timed_out(self):
+        with requests_mock.mock() as m:
+            # given
+            m.delete("{0}service1".format(url), json={})
+            m.get(url, json={"items": [{"name": "service1"}]})
+
+            # when
+            results = bulk.delete_services(tenant_name, ["service1"],
+                                           conn_params,
+                                           poll_interval=1,
+                                           timeout=0)
+
+        # then
+        self.assertEqual(bulk.STATUS_TIMED_OUT, results[0].status)
@@ -0,0 +1,96 @@
+########
+# Copyright (c) 2017 GigaSpaces Technologies Ltd. All rights reserved
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#        http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+#    * WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#    * See the License for the specific language governing permissions and
+#    * limitations under the License.
+
+
+import unittest
+import requests_mock
+
+from iworkflow_sdk import sync
+from iworkflow_sdk.deadline import Deadline, get_timeout
+from iworkflow_sdk.exceptions import (BigipSyncTimeoutException,
+                                      IWorkflowTimeoutException)
+from iworkflow_sdk.iworkflow import IWorkflowService, SERVICE_ENDPOINT
+
+conn_params = {
+    "ip": "1.2.3.4",
+    "port": 443,
+    "user": "user1",
+    "password": "pass1",
+    "use_ssl": True,
+    "connect_timeout": 5,
+    "read_timeout": 30
+}
+service_url = "https://1.2.3.4:443{0}service1".format(
+    SERVICE_ENDPOINT.format("tenant1"))
+
+
+class DeadlineTest(unittest.TestCase):
+
+    def test_no_deadline(self):
+        self.assertIsNone(Deadline().remaining())
+        self.assertFalse(Deadline().expired)
+        self.assertEqual((5, 30), get_timeout(5, 30, Deadline()))
+
+    def test_timeout_shortened(self):
+        # when
+        connect, read = get_timeout(5, 30, Deadline(10))
+
+        # then
+        self.assertEqual(5, connect)
+        self.assertTrue(9 < read <= 10)
+
+    def test_request_timeout(self):
+        # given
+        service = IWorkflowService("tenant1", "service1", conn_params)
+
+        with requests_mock.mock() as m:
+            get = m.get(service_url, json={})
+
+            # when
+            service.poll_service(Deadline(20))
+
+            # then
+            connect, read = get.last_request.timeout
+            self.assertEqual(5, connect)
+            self.assertTrue(19 < read <= 20)
+
+    def test_expired_not_sent(self):
+        # given
+        service = IWorkflowService("tenant1", "service1", conn_params)
+
+        with requests_mock.mock() as m:
+            get = m.get(service_url, json={})
+
+            # then
+            with self.assertRaisesRegexp(IWorkflowTimeoutException,
+                                         "before polling the service"):
+                # when
+                service.poll_service(Deadline(0))
+            self.assertFalse(get.called)
+
+    def test_expired_sync(self):
+        # given
+        http_session = sync.HttpSession("user1", "pass1",
+                                        deadline=Deadline(0))
+
+        with requests_mock.mock() as m:
+            get = m.get("https://1.2.3.4{0}".format(
+                sync.BIGIP_STATUS_ENDPOINT), json={})
+
+            # then
+            with self.assertRaises(BigipSyncTimeoutException):
+                # when
+                sync.get_status(http_session, "1.2.3.4")
+            self.assertFalse(get.called)
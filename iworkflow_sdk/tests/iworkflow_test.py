@@ -287,3 +287,177 @@ class IWorkflowServiceTest(unittest.TestCase):
                                          expected_error):
                 # when
                 iworkflow_service.delete_service()
+
+    def test_service_exists(self):
+        # given
+        conn_params = get_connection_params()
+        url = get_url(conn_params)
+        iworkflow_service = get_iworkflow_service(conn_params)
+
+        with requests_mock.mock() as m:
+            m.get("{0}{1}".format(url, service_name),
+                  json={},
+                  status_code=200)
+
+            # then
+            self.assertTrue(iworkflow_service.service_exists())
+
+    def test_service_not_exists(self):
+        # given
+        conn_params = get_connection_params()
+        url = get_url(conn_params)
+        iworkflow_service = get_iworkflow_service(conn_params)
+
+        with requests_mock.mock() as m:
+            m.get("{0}{1}".format(url, service_name),
+                  json={'message': 'not found'},
+                  status_code=404)
+
+            # then
+            self.assertFalse(iworkflow_service.service_exists())
+
+    def test_poll_service_not_modified(self):
+        # given
+        conn_params = get_connection_params()
+        url = get_url(conn_params)
+        iworkflow_service = get_iworkflow_service(conn_params)
+
+        with requests_mock.mock() as m:
+            get = m.get("{0}{1}".format(url, service_name), [
+                {'json': {'generation': 3, 'error': 'error1',
+                          'selfLink': 'https://localhost/service1'},
+                 'headers': {'ETag': '"3"'}},
+                {'status_code': 304}
+            ])
+
+            # when
+            for _ in range(2):
+                with self.assertRaisesRegexp(IWorkflowException, 'error1'):
+                    iworkflow_service.poll_service()
+
+            # then
+            self.assertEqual(3, iworkflow_service.generation)
+            self.assertEqual('https://localhost/service1',
+                             iworkflow_service.self_link)
+            # query string values are lower-cased by requests_mock
+            self.assertEqual(['name,generation,error,selflink'],
+                             get.last_request.qs['$select'])
+            self.assertEqual('"3"',
+                             get.last_request.headers['If-None-Match'])
+
+    def test_poll_service_no_etag(self):
+        # given
+        conn_params = get_connection_params()
+        url = get_url(conn_params)
+        iworkflow_service = get_iworkflow_service(conn_params)
+
+        with requests_mock.mock() as m:
+            get = m.get("{0}{1}".format(url, service_name), json={})
+
+            # when
+            iworkflow_service.poll_service()
+            iworkflow_service.poll_service()
+
+            # then
+            self.assertNotIn('If-None-Match', get.last_request.headers)
+
+    def test_delete_service_404(self):
+        # given
+        conn_params = get_connection_params()
+        url = get_url(conn_params)
+        iworkflow_service = get_iworkflow_service(conn_params)
+
+        with requests_mock.mock() as m:
+            m.delete("{0}{1}".format(url, service_name),
+                     json={},
+                     status_code=404)
+
+            # then
+            with self.assertRaises(IWorkflowNotFoundException):
+                # when
+                iworkflow_service.delete_service()
+
+    def test_update_service_200(self):
+        # given
+        conn_params = get_connection_params()
+        url = get_url(conn_params)
+        iworkflow_service = get_iworkflow_service(conn_params)
+
+        with requests_mock.mock() as m:
+            put = m.put("{0}{1}".format(url, service_name),
+                        json={},
+                        status_code=200)
+
+            # when
+            iworkflow_service.update_service("template1", [], [], [],
+                                             "localhost")
+
+            # then
+            self.assertEqual(service_name,
+                             put.last_request.json()["name"])
+
+    def test_update_service_404(self):
+        # given
+        conn_params = get_connection_params()
+        url = get_url(conn_params)
+        iworkflow_service = get_iworkflow_service(conn_params)
+
+        with requests_mock.mock() as m:
+            m.put("{0}{1}".format(url, service_name),
+                  json={'message': 'not found'},
+                  status_code=404)
+
+            # then
+            with self.assertRaises(IWorkflowNotFoundException):
+                # when
+                iworkflow_service.update_service("template1", [], [], [],
+                                                 "localhost")
+
+    def test_update_service_error(self):
+        # given
+        conn_params = get_connection_params()
+        url = get_url(conn_params)
+        iworkflow_service = get_iworkflow_service(conn_params)
+
+        with requests_mock.mock() as m:
+            m.put("{0}{1}".format(url, service_name),
+                  json={'message': 'invalid'},
+                  status_code=400)
+
+            # then
+            with self.assertRaisesRegexp(IWorkflowException, 'invalid'):
+                # when
+                iworkflow_service.update_service("template1", [], [], [],
+                                                 "localhost")
+
+    def test_list_services_page(self):
+        # given
+        conn_params = get_connection_params()
+        url = get_url(conn_params)
+        iworkflow_service = IWorkflowService(tenant_name, None, conn_params)
+
+        with requests_mock.mock() as m:
+            page = m.get(url, json={"items": [{"name": "service3"}]})
+
+            # when
+            items = iworkflow_service.list_services_page(2, 2, ("name",))
+
+            # then
+            self.assertEqual([{"name": "service3"}], items)
+            # query string values are lower-cased by requests_mock
+            self.assertEqual({"$top": ["2"], "$skip": ["2"],
+                              "$select": ["name"]}, page.last_request.qs)
+
+    def test_list_services_page_error(self):
+        # given
+        conn_params = get_connection_params()
+        url = get_url(conn_params)
+        iworkflow_service = IWorkflowService(tenant_name, None, conn_params)
+
+        with requests_mock.mock() as m:
+            m.get(url, json={}, status_code=500)
+
+            # then
+            with self.assertRaisesRegexp(IWorkflowException, "500"):
+                # when
+                iworkflow_service.list_services_page(2, 0)
@@ -0,0 +1,135 @@
+########
+# Copyright (c) 2017 GigaSpaces Technologies Ltd. All rights reserved
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#        http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+#    * WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#    * See the License for the specific language governing permissions and
+#    * limitations under the License.
+
+import unittest
+import requests_mock
+
+from iworkflow_sdk import listing
+from iworkflow_sdk.exceptions import IWorkflowException
+from iworkflow_sdk.iworkflow import SERVICE_ENDPOINT
+
+tenant_name = "tenant1"
+
+
+def get_connection_params():
+    return {
+        "ip": "1.2.3.4",
+        "port": 443,
+        "user": "user1",
+        "password": "pass1",
+        "use_ssl": True
+    }
+
+
+def get_url():
+    return "https://1.2.3.4:443{0}".format(
+        SERVICE_ENDPOINT.format(tenant_name))
+
+
+def page(names):
+    return {"items": [{"name": name, "generation": 1, "error": None,
+                       "vars": [{"name": "var1", "value": "a"}]}
+                      for name in names]}
+
+
+class IterServicesTest(unittest.TestCase):
+
+    def test_iter_services_pages(self):
+        # given
+        names = ["service{0}".format(idx) for idx in range(5)]
+
+        with requests_mock.mock() as m:
+            m.get(get_url(), [{"json": page(names[:2])},
+                              {"json": page(names[2:4])},
+                              {"json": page(names[4:])}])
+
+            # when
+            services = list(listing.iter_services(tenant_name,
+                                                  get_connection_params(),
+                                                  page_size=2))
+
+            # then
+            self.assertEqual(names, [service["name"] for service in services])
+            self.assertEqual([("2", "0"), ("2", "2"), ("2", "4")],
+                             [(request.qs["$top"][0], request.qs["$skip"][0])
+                              for request in m.request_history])
+            self.assertNotIn("$select", m.request_history[0].qs)
+
+    def test_iter_services_full_last_page(self):
+        # given
+        with requests_mock.mock() as m:
+            m.get(get_url(), [{"json": page(["service1", "service2"])},
+                              {"json": page([])}])
+
+            # when
+            services = list(listing.iter_services(tenant_name,
+                                                  get_connection_params(),
+                                                  page_size=2))
+
+            # then
+            self.assertEqual(2, len(services))
+            self.assertEqual(2, m.call_count)
+
+    def test_iter_services_fields(self):
+        # given
+        with requests_mock.mock() as m:
+            m.get(get_url(), json=page(["service1"]))
+
+            # when
+            services = list(listing.iter_services(
+                tenant_name,
+                get_connection_params(),
+                fields=("name", "generation")))
+
+            # then
+            self.assertEqual([{"name": "service1", "generation": 1}],
+                             services)
+            self.assertEqual(["name,generation"],
+                             m.last_request.qs["$select"])
+
+    def test_iter_services_lazy(self):
+        # given
+        with requests_mock.mock() as m:
+            m.get(get_url(), json=page(["service1", "service2"]))
+
+            # when
+            services = listing.iter_services(tenant_name,
+                                             get_connection_params(),
+                                             page_size=2)
+
+            # then
+            self.assertEqual(0, m.call_count)
+            self.assertEqual("service1", next(services)["name"])
+            self.assertEqual(1, m.call_count)
+
+    def test_iter_services_error(self):
+        # given
+        with requests_mock.mock() as m:
+            m.get(get_url(), status_code=500)
+
+            # when
+            services = listing.iter_services(tenant_name,
+                                             get_connection_params())
+
+            # then
+            with self.assertRaises(IWorkflowException):
+                list(services)
+
+    def test_iter_services_invalid_page_size(self):
+        # then
+        with self.assertRaises(ValueError):
+            next(listing.iter_services(tenant_name,
+                                       get_connection_params(),
+                                       page_size=0))
@@ -0,0 +1,147 @@
+########
+# Copyright (c) 2017 GigaSpaces Technologies Ltd. All rights reserved
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#        http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+#    * WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#    * See the License for the specific language governing permissions and
+#    * limitations under the License.
+
+
+import os
+import shutil
+import tempfile
+import unittest
+import requests_mock
+
+from iworkflow_sdk import metrics
+from iworkflow_sdk import sync
+from iworkflow_sdk.iworkflow import IWorkflowService, SERVICE_ENDPOINT
+
+conn_params = {
+    "ip": "1.2.3.4",
+    "port": 443,
+    "user": "user1",
+    "password": "pass1",
+    "use_ssl": True
+}
+service_url = "https://1.2.3.4:443{0}service1".format(
+    SERVICE_ENDPOINT.format("tenant1"))
+
+
+class MetricsTest(unittest.TestCase):
+
+    def setUp(self):
+        metrics.registry.reset()
+
+    def test_requests_recorded(self):
+        # given
+        service = IWorkflowService("tenant1", "service1", conn_params)
+
+        with requests_mock.mock() as m:
+            m.get(service_url, [{'json': {}},
+                                {'json': {}, 'status_code': 404}])
+            m.get("https://1.2.3.4{0}".format(sync.BIGIP_STATUS_ENDPOINT),
+                  json={})
+
+            # when
+            service.poll_service()
+            service.service_exists()
+            self.assertRaises(Exception, sync.get_status,
+                              sync.HttpSession("user1", "pass1"), "1.2.3.4")
+
+        # then
+        requests = metrics.registry.snapshot()[metrics.KEY_REQUESTS]
+        self.assertEqual({("poll", "200"): 1,
+                          ("poll", "404"): 1,
+                          ("status", "200"): 1}, requests)
+
+    def test_summary_since(self):
+        # given
+        metrics.registry.record_request("poll", "200", 0.5)
+        since = metrics.registry.snapshot()
+
+        # when
+        metrics.registry.record_request("poll", "200", 0.25)
+        metrics.registry.record_request("poll", "500", 0.25)
+        metrics.registry.record_request("create", metrics.CODE_ERROR, 1)
+        metrics.registry.record_retry("poll")
+        metrics.registry.record_sync_wait(3)
+
+        # then
+        self.assertEqual({
+            "requests": {
+                "poll": {"count": 2, "errors": 1, "seconds": 0.5},
+                "create": {"count": 1, "errors": 1, "seconds": 1}
+            },
+            "retries": {"poll": 1},
+            "sync_wait": 3
+        }, metrics.registry.summary(since))
+
+    def test_textfile(self):
+        # given
+        metrics.registry.record_request("poll", "200", 0.2)
+        metrics.registry.record_sync_wait(12)
+        textfile_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, textfile_dir)
+        path = os.path.join(textfile_dir, "iworkflow.prom")
+
+        # when
+        metrics.registry.write_textfile(path)
+
+        # then
+        with open(path) as textfile:
+            lines = textfile.read().splitlines()
+        self.assertIn('iworkflow_requests_total{endpoint="poll",code="200"} 1',
+                      lines)
+        self.assertIn('iworkflow_request_duration_seconds_bucket'
+                      '{endpoint="poll",le="0.1"} 0', lines)
+        self.assertIn('iworkflow_request_duration_seconds_bucket'
+                      '{endpoint="poll",le="0.25"} 1', lines)
+        self.assertIn('iworkflow_request_duration_seconds_count'
+                      '{endpoint="poll"} 1', lines)
+        self.assertIn('iworkflow_sync_wait_seconds_bucket{le="+Inf"} 1',
+                      lines)
+        self.assertIn('iworkflow_sync_wait_seconds_sum 12.0', lines)
+        self.assertEqual(["iworkflow.prom", "iworkflow.prom.lock"],
+                         sorted(os.listdir(textfile_dir)))
+
+    def test_textfile_sums_up_processes(self):
+        # given
+        textfile_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, textfile_dir)
+        path = os.path.join(textfile_dir, "iworkflow.prom")
+        # the registries of two operation processes
+        first = metrics.MetricsRegistry()
+        second = metrics.MetricsRegistry()
+
+        # when
+        first.record_request("poll", "200", 0.2)
+        first.write_textfile(path)
+        second.record_request("poll", "200", 0.2)
+        second.record_retry("poll")
+        second.write_textfile(path)
+        first.record_request("poll", "404", 3)
+        first.write_textfile(path)
+
+        # then
+        with open(path) as textfile:
+            lines = textfile.read().splitlines()
+        self.assertIn('iworkflow_requests_total{endpoint="poll",code="200"} 2',
+                      lines)
+        self.assertIn('iworkflow_requests_total{endpoint="poll",code="404"} 1',
+                      lines)
+        self.assertIn('iworkflow_retries_total{endpoint="poll"} 1', lines)
+        self.assertIn('iworkflow_request_duration_seconds_bucket'
+                      '{endpoint="poll",le="0.25"} 2', lines)
+        self.assertIn('iworkflow_request_duration_seconds_bucket'
+                      '{endpoint="poll",le="+Inf"} 3', lines)
+        self.assertIn('iworkflow_request_duration_seconds_count'
+                      '{endpoint="poll"} 3', lines)
+        self.assertIn('iworkflow_sync_wait_seconds_count 0', lines)
@@ -0,0 +1,163 @@
+########
+# Copyright (c) 2017 GigaSpaces Technologies Ltd. All rights reserved
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#        http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+#    * WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#    * See the License for the specific language governing permissions and
+#    * limitations under the License.
+
+
+import json
+import unittest
+import requests_mock
+from mock import patch
+
+from iworkflow_sdk import payload
+from iworkflow_sdk.iworkflow import IWorkflowService
+from iworkflow_sdk.iworkflow import SERVICE_ENDPOINT
+
+
+def create_payload(service_name="service1", vars=None):
+    return payload.create_payload("tenant1",
+                                  service_name,
+                                  "template1",
+                                  vars or [],
+                                  [],
+                                  [],
+                                  "https",
+                                  "localhost",
+                                  443)
+
+
+class PayloadTest(unittest.TestCase):
+
+    def test_create_payload(self):
+        # when
+        data = create_payload(vars=[{"name": "var1", "value": "a"}])
+
+        # then
+        self.assertEqual({
+            "name": "service1",
+            "tenantTemplateReference": {
+                "link": "https://localhost/mgmt/cm/cloud/tenant/"
+                        "templates/iapp/template1"
+            },
+            "tenantReference": {
+                "link": "https://localhost/mgmt/cm/cloud/tenants/tenant1"
+            },
+            "vars": [{"name": "var1", "value": "a"}],
+            "tables": [],
+            "properties": []
+        }, data)
+
+    def test_skeleton_shared(self):
+        # when
+        first = create_payload("service1")
+        second = create_payload("service2")
+
+        # then
+        self.assertEqual("service1", first["name"])
+        self.assertEqual("service2", second["name"])
+        self.assertIs(first["tenantReference"], second["tenantReference"])
+
+    def test_serialize_payload(self):
+        # given
+        data = create_payload()
+
+        # when
+        body = payload.serialize_payload(data)
+
+        # then
+        self.assertIsInstance(body, bytes)
+        self.assertEqual(data, json.loads(body.decode("utf-8")))
+
+    def test_create_service_sends_serialized_body(self):
+        # given
+        service = IWorkflowService("tenant1", "service1", {
+            "ip": "1.2.3.4",
+            "port": 443,
+            "user": "user1",
+            "password": "pass1",
+            "use_ssl": True
+        })
+
+        with requests_mock.mock() as m:
+            create = m.post("https://1.2.3.4:443{0}".format(
+                SERVICE_ENDPOINT.format("tenant1")), json={})
+
+            # when
+            service.create_service("template1", [], [], [], "localhost")
+
+            # then
+            self.assertEqual(
+                payload.serialize_payload(create_payload()),
+                create.last_request.body)
+            self.assertEqual("application/json",
+                             create.last_request.headers["Content-Type"])
+
+    def test_hash_and_request_share_serialization(self):
+        # given
+        service = IWorkflowService("tenant1", "service1", {
+            "ip": "1.2.3.4",
+            "port": 443,
+            "user": "user1",
+            "password": "pass1",
+            "use_ssl": True
+        })
+
+        with requests_mock.mock() as m:
+            create = m.post("https://1.2.3.4:443{0}".format(
+                SERVICE_ENDPOINT.format("tenant1")), json={})
+            with patch("iworkflow_sdk.payload.serialize_payload",
+                       wraps=payload.serialize_payload) as serialize:
+                # when
+                body = service.serialize_payload("template1", [], [], [],
+                                                 "localhost")
+                service.create_service("template1", [], [], [],
+                                       "localhost", body=body)
+
+            # then
+            self.assertEqual(1, serialize.call_count)
+            self.assertEqual(body, create.last_request.body)
+            self.assertEqual(payload.payload_hash(create_payload()),
+                             payload.body_hash(body))
+
+    def test_payload_hash_stable(self):
+        # given
+        data = create_payload(vars=[{"name": "var1", "value": "a"}])
+        reordered = dict(reversed(list(data.items())))
+
+        # then
+        self.assertEqual(payload.payload_hash(data),
+                         payload.payload_hash(reordered))
+        self.assertNotEqual(payload.payload_hash(data),
+                            payload.payload_hash(create_payload()))
+
+    def test_preview_truncated(self):
+        # given
+        body = payload.serialize_payload(create_payload())
+
+        # when
+        text = payload.preview(body, 10)
+
+        # then
+        self.assertEqual(
+            u"{0}... ({1} bytes truncated)".format(body[:10].decode("utf-8"),
+                                                   len(body) - 10),
+            text)
+
+    def test_preview_within_budget(self):
+        # given
+        body = payload.serialize_payload(create_payload())
+
+        # then
+        self.assertEqual(body.decode("utf-8"),
+                         payload.preview(body, len(body)))
+        self.assertEqual(body.decode("utf-8"), payload.preview(body, 0))
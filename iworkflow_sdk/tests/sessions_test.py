@@ -0,0 +1,77 @@
+########
+# Copyright (c) 2017 GigaSpaces Technologies Ltd. All rights reserved
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#        http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+#    * WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#    * See the License for the specific language governing permissions and
+#    * limitations under the License.
+
+
+import unittest
+
+from iworkflow_sdk import sessions
+from iworkflow_sdk.iworkflow import IWorkflowService
+
+
+def get_connection_params(user="user1", pool_size=None):
+    return {
+        "ip": "1.2.3.4",
+        "port": 443,
+        "user": user,
+        "password": "pass1",
+        "use_ssl": True,
+        "pool_size": pool_size
+    }
+
+
+class SessionsTest(unittest.TestCase):
+
+    def tearDown(self):
+        sessions.close_sessions()
+
+    def test_services_share_session(self):
+        # given
+        first = IWorkflowService("tenant1", "service1",
+                                 get_connection_params())
+        second = IWorkflowService("tenant2", "service2",
+                                  get_connection_params())
+
+        # then
+        self.assertIs(first._get_session(), second._get_session())
+
+    def test_different_user_different_session(self):
+        # given
+        first = IWorkflowService("tenant1", "service1",
+                                 get_connection_params())
+        second = IWorkflowService("tenant1", "service1",
+                                  get_connection_params(user="user2"))
+
+        # then
+        self.assertIsNot(first._get_session(), second._get_session())
+
+    def test_pool_size(self):
+        # when
+        session = sessions.get_session("1.2.3.4", 443, "user1", True,
+                                       pool_size=3)
+
+        # then
+        adapter = session.get_adapter("https://1.2.3.4:443/")
+        self.assertEqual(3, adapter._pool_maxsize)
+
+    def test_close_sessions(self):
+        # given
+        session = sessions.get_session("1.2.3.4", 443, "user1", True)
+
+        # when
+        sessions.close_sessions()
+
+        # then
+        self.assertIsNot(session,
+                         sessions.get_session("1.2.3.4", 443, "user1", True))
@@ -0,0 +1,89 @@
+########
+# Copyright (c) 2017 GigaSpaces Technologies Ltd. All rights reserved
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#        http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+#    * WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#    * See the License for the specific language governing permissions and
+#    * limitations under the License.
+
+
+import shutil
+import tempfile
+import threading
+import unittest
+from mock import patch
+
+from iworkflow_sdk import sync_coalescer
+from iworkflow_sdk.exceptions import BigipSyncException
+
+
+class SyncCoalescerTest(unittest.TestCase):
+
+    def setUp(self):
+        self.state_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.state_dir)
+
+    def coalesced_sync(self, errors=None):
+        try:
+            sync_coalescer.coalesced_sync("1.2.3.4", "group1", "user1",
+                                          "pass1", 1,
+                                          state_dir=self.state_dir,
+                                          debounce=0.2,
+                                          check_interval=0.05)
+        except Exception as e:
+            if errors is None:
+                raise
+            errors.append(e)
+
+    @patch("iworkflow_sdk.sync.do_sync")
+    def test_concurrent_requests_one_sync(self, do_sync):
+        # given
+        threads = [threading.Thread(target=self.coalesced_sync)
+                   for _ in range(5)]
+
+        # when
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        # then
+        self.assertEqual(1, do_sync.call_count)
+
+    @patch("iworkflow_sdk.sync.do_sync")
+    def test_sequential_requests_sync_each(self, do_sync):
+        # when
+        self.coalesced_sync()
+        self.coalesced_sync()
+
+        # then
+        self.assertEqual(2, do_sync.call_count)
+
+    @patch("iworkflow_sdk.sync.do_sync",
+           side_effect=BigipSyncException("sync failed"))
+    def test_failure_reported_to_all(self, do_sync):
+        # given
+        errors = []
+        threads = [threading.Thread(target=self.coalesced_sync,
+                                    args=(errors,))
+                   for _ in range(3)]
+
+        # when
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        # then
+        self.assertEqual(1, do_sync.call_count)
+        self.assertEqual(3, len(errors))
+        self.assertTrue(all("sync failed" in str(e) for e in errors))
@@ -0,0 +1,194 @@
+########
+# Copyright (c) 2017 GigaSpaces Technologies Ltd. All rights reserved
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#        http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+#    * WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#    * See the License for the specific language governing permissions and
+#    * limitations under the License.
+
+
+import base64
+import threading
+import unittest
+import requests
+import requests_mock
+
+from iworkflow_sdk import sync
+from iworkflow_sdk.backoff import BackoffPolicy
+from iworkflow_sdk.exceptions import (
+    BigipSyncException,
+    BigipSyncTimeoutException
+)
+
+ip = "10.0.0.1"
+status_url = "https://{0}{1}".format(ip, sync.BIGIP_STATUS_ENDPOINT)
+
+
+def get_status_response(status, summary="summary"):
+    return {
+        "entries": {
+            "https://localhost/mgmt/tm/cm/sync-status/0": {
+                "nestedStats": {
+                    "entries": {
+                        "color": {"description": "green"},
+                        "status": {"description": status},
+                        "summary": {"description": summary}
+                    }
+                }
+            }
+        }
+    }
+
+
+def get_devices(ip):
+    return {"items": [{
+        "name": ip,
+        "managementIp": ip,
+        "failoverState": "active",
+        "selfDevice": "true"
+    }]}
+
+
+def get_policy(timeout=5):
+    return BackoffPolicy(initial_interval=0.01,
+                         max_interval=0.01,
+                         timeout=timeout)
+
+
+class SyncStatusTest(unittest.TestCase):
+
+    def setUp(self):
+        self.http_session = sync.HttpSession("user1", "pass1")
+
+    def test_parse(self):
+        # when
+        status = sync.SyncStatus.parse(get_status_response(
+            sync.BIGIP_IN_SYNC, "All devices are in sync"))
+
+        # then
+        self.assertEqual(sync.SyncStatus(sync.BIGIP_IN_SYNC,
+                                         "All devices are in sync",
+                                         "green"),
+                         status)
+        self.assertTrue(status.in_sync)
+        self.assertFalse(status.failed)
+
+    def test_parse_unexpected(self):
+        # then
+        with self.assertRaises(BigipSyncException):
+            # when
+            sync.SyncStatus.parse({"entries": {}})
+
+    def test_await_in_sync(self):
+        with requests_mock.mock() as m:
+            status = m.get(status_url, [
+                {'json': get_status_response("Syncing")},
+                {'json': get_status_response(sync.BIGIP_IN_SYNC)}
+            ])
+
+            # when
+            result = sync.await_status(self.http_session, ip, get_policy())
+
+            # then
+            self.assertTrue(result.in_sync)
+            self.assertEqual(2, status.call_count)
+
+    def test_await_failure_state(self):
+        with requests_mock.mock() as m:
+            status = m.get(status_url,
+                           json=get_status_response("Disconnected"))
+
+            # then
+            with self.assertRaisesRegexp(BigipSyncException,
+                                         "Disconnected"):
+                # when
+                sync.await_status(self.http_session, ip, get_policy())
+            self.assertEqual(1, status.call_count)
+
+    def test_await_timed_out(self):
+        with requests_mock.mock() as m:
+            m.get(status_url, json=get_status_response("Syncing"))
+
+            # then
+            with self.assertRaises(BigipSyncTimeoutException):
+                # when
+                sync.await_status(self.http_session, ip,
+                                  get_policy(timeout=0.05))
+
+    def test_await_failed_poll_rediscovers(self):
+        # given
+        sync.topology_cache.invalidate(ip)
+        device_url = "https://{0}{1}".format(ip, sync.BIGIP_DEVICE_ENDPOINT)
+
+        with requests_mock.mock() as m:
+            m.get(device_url, json=get_devices(ip))
+            m.get("https://10.0.0.2{0}".format(sync.BIGIP_STATUS_ENDPOINT),
+                  exc=requests.exceptions.ConnectionError)
+            status = m.get(status_url,
+                           json=get_status_response(sync.BIGIP_IN_SYNC))
+
+            # when
+            result = sync.await_status(self.http_session, "10.0.0.2",
+                                       get_policy(), cluster_ip=ip)
+
+            # then
+            self.assertTrue(result.in_sync)
+            self.assertEqual(1, status.call_count)
+
+    def test_await_failed_poll_without_cluster_ip(self):
+        with requests_mock.mock() as m:
+            m.get(status_url, status_code=503)
+
+            # then
+            with self.assertRaises(BigipSyncException):
+                # when
+                sync.await_status(self.http_session, ip, get_policy())
+
+
+class ParallelSyncTest(unittest.TestCase):
+
+    def test_parallel_syncs_keep_their_credentials(self):
+        # given
+        clusters = [("10.0.1.1", "user1"), ("10.0.2.1", "user2")]
+
+        with requests_mock.mock() as m:
+            for cluster_ip, _ in clusters:
+                m.get("https://{0}{1}".format(cluster_ip,
+                                              sync.BIGIP_DEVICE_ENDPOINT),
+                      json=get_devices(cluster_ip))
+                m.post("https://{0}{1}".format(cluster_ip,
+                                               sync.BIGIP_SAVE_ENDPOINT),
+                       json={})
+                m.post("https://{0}{1}".format(cluster_ip,
+                                               sync.BIGIP_SYNC_ENDPOINT),
+                       json={})
+                m.get("https://{0}{1}".format(cluster_ip,
+                                              sync.BIGIP_STATUS_ENDPOINT),
+                      json=get_status_response(sync.BIGIP_IN_SYNC))
+
+            threads = [threading.Thread(target=sync.do_sync,
+                                        args=(cluster_ip, "group1", user,
+                                              "pass1", 1))
+                       for cluster_ip, user in clusters]
+
+            # when
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+
+            # then
+            self.assertEqual(8, m.call_count)
+            for request in m.request_history:
+                user = dict(clusters)[request.hostname]
+                self.assertEqual(
+                    "Basic " + base64.b64encode(
+                        "{0}:pass1".format(user).encode()).decode(),
+                    request.headers["Authorization"])
@@ -0,0 +1,171 @@
+########
+# Copyright (c) 2017 GigaSpaces Technologies Ltd. All rights reserved
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#        http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+#    * WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#    * See the License for the specific language governing permissions and
+#    * limitations under the License.
+
+
+import unittest
+import requests_mock
+
+from iworkflow_sdk import bulk
+from iworkflow_sdk import templates
+from iworkflow_sdk.exceptions import IWorkflowValidationException
+from iworkflow_sdk.iworkflow import IWorkflowService
+from iworkflow_sdk.iworkflow import SERVICE_ENDPOINT, TEMPLATE_ENDPOINT
+
+tenant_name = 'tenant1'
+conn_params = {
+    "ip": "1.2.3.4",
+    "port": 443,
+    "user": "user1",
+    "password": "pass1",
+    "use_ssl": True,
+    "validate_templates": True
+}
+base_url = "https://1.2.3.4:443"
+template_url = "{0}{1}template1".format(base_url, TEMPLATE_ENDPOINT)
+service_url = "{0}{1}".format(base_url, SERVICE_ENDPOINT.format(tenant_name))
+
+template = {
+    "templateName": "template1",
+    "sections": [{
+        "vars": [
+            {"name": "pool__addr", "isRequired": True},
+            {"name": "pool__port", "isRequired": True, "defaultValue": "80"},
+            {"name": "pool__mask", "isRequired": False}
+        ]
+    }],
+    "tables": [{
+        "name": "pool__Members",
+        "columns": [
+            {"name": "IPAddress", "isRequired": True},
+            {"name": "State", "isRequired": False}
+        ]
+    }]
+}
+
+valid_vars = [{"name": "pool__addr", "value": "10.0.0.1"}]
+valid_tables = [{
+    "name": "pool__Members",
+    "columns": ["IPAddress", "State"],
+    "rows": [["10.0.0.2", "enabled"]]
+}]
+
+
+class TemplateIndexTest(unittest.TestCase):
+
+    def setUp(self):
+        self.index = templates.TemplateIndex.parse("template1", template)
+
+    def test_valid(self):
+        self.assertEqual([], self.index.validate(valid_vars, valid_tables))
+
+    def test_invalid_vars(self):
+        # when
+        errors = self.index.validate([{"name": "pool__adr"}], [])
+
+        # then
+        self.assertEqual(["unknown var 'pool__adr'",
+                          "missing required var 'pool__addr'"], errors)
+
+    def test_invalid_tables(self):
+        # when
+        errors = self.index.validate(valid_vars, [
+            {"name": "pool__Member"},
+            {"name": "pool__Members",
+             "columns": ["State", "Ratio"],
+             "rows": [["enabled"]]}
+        ])
+
+        # then
+        self.assertEqual([
+            "unknown table 'pool__Member'",
+            "unknown column 'Ratio' in table 'pool__Members'",
+            "missing required column 'IPAddress' in table 'pool__Members'",
+            "row 0 of table 'pool__Members' has 1 values for 2 columns"
+        ], errors)
+
+
+class TemplateCatalogTest(unittest.TestCase):
+
+    def setUp(self):
+        templates.catalog = templates.TemplateCatalog()
+        self.service = IWorkflowService(tenant_name, "service1", conn_params)
+
+    def test_invalid_input_not_sent(self):
+        with requests_mock.mock() as m:
+            m.get(template_url, json=template)
+            create = m.post(service_url, json={})
+
+            # then
+            with self.assertRaisesRegexp(IWorkflowValidationException,
+                                         "unknown var 'pool__adr'"):
+                # when
+                self.service.create_service("template1",
+                                            [{"name": "pool__adr"}],
+                                            [], [], "localhost")
+            self.assertFalse(create.called)
+
+    def test_revalidated_with_etag(self):
+        # given
+        templates.catalog.ttl = 0
+
+        with requests_mock.mock() as m:
+            get_template = m.get(template_url, [
+                {'json': template, 'headers': {'ETag': '"1"'}},
+                {'status_code': 304}
+            ])
+
+            # when
+            self.service.validate_service("template1", valid_vars, [])
+            self.service.validate_service("template1", valid_vars, [])
+
+            # then
+            self.assertEqual(2, get_template.call_count)
+            self.assertEqual(
+                '"1"',
+                get_template.last_request.headers["If-None-Match"])
+
+    def test_cached(self):
+        with requests_mock.mock() as m:
+            get_template = m.get(template_url, json=template)
+
+            # when
+            self.service.validate_service("template1", valid_vars, [])
+            self.service.validate_service("template1", valid_vars, [])
+
+            # then
+            self.assertEqual(1, get_template.call_count)
+
+    def test_bulk_fails_invalid_items_first(self):
+        # given
+        batch = [{"service_name": "service1",
+                  "template_name": "template1",
+                  "vars": valid_vars},
+                 {"service_name": "service2",
+                  "template_name": "template1",
+                  "vars": []}]
+
+        with requests_mock.mock() as m:
+            m.get(template_url, json=template)
+            create = m.post(service_url, json={})
+            m.get("{0}service1".format(service_url), json={})
+
+            # when
+            results = bulk.create_services(tenant_name, batch, conn_params,
+                                           reference_hostname="localhost")
+
+            # then
+            self.assertEqual(1, create.call_count)
+            self.assertEqual([bulk.STATUS_CREATED, bulk.STATUS_FAILED],
+                             [result.status for result in results])
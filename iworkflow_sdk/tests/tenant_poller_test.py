@@ -0,0 +1,169 @@
+########
+# Copyright (c) 2017 GigaSpaces Technologies Ltd. All rights reserved
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#        http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+#    * WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#    * See the License for the specific language governing permissions and
+#    * limitations under the License.
+
+
+import unittest
+import requests_mock
+
+from iworkflow_sdk import tenant_poller
+from iworkflow_sdk.iworkflow import IWorkflowService
+from iworkflow_sdk.exceptions import (
+    IWorkflowException,
+    IWorkflowNotFoundException
+)
+from iworkflow_sdk.iworkflow import SERVICE_ENDPOINT
+
+tenant_name = 'tenant1'
+conn_params = {
+    "ip": "1.2.3.4",
+    "port": 443,
+    "user": "user1",
+    "password": "pass1",
+    "use_ssl": True,
+    "status_cache_ttl": 60
+}
+url = "https://1.2.3.4:443{0}".format(SERVICE_ENDPOINT.format(tenant_name))
+
+
+def get_collection(*items):
+    return {"items": list(items)}
+
+
+class TenantPollerTest(unittest.TestCase):
+
+    def setUp(self):
+        tenant_poller._pollers.clear()
+
+    def test_one_request_for_all_services(self):
+        # given
+        services = [IWorkflowService(tenant_name, name, conn_params)
+                    for name in ("service1", "service2")]
+
+        with requests_mock.mock() as m:
+            collection = m.get(url, json=get_collection(
+                {"name": "service1"},
+                {"name": "service2"}))
+
+            # when
+            for service in services:
+                service.poll_service()
+
+            # then
+            self.assertEqual(1, collection.call_count)
+
+    def test_version_from_collection(self):
+        # given
+        service = IWorkflowService(tenant_name, "service1", conn_params)
+
+        with requests_mock.mock() as m:
+            m.get(url, json=get_collection(
+                {"name": "service1",
+                 "generation": 4,
+                 "selfLink": "https://localhost/service1"}))
+
+            # when
+            service.poll_service()
+
+            # then
+            self.assertEqual(4, service.generation)
+            self.assertEqual("https://localhost/service1", service.self_link)
+
+    def test_service_not_found(self):
+        # given
+        service = IWorkflowService(tenant_name, "service1", conn_params)
+
+        with requests_mock.mock() as m:
+            m.get(url, json=get_collection({"name": "service2"}))
+
+            # then
+            with self.assertRaises(IWorkflowNotFoundException):
+                # when
+                service.poll_service()
+
+    def test_service_with_error(self):
+        # given
+        service = IWorkflowService(tenant_name, "service1", conn_params)
+
+        with requests_mock.mock() as m:
+            m.get(url, json=get_collection(
+                {"name": "service1", "error": "error1"}))
+
+            # then
+            with self.assertRaisesRegexp(IWorkflowException, "error1"):
+                # when
+                service.poll_service()
+
+    def test_refresh_after_ttl(self):
+        # given
+        poller = tenant_poller.TenantStatusPoller(0)
+        service = IWorkflowService(tenant_name, "service1", conn_params)
+
+        with requests_mock.mock() as m:
+            collection = m.get(url, [
+                {'json': get_collection()},
+                {'json': get_collection({"name": "service1"})}
+            ])
+
+            # when
+            first = poller.get_service("service1",
+                                       service._send_list_request)
+            second = poller.get_service("service1",
+                                        service._send_list_request)
+
+            # then
+            self.assertIsNone(first)
+            self.assertEqual({"name": "service1"}, second)
+            self.assertEqual(2, collection.call_count)
+
+    def test_probe_update_poll(self):
+        # given
+        service = IWorkflowService(tenant_name, "service1", conn_params)
+
+        with requests_mock.mock() as m:
+            collection = m.get(url, [
+                {'json': get_collection(
+                    {"name": "service1", "error": "error1"})},
+                {'json': get_collection({"name": "service1"})}
+            ])
+            m.put("{0}service1".format(url), json={})
+
+            # when
+            with self.assertRaisesRegexp(IWorkflowException, "error1"):
+                service.service_exists()
+            service.update_service("template1", [], [], [], "localhost")
+            service.poll_service()
+
+            # then
+            self.assertEqual(2, collection.call_count)
+
+    def test_probe_create_poll(self):
+        # given
+        service = IWorkflowService(tenant_name, "service1", conn_params)
+
+        with requests_mock.mock() as m:
+            collection = m.get(url, [
+                {'json': get_collection()},
+                {'json': get_collection({"name": "service1"})}
+            ])
+            m.post(url, json={})
+
+            # when
+            exists = service.service_exists()
+            service.create_service("template1", [], [], [], "localhost")
+            service.poll_service()
+
+            # then
+            self.assertFalse(exists)
+            self.assertEqual(2, collection.call_count)
@@ -0,0 +1,155 @@
+########
+# Copyright (c) 2017 GigaSpaces Technologies Ltd. All rights reserved
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#        http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+#    * WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#    * See the License for the specific language governing permissions and
+#    * limitations under the License.
+
+
+import unittest
+import requests_mock
+
+from iworkflow_sdk import sync
+from iworkflow_sdk import topology
+from iworkflow_sdk.exceptions import BigipSyncException
+
+
+def get_device_url(ip):
+    return "https://{0}{1}".format(ip, sync.BIGIP_DEVICE_ENDPOINT)
+
+
+def get_save_url(ip):
+    return "https://{0}{1}".format(ip, sync.BIGIP_SAVE_ENDPOINT)
+
+
+def get_sync_url(ip):
+    return "https://{0}{1}".format(ip, sync.BIGIP_SYNC_ENDPOINT)
+
+
+def get_devices(*devices):
+    return {"items": [{
+        "name": ip,
+        "managementIp": ip,
+        "failoverState": state,
+        "selfDevice": "true" if is_self else "false"
+    } for ip, state, is_self in devices]}
+
+
+class TopologyTest(unittest.TestCase):
+
+    def setUp(self):
+        self.http_session = sync.HttpSession("user1", "pass1")
+        self.cache = topology.TopologyCache()
+
+    def get_active_ip(self, ip):
+        return self.cache.get_active_ip(
+            ip,
+            lambda device_ip: self.http_session.get(
+                device_ip, sync.BIGIP_DEVICE_ENDPOINT).json())
+
+    def test_self_device_not_first(self):
+        with requests_mock.mock() as m:
+            m.get(get_device_url("10.0.0.2"), json=get_devices(
+                ("10.0.0.1", "standby", False),
+                ("10.0.0.2", "active", True)))
+
+            # then
+            self.assertEqual("10.0.0.2", self.get_active_ip("10.0.0.2"))
+
+    def test_standby_resolves_active_peer(self):
+        with requests_mock.mock() as m:
+            m.get(get_device_url("10.0.0.1"), json=get_devices(
+                ("10.0.0.1", "standby", True),
+                ("10.0.0.2", "active", False)))
+
+            # then
+            self.assertEqual("10.0.0.2", self.get_active_ip("10.0.0.1"))
+
+    def test_unknown_state_probes_peers(self):
+        with requests_mock.mock() as m:
+            m.get(get_device_url("10.0.0.1"), json=get_devices(
+                ("10.0.0.1", "unknown", True),
+                ("10.0.0.2", "unknown", False)))
+            m.get(get_device_url("10.0.0.2"), json=get_devices(
+                ("10.0.0.1", "unknown", False),
+                ("10.0.0.2", "active", True)))
+
+            # then
+            self.assertEqual("10.0.0.2", self.get_active_ip("10.0.0.1"))
+
+    def test_no_active_device(self):
+        with requests_mock.mock() as m:
+            m.get(get_device_url("10.0.0.1"), json=get_devices(
+                ("10.0.0.1", "standby", True)))
+
+            # then
+            with self.assertRaises(BigipSyncException):
+                # when
+                self.get_active_ip("10.0.0.1")
+
+    def test_cached_until_ttl(self):
+        with requests_mock.mock() as m:
+            devices = m.get(get_device_url("10.0.0.1"), json=get_devices(
+                ("10.0.0.1", "active", True)))
+
+            # when
+            self.get_active_ip("10.0.0.1")
+            self.get_active_ip("10.0.0.1")
+
+            # then
+            self.assertEqual(1, devices.call_count)
+
+    def test_failed_save_rediscovers(self):
+        # given
+        sync.topology_cache.invalidate("10.0.0.1")
+
+        with requests_mock.mock() as m:
+            m.get(get_device_url("10.0.0.1"), [
+                {'json': get_devices(("10.0.0.1", "standby", True),
+                                     ("10.0.0.2", "active", False))},
+                {'json': get_devices(("10.0.0.1", "active", True),
+                                     ("10.0.0.2", "standby", False))}
+            ])
+            m.post(get_save_url("10.0.0.2"), json={}, status_code=503)
+            save = m.post(get_save_url("10.0.0.1"), json={})
+            m.post(get_sync_url("10.0.0.1"), json={})
+
+            # when
+            active_ip = sync.start_sync(self.http_session,
+                                        "10.0.0.1", "group1")
+
+            # then
+            self.assertEqual("10.0.0.1", active_ip)
+            self.assertTrue(save.called)
+
+    def test_failed_sync_rediscovers(self):
+        # given
+        sync.topology_cache.invalidate("10.0.0.1")
+
+        with requests_mock.mock() as m:
+            m.get(get_device_url("10.0.0.1"), [
+                {'json': get_devices(("10.0.0.1", "standby", True),
+                                     ("10.0.0.2", "active", False))},
+                {'json': get_devices(("10.0.0.1", "active", True),
+                                     ("10.0.0.2", "standby", False))}
+            ])
+            m.post(get_save_url("10.0.0.2"), json={})
+            m.post(get_sync_url("10.0.0.2"), json={}, status_code=503)
+            m.post(get_save_url("10.0.0.1"), json={})
+            sync_request = m.post(get_sync_url("10.0.0.1"), json={})
+
+            # when
+            active_ip = sync.start_sync(self.http_session,
+                                        "10.0.0.1", "group1")
+
+            # then
+            self.assertEqual("10.0.0.1", active_ip)
+            self.assertTrue(sync_request.called)
@@ -0,0 +1,146 @@
+########
+# Copyright (c) 2017 GigaSpaces Technologies Ltd. All rights reserved
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#        http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+#    * WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#    * See the License for the specific language governing permissions and
+#    * limitations under the License.
+
+import logging
+import threading
+import time
+from collections import namedtuple
+
+from . exceptions import BigipSyncException
+from . import LOGGER_NAME
+
+DEFAULT_TTL = 60
+
+KEY_ITEMS = "items"
+KEY_NAME = "name"
+KEY_MGMT_IP = "managementIp"
+KEY_FAILOVER_STATE = "failoverState"
+KEY_SELF_DEVICE = "selfDevice"
+
+STATE_ACTIVE = "active"
+
+log = logging.getLogger(LOGGER_NAME)
+
+Device = namedtuple("Device", ["name",
+                               "management_ip",
+                               "failover_state",
+                               "self_device"])
+
+
+class ClusterTopology(object):
+    """
+    Devices of a BIG-IP cluster, as seen by one of them.
+    """
+
+    def __init__(self, devices):
+        self.devices = devices
+        self.fetched_at = time.time()
+
+    @classmethod
+    def parse(cls, devices_json):
+        return cls([Device(item.get(KEY_NAME),
+                           item.get(KEY_MGMT_IP),
+                           item.get(KEY_FAILOVER_STATE),
+                           str(item.get(KEY_SELF_DEVICE)).lower() == "true")
+                    for item in devices_json.get(KEY_ITEMS) or []])
+
+    @property
+    def self_device(self):
+        return next((dev for dev in self.devices if dev.self_device), None)
+
+    @property
+    def active_device(self):
+        active = [dev for dev in self.devices
+                  if dev.failover_state == STATE_ACTIVE]
+        if len(active) == 1:
+            return active[0]
+        return None
+
+
+class TopologyCache(object):
+    """
+    Caches the topology of each cluster, keyed by the address the cluster
+    is reached through, together with its resolved active unit.
+    """
+
+    def __init__(self, ttl=DEFAULT_TTL):
+        self.ttl = ttl
+        self._entries = {}
+        self._lock = threading.Lock()
+
+    def get_active_ip(self, ip, fetch):
+        """
+        :param ip: address of any device of the cluster
+        :param fetch: callable returning the parsed device list
+                      of the device at the given address
+        :return: management address of the active unit
+        """
+        with self._lock:
+            entry = self._entries.get(ip)
+            if entry and time.time() - entry[0].fetched_at < self.ttl:
+                return entry[1]
+
+        topology = ClusterTopology.parse(fetch(ip))
+        active_ip = _resolve_active_ip(ip, topology, fetch)
+
+        with self._lock:
+            self._entries[ip] = (topology, active_ip)
+        return active_ip
+
+    def invalidate(self, ip):
+        with self._lock:
+            self._entries.pop(ip, None)
+
+
+def _resolve_active_ip(ip, topology, fetch):
+    active = topology.active_device
+    if active:
+        if active.self_device:
+            return ip
+        log.warn("Device {0} is not the active unit, using {1}".format(
+            ip, active.management_ip))
+        return active.management_ip
+
+    # failover states are unknown or inconsistent,
+    # ask every device for its own state
+    peers = [dev.management_ip for dev in topology.devices
+             if dev.management_ip]
+    if not peers:
+        raise BigipSyncException("Cannot find an active device")
+
+    # only needed on this rare path, kept out of the import of the module
+    from multiprocessing.pool import ThreadPool
+
+    pool = ThreadPool(len(peers))
+    try:
+        states = pool.map(lambda peer: _probe(peer, fetch), peers)
+    finally:
+        pool.close()
+        pool.join()
+
+    active_peers = [peer for peer, state in zip(peers, states)
+                    if state == STATE_ACTIVE]
+    if len(active_peers) != 1:
+        raise BigipSyncException("Cannot find an active device")
+    return active_peers[0]
+
+
+def _probe(ip, fetch):
+    try:
+        self_device = ClusterTopology.parse(fetch(ip)).self_device
+        return self_device.failover_state if self_device else None
+    except Exception as e:
+        log.warn("Cannot get failover state of {0}: {1}".format(ip, e))
+        return None